@@ -8,12 +8,18 @@ import sys
 import subprocess
 from lxml import etree
 from functools import wraps
-from flask import url_for, make_response
+from flask import (
+    Response,
+    make_response,
+    stream_with_context,
+    url_for,
+)
 from flask_babel import lazy_gettext as _
 from util.flask_util import problem
 from util.problem_detail import ProblemDetail
 import traceback
 import logging
+import zlib
 from opds import (
     AcquisitionFeed,
     LookupAcquisitionFeed,
@@ -28,6 +34,7 @@ from sqlalchemy.orm.exc import (
 )
 from model import (
     get_one,
+    CachedFeed,
     Complaint,
     Identifier,
     Patron,
@@ -61,35 +68,153 @@ def load_lending_policy(policy):
                         audience)
     return policy
 
-def feed_response(feed, acquisition=True, cache_for=AcquisitionFeed.FEED_CACHE_TIME):
+def feed_response(feed, acquisition=True, cache_for=AcquisitionFeed.FEED_CACHE_TIME,
+                  stream=False):
+    """Turn a feed into a Flask response.
+
+    :param stream: If this is True and `feed` is an AcquisitionFeed,
+    the feed is sent out a piece at a time as it's generated, and
+    compressed on the fly if the client can handle it.
+    """
     if acquisition:
         content_type = OPDSFeed.ACQUISITION_FEED_TYPE
     else:
         content_type = OPDSFeed.NAVIGATION_FEED_TYPE
+    if stream and isinstance(feed, AcquisitionFeed):
+        return _make_streaming_response(feed, content_type, cache_for)
     return _make_response(feed, content_type, cache_for)
 
-def entry_response(entry, cache_for=AcquisitionFeed.FEED_CACHE_TIME):
-    content_type = OPDSFeed.ENTRY_TYPE
-    return _make_response(entry, content_type, cache_for)
+def entry_response(entry, cache_for=AcquisitionFeed.FEED_CACHE_TIME,
+                   last_modified=None):
+    """Turn an OPDS entry into a Flask response.
 
-def _make_response(content, content_type, cache_for):
-    if isinstance(content, etree._Element):
-        content = etree.tostring(content)
-    elif not isinstance(content, basestring):
-        content = unicode(content)
+    :param last_modified: When the entry last changed, typically
+    the Work's last_update_time.
+    """
+    content_type = OPDSFeed.ENTRY_TYPE
+    return _make_response(
+        entry, content_type, cache_for, last_modified=last_modified
+    )
 
+def _cache_control(cache_for):
     if isinstance(cache_for, int):
         # A CDN should hold on to the cached representation only half
         # as long as the end-user.
         client_cache = cache_for
         cdn_cache = cache_for / 2
-        cache_control = "public, no-transform, max-age: %d, s-maxage: %d" % (
+        return "public, no-transform, max-age: %d, s-maxage: %d" % (
             client_cache, cdn_cache)
-    else:
-        cache_control = "private, no-cache"
+    return "private, no-cache"
+
+def _make_response(content, content_type, cache_for, etag=None,
+                   last_modified=None):
+    headers = {"Content-Type": content_type,
+               "Cache-Control": _cache_control(cache_for)}
+
+    if isinstance(content, CachedFeed):
+        cached = content
+        etag = etag or cached.etag
+        last_modified = last_modified or cached.last_modified
+
+        # A compressed feed can be sent as-is to a client that
+        # understands its content-coding. Other clients get it
+        # decompressed.
+        encoding = cached.content_encoding
+        send_compressed = (
+            encoding and encoding in flask.request.accept_encodings
+        )
+        if encoding:
+            headers['Vary'] = 'Accept-Encoding'
+        if send_compressed:
+            headers['Content-Encoding'] = encoding
+            if etag:
+                # The compressed document is a different
+                # representation, so it needs a different ETag.
+                etag = "%s-%s" % (etag, encoding)
+
+        # A CachedFeed knows its ETag and modification time without
+        # loading its content, so a client that already has this
+        # version of the feed can be told so right away.
+        if _not_modified(etag, last_modified):
+            return _not_modified_response(headers, etag, last_modified)
+
+        if send_compressed:
+            # The database driver may give us a buffer rather than
+            # a bytestring.
+            content = str(cached.compressed_content)
+        else:
+            content = cached.content
 
-    return make_response(content, 200, {"Content-Type": content_type,
-                                        "Cache-Control": cache_control})
+    if isinstance(content, etree._Element):
+        content = etree.tostring(content)
+    elif not isinstance(content, basestring):
+        content = unicode(content)
+
+    etag = etag or CachedFeed.hash_for(content)
+    if _not_modified(etag, last_modified):
+        return _not_modified_response(headers, etag, last_modified)
+
+    response = make_response(content, 200, headers)
+    _set_validators(response, etag, last_modified)
+    return response
+
+def _not_modified(etag, last_modified):
+    """Does the client already have the version of a document with the
+    given ETag and modification time?
+    """
+    request = flask.request
+    if request.if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since.
+        return bool(etag) and request.if_none_match.contains(etag)
+    if last_modified and request.if_modified_since:
+        # HTTP dates don't go below the second.
+        last_modified = last_modified.replace(microsecond=0)
+        return last_modified <= request.if_modified_since
+    return False
+
+def _set_validators(response, etag, last_modified):
+    if etag:
+        response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+
+def _not_modified_response(headers, etag, last_modified):
+    response = make_response("", 304, headers)
+    _set_validators(response, etag, last_modified)
+    return response
+
+def _make_streaming_response(feed, content_type, cache_for):
+    """Send an AcquisitionFeed with chunked transfer encoding.
+
+    The first bytes go out as soon as the feed-level tags have been
+    serialized, and the body is never held in memory all at once.
+    """
+    headers = {
+        "Content-Type": content_type,
+        "Cache-Control": _cache_control(cache_for),
+        "Vary": "Accept-Encoding",
+    }
+    chunks = feed.iter_chunks()
+    if 'gzip' in flask.request.accept_encodings:
+        headers['Content-Encoding'] = 'gzip'
+        chunks = gzip_chunks(chunks)
+    return Response(stream_with_context(chunks), 200, headers)
+
+def gzip_chunks(chunks, level=6):
+    """Compress a series of bytestrings into a gzip stream.
+
+    Each chunk is flushed as soon as it's compressed, so the client
+    starts receiving data right away.
+    """
+    # A wbits value of 16+MAX_WBITS makes zlib write a gzip header
+    # and trailer.
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        data += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
 
 def load_facets_from_request(config=Configuration):
     """Figure out which Facets object this request is asking for."""
@@ -270,8 +395,9 @@ class URNLookupController(object):
         opds_feed = LookupAcquisitionFeed(
             self._db, "Lookup results", this_url, self.works, annotator,
             precomposed_entries=self.precomposed_entries,
+            stream_entries=True
         )
-        return feed_response(opds_feed)
+        return feed_response(opds_feed, stream=True)
 
     def permalink(self, urn, annotator, route_name='work'):
         """Look up a single identifier and generate an OPDS feed."""
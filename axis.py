@@ -18,6 +18,7 @@ from util.http import (
     HTTP,
     RemoteIntegrationException,
 )
+from util.rate_limit import AdaptiveRateLimiter
 from coverage import CoverageFailure
 from model import (
     get_one_or_create,
@@ -82,6 +83,10 @@ class Axis360API(object):
             base_url = self.SERVER_NICKNAMES[base_url]
         self.base_url = base_url
 
+        self.rate_limiter = AdaptiveRateLimiter.for_integration(
+            DataSource.AXIS_360, self.library_id
+        )
+
         if (not self.library_id or not self.username
             or not self.password):
             raise CannotLoadConfiguration(
@@ -195,7 +200,8 @@ class Axis360API(object):
     def _make_request(self, url, method, headers, data=None, params=None, 
                       **kwargs):
         """Actually make an HTTP request."""
-        return HTTP.request_with_timeout(
+        return self.rate_limiter.call(
+            HTTP.request_with_timeout,
             method, url, headers=headers, data=data,
             params=params, **kwargs
         )
@@ -352,8 +358,13 @@ class BibliographicParser(Axis360Parser):
         self.include_bibliographic = include_bibliographic
 
     def process_all(self, string):
-        for i in super(BibliographicParser, self).process_all(
-                string, "//axis:title", self.NS):
+        """Yield a (Metadata, CirculationData) 2-tuple for every title
+        in an availability response.
+
+        Responses can cover thousands of titles, so they are parsed
+        incrementally rather than being loaded into a tree.
+        """
+        for i in self.process_all_streaming(string, "axis:title", self.NS):
             yield i
 
     def extract_availability(self, circulation_data, element, ns):
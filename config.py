@@ -61,6 +61,11 @@ class Configuration(object):
 
     DATA_DIRECTORY = "data_directory"
 
+    # If this is set, the content of Representations is kept in a
+    # content-addressed store in this directory rather than in the
+    # database.
+    REPRESENTATION_CONTENT_STORE = "representation_content_store"
+
     # Policies, mostly circulation specific
     POLICIES = "policies"
 
@@ -103,6 +108,49 @@ class Configuration(object):
     GROUPS_MAX_AGE_POLICY = "default_groups_max_age"
     DEFAULT_GROUPS_MAX_AGE = CACHE_FOREVER
 
+    # How requests coordinate so that only one of them regenerates a
+    # given cached feed at a time: "process" coordinates the threads
+    # in one process, "postgres" uses advisory locks to coordinate
+    # every process that shares the database.
+    FEED_GENERATION_LOCK_POLICY = "feed_generation_lock"
+    FEED_GENERATION_LOCK_PROCESS = "process"
+    FEED_GENERATION_LOCK_POSTGRES = "postgres"
+
+    # Lane.search remembers which works matched a search: "memory"
+    # keeps the results in each process, "postgres" also shares them
+    # with every process that uses the database, and "off" turns the
+    # cache off.
+    SEARCH_RESULT_CACHE_POLICY = "search_result_cache"
+    SEARCH_RESULT_CACHE_MEMORY = "memory"
+    SEARCH_RESULT_CACHE_POSTGRES = "postgres"
+    SEARCH_RESULT_CACHE_OFF = "off"
+
+    # How many seconds a cached search result is good for.
+    SEARCH_RESULT_CACHE_TTL_POLICY = "search_result_cache_ttl"
+    DEFAULT_SEARCH_RESULT_CACHE_TTL = 600
+
+    # If set, Lane.search fetches search results in aligned windows of
+    # this many work IDs and serves the pages within a window from the
+    # search result cache. If unset, only the requested page is
+    # fetched.
+    SEARCH_WINDOW_SIZE_POLICY = "search_window_size"
+
+    # How changes to works reach the search index: "immediate" sends
+    # each change as it happens, "queue" records it in the
+    # searchindexchanges table for the SearchIndexUpdateMonitor to
+    # send in bulk.
+    SEARCH_INDEX_UPDATE_POLICY = "search_index_update"
+    SEARCH_INDEX_UPDATE_IMMEDIATE = "immediate"
+    SEARCH_INDEX_UPDATE_QUEUE = "queue"
+
+    # Cached feeds are stored compressed with this HTTP content-coding.
+    CACHED_FEED_ENCODING_POLICY = "cached_feed_encoding"
+    DEFAULT_CACHED_FEED_ENCODING = "gzip"
+
+    # ...at this compression level. If unset, the encoding's default
+    # level is used (see util.compression.DEFAULT_LEVELS).
+    CACHED_FEED_COMPRESSION_LEVEL_POLICY = "cached_feed_compression_level"
+
     # Loan policies
     DEFAULT_LOAN_PERIOD = "default_loan_period"
     DEFAULT_RESERVATION_PERIOD = "default_reservation_period"
@@ -236,6 +284,10 @@ class Configuration(object):
     def data_directory(cls):
         return cls.get(cls.DATA_DIRECTORY)
 
+    @classmethod
+    def representation_content_store_directory(cls):
+        return cls.get(cls.REPRESENTATION_CONTENT_STORE)
+
     @classmethod
     def terms_of_service_url(cls):
         return cls.link(cls.TERMS_OF_SERVICE)
@@ -294,6 +346,48 @@ class Configuration(object):
             return value
         return datetime.timedelta(seconds=int(value))
 
+    @classmethod
+    def feed_generation_lock(cls):
+        return cls.policy(
+            cls.FEED_GENERATION_LOCK_POLICY, cls.FEED_GENERATION_LOCK_PROCESS
+        )
+
+    @classmethod
+    def search_result_cache(cls):
+        return cls.policy(
+            cls.SEARCH_RESULT_CACHE_POLICY, cls.SEARCH_RESULT_CACHE_MEMORY
+        )
+
+    @classmethod
+    def search_result_cache_ttl(cls):
+        return int(cls.policy(
+            cls.SEARCH_RESULT_CACHE_TTL_POLICY,
+            cls.DEFAULT_SEARCH_RESULT_CACHE_TTL
+        ))
+
+    @classmethod
+    def search_window_size(cls):
+        size = cls.policy(cls.SEARCH_WINDOW_SIZE_POLICY, None)
+        if size is None:
+            return None
+        return int(size)
+
+    @classmethod
+    def search_index_update(cls):
+        return cls.policy(
+            cls.SEARCH_INDEX_UPDATE_POLICY, cls.SEARCH_INDEX_UPDATE_IMMEDIATE
+        )
+
+    @classmethod
+    def cached_feed_encoding(cls):
+        return cls.policy(
+            cls.CACHED_FEED_ENCODING_POLICY, cls.DEFAULT_CACHED_FEED_ENCODING
+        )
+
+    @classmethod
+    def cached_feed_compression_level(cls):
+        return cls.policy(cls.CACHED_FEED_COMPRESSION_LEVEL_POLICY, None)
+
     @classmethod
     def base_opds_authentication_document(cls):
         return cls.get(cls.BASE_OPDS_AUTHENTICATION_DOCUMENT, {})
@@ -18,6 +18,7 @@ from util.http import (
     HTTP,
     RemoteIntegrationException,
 )
+from util.rate_limit import AdaptiveRateLimiter
 from coverage import CoverageFailure
 from model import (
     get_one_or_create,
@@ -71,6 +72,9 @@ class EnkiAPI(object):
         elif self.base_url == 'production':
             self.base_url = self.PRODUCTION_BASE_URL
         self.token = "mock_token"
+        self.rate_limiter = AdaptiveRateLimiter.for_integration(
+            DataSource.ENKI, self.library_id
+        )
 
     @classmethod
     def environment_values(cls):
@@ -182,7 +186,8 @@ class EnkiAPI(object):
     def _make_request(self, url, method, headers, data=None, params=None,
                       **kwargs):
         """Actually make an HTTP request."""
-        return HTTP.request_with_timeout(
+        return self.rate_limiter.call(
+            HTTP.request_with_timeout,
             method, url, headers=headers, data=data,
             params=params, **kwargs
         )
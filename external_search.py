@@ -1,17 +1,22 @@
 from nose.tools import set_trace
 from elasticsearch import Elasticsearch
 from elasticsearch.helpers import bulk as elasticsearch_bulk
+from elasticsearch.exceptions import ConnectionError
 from config import Configuration
 from classifier import (
     KeywordBasedClassifier,
     GradeLevelClassifier,
     AgeClassifier,
 )
+import datetime
+import hashlib
 import os
 import logging
 import re
 import time
 
+from util.cache import LRUCache
+
 class ExternalSearchIndex(object):
     
     work_document_type = 'work-type'
@@ -63,6 +68,7 @@ class ExternalSearchIndex(object):
             )
         self.indices = self.__client.indices
         self.search = self.__client.search
+        self.msearch = self.__client.msearch
         self.index = self.__client.index
         self.delete = self.__client.delete
         self.exists = self.__client.exists
@@ -123,6 +129,7 @@ class ExternalSearchIndex(object):
 
         def _set_works_alias(name):
             self.works_alias = self.__client.works_alias = name
+            SearchResultCache.index_changed()
 
         if exists:
             exists_on_works_index = self.indices.exists_alias(
@@ -200,6 +207,23 @@ class ExternalSearchIndex(object):
 
         self.works_alias = self.__client.works_alias = alias_name
 
+    def current_index(self):
+        """Find the index that searches of the works alias actually run
+        against.
+
+        Another process may have moved the alias since this client
+        was set up, so this asks Elasticsearch.
+        """
+        if not self.works_alias:
+            return None
+        index_details = self.indices.get_alias(
+            name=self.works_alias, ignore=[404]
+        )
+        if index_details.get('status')==404 or 'error' in index_details:
+            # The client is using an index directly rather than an alias.
+            return self.works_alias
+        return sorted(index_details.keys())[0]
+
     def base_index_name(self, index_or_alias):
         """Removes version or current suffix from base index name"""
 
@@ -214,20 +238,13 @@ class ExternalSearchIndex(object):
         if not self.works_alias:
             return []
 
-        filter = self.make_filter(
-            media, languages, exclude_languages, fiction, audience,
-            age_range, in_any_of_these_genres
+        body = self.make_search_body(
+            query_string, media, languages, exclude_languages, fiction,
+            audience, age_range, in_any_of_these_genres
         )
-        q = dict(
-            filtered=dict(
-                query=self.make_query(query_string),
-                filter=filter,
-            ),
-        )
-        body = dict(query=q)
         search_args = dict(
             index=self.works_alias,
-            body=dict(query=q),
+            body=body,
             from_=offset,
             size=size,
         )
@@ -238,6 +255,67 @@ class ExternalSearchIndex(object):
         #print "Results: %r" % results
         return results
 
+    def query_works_multi(self, queries, fields=None):
+        """Run several searches in one round trip to Elasticsearch.
+
+        :param queries: A list of (query_string, media, languages,
+            exclude_languages, fiction, audience, age_range,
+            in_any_of_these_genres, size, offset) tuples, the
+            arguments to query_works.
+
+        :return: A list with the results of each search, in the same
+            order, as query_works would return them. A search that
+            failed is represented by None.
+        """
+        if not self.works_alias:
+            return [[] for query in queries]
+        if not queries:
+            return []
+
+        body = []
+        for query in queries:
+            (query_string, media, languages, exclude_languages, fiction,
+             audience, age_range, in_any_of_these_genres, size,
+             offset) = query
+            search_body = self.make_search_body(
+                query_string, media, languages, exclude_languages,
+                fiction, audience, age_range, in_any_of_these_genres
+            )
+            search_body['from'] = offset
+            search_body['size'] = size
+            if fields is not None:
+                search_body['fields'] = fields
+            body.append(dict(index=self.works_alias))
+            body.append(search_body)
+
+        results = []
+        for query, response in zip(queries, self.msearch(body=body)['responses']):
+            if 'error' in response:
+                self.log.error(
+                    "Search for %r failed: %r", query[0], response['error']
+                )
+                response = None
+            results.append(response)
+        return results
+
+    def make_search_body(self, query_string, media, languages,
+                         exclude_languages, fiction, audience, age_range,
+                         in_any_of_these_genres=[]):
+        """The body of an Elasticsearch request for works that match a
+        query string and fit a lane's filters.
+        """
+        filter = self.make_filter(
+            media, languages, exclude_languages, fiction, audience,
+            age_range, in_any_of_these_genres
+        )
+        q = dict(
+            filtered=dict(
+                query=self.make_query(query_string),
+                filter=filter,
+            ),
+        )
+        return dict(query=q)
+
     def make_query(self, query_string):
 
         def make_query_string_query(query_string, fields):
@@ -327,29 +405,7 @@ class ExternalSearchIndex(object):
             'imprint'
         ]
 
-        # These words will fuzzy match other common words that aren't relevant,
-        # so if they're present and correctly spelled we shouldn't use a
-        # fuzzy query.
-        fuzzy_blacklist = [
-            "baseball", "basketball", # These fuzzy match each other
-
-            "soccer", # Fuzzy matches "saucer", "docker", "sorcery"
-
-            "football", "softball", "software", "postwar",
-
-            "hamlet", "harlem", "amulet", "tablet",
-
-            "biology", "ecology", "zoology", "geology",
-
-            "joke", "jokes" # "jake"
-
-            "cat", "cats",
-            "car", "cars",
-            "war", "wars",
-
-            "away", "stay",
-        ]
-        fuzzy_blacklist_re = re.compile(r'\b(%s)\b' % "|".join(fuzzy_blacklist), re.I)
+        parsed = ParsedQuery.parse(query_string)
 
         # Find results that match the full query string in one of the main
         # fields.
@@ -362,81 +418,43 @@ class ExternalSearchIndex(object):
         match_phrase = make_phrase_query(query_string, ['title.minimal', 'author', 'series.minimal'])
         must_match_options.append(match_phrase)
 
-        if not fuzzy_blacklist_re.search(query_string):
+        if parsed.fuzzy:
             fuzzy_query = make_fuzzy_query(query_string, fuzzy_fields)
             must_match_options.append(fuzzy_query)
 
         # If fiction or genre is in the query, results can match the fiction or 
         # genre value and the remaining words in the query string, instead of the
         # full query.
-
-        fiction = None
-        if re.compile(r"\bnonfiction\b", re.IGNORECASE).search(query_string):
-            fiction = "Nonfiction"
-        elif re.compile(r"\bfiction\b", re.IGNORECASE).search(query_string):
-            fiction = "Fiction"
-        
-        # Get the genre and the words in the query that matched it, if any
-        genre, genre_match = KeywordBasedClassifier.genre_match(query_string)
-
-        # Get the audience and the words in the query that matched it, if any
-        audience, audience_match = KeywordBasedClassifier.audience_match(query_string)
-
-        # Get the grade level and the words in the query that matched it, if any
-        age_from_grade, grade_match = GradeLevelClassifier.target_age_match(query_string)
-        if age_from_grade and age_from_grade[0] == None:
-            age_from_grade = None
-
-        # Get the age range and the words in the query that matched it, if any
-        age, age_match = AgeClassifier.target_age_match(query_string)
-        if age and age[0] == None:
-            age = None
-
-        if fiction or genre or audience or age_from_grade or age:
-            remaining_string = query_string
+        if parsed.classified:
             classification_queries = []
 
-            def without_match(original_string, match):
-                # If the match was "children" and the query string was "children's",
-                # we want to remove the "'s" as well as the match. We want to remove
-                # everything up to the next word boundary that's not an apostrophe
-                # or a dash.
-                word_boundary_pattern = r"\b%s[\w'\-]*\b"
-
-                return re.compile(word_boundary_pattern % match.strip(), re.IGNORECASE).sub("", original_string)
-
-            if genre:
-                match_genre = make_match_query(genre.name, 'genres.name')
+            if parsed.genre:
+                match_genre = make_match_query(parsed.genre.name, 'genres.name')
                 classification_queries.append(match_genre)
-                remaining_string = without_match(remaining_string, genre_match)
 
-            if audience:
-                match_audience = make_match_query(audience.replace(" ", ""), 'audience')
+            if parsed.audience:
+                match_audience = make_match_query(parsed.audience.replace(" ", ""), 'audience')
                 classification_queries.append(match_audience)
-                remaining_string = without_match(remaining_string, audience_match)
 
-            if fiction:
-                match_fiction = make_match_query(fiction, 'fiction')
+            if parsed.fiction:
+                match_fiction = make_match_query(parsed.fiction, 'fiction')
                 classification_queries.append(match_fiction)
-                remaining_string = without_match(remaining_string, fiction)
 
-            if age_from_grade:
-                match_age_from_grade = make_target_age_query(age_from_grade)
+            if parsed.age_from_grade:
+                match_age_from_grade = make_target_age_query(parsed.age_from_grade)
                 classification_queries.append(match_age_from_grade)
-                remaining_string = without_match(remaining_string, grade_match)
 
-            if age:
-                match_age = make_target_age_query(age)
+            if parsed.age:
+                match_age = make_target_age_query(parsed.age)
                 classification_queries.append(match_age)
-                remaining_string = without_match(remaining_string, age_match)
 
-            if len(remaining_string.strip()) > 0:
+            if len(parsed.remaining_string.strip()) > 0:
                 # Someone who searches by genre is probably not looking for a specific book,
                 # but they might be looking for an author (eg, "science fiction iain banks").
                 # However, it's possible that they're searching for a subject that's not
                 # mentioned in the summary (eg, a person's name in a biography). So title
                 # is a possible match, but is less important than author, subtitle, and summary.
-                match_rest_of_query = make_query_string_query(remaining_string, ["author^4", "subtitle^3", "summary^5", "title^1", "series^1"])
+                match_rest_of_query = make_query_string_query(parsed.remaining_string, ["author^4", "subtitle^3", "summary^5", "title^1", "series^1"])
                 classification_queries.append(match_rest_of_query)
             
             # If classification queries and the remaining string all match, the result will
@@ -529,6 +547,10 @@ class ExternalSearchIndex(object):
         else:
             return {}
 
+    # The failure message bulk_update gives for a presentation-ready
+    # work that has no search document.
+    NO_DOCUMENT = "Work not indexed"
+
     def bulk_update(self, works, retry_on_batch_failure=True):
         """Upload a batch of works to the search index at once."""
 
@@ -574,9 +596,9 @@ class ExternalSearchIndex(object):
         failures = []
         for missing in missing_works:
             if not missing.presentation_ready:
-                failures.append((work, "Work not indexed because not presentation-ready."))
+                failures.append((missing, "Work not indexed because not presentation-ready."))
             else:
-                failures.append((work, "Work not indexed"))
+                failures.append((missing, self.NO_DOCUMENT))
 
         for error in errors:
             error_id = error.get('data', {}).get('_id', None) or error.get('index', {}).get('_id', None)
@@ -690,6 +712,341 @@ class ExternalSearchIndexVersions(object):
             return True
 
 
+class ParsedQuery(object):
+    """What a search query string seems to be asking for: a genre, an
+    audience, fiction or nonfiction, an age range, and whatever text is
+    left over once those are taken out.
+
+    Working this out runs hundreds of keyword regexes against the
+    query, and the same queries come in over and over, so parsed
+    queries are kept in an LRU cache.
+    """
+
+    # How many parsed queries to keep in memory.
+    MEMORY_SIZE = 10000
+
+    # These words will fuzzy match other common words that aren't relevant,
+    # so if they're present and correctly spelled we shouldn't use a
+    # fuzzy query.
+    FUZZY_BLACKLIST = [
+        "baseball", "basketball", # These fuzzy match each other
+
+        "soccer", # Fuzzy matches "saucer", "docker", "sorcery"
+
+        "football", "softball", "software", "postwar",
+
+        "hamlet", "harlem", "amulet", "tablet",
+
+        "biology", "ecology", "zoology", "geology",
+
+        "joke", "jokes" # "jake"
+
+        "cat", "cats",
+        "car", "cars",
+        "war", "wars",
+
+        "away", "stay",
+    ]
+    FUZZY_BLACKLIST_RE = re.compile(
+        r'\b(%s)\b' % "|".join(FUZZY_BLACKLIST), re.I
+    )
+
+    NONFICTION_RE = re.compile(r"\bnonfiction\b", re.IGNORECASE)
+    FICTION_RE = re.compile(r"\bfiction\b", re.IGNORECASE)
+
+    _parsed = LRUCache(MEMORY_SIZE)
+
+    @classmethod
+    def parse(cls, query_string):
+        """Parse a query string, or find the results of parsing it
+        last time.
+
+        A ParsedQuery is shared between everyone who searches for the
+        same thing, so don't modify it.
+        """
+        parsed = cls._parsed.get(query_string)
+        if parsed is None:
+            parsed = cls(query_string)
+            cls._parsed.set(query_string, parsed)
+        return parsed
+
+    def __init__(self, query_string):
+        self.query_string = query_string
+
+        # Don't use a fuzzy query if the query contains a word that
+        # will fuzzy match irrelevant words.
+        self.fuzzy = not self.FUZZY_BLACKLIST_RE.search(query_string)
+
+        self.fiction = None
+        if self.NONFICTION_RE.search(query_string):
+            self.fiction = "Nonfiction"
+        elif self.FICTION_RE.search(query_string):
+            self.fiction = "Fiction"
+
+        # Get the genre and the words in the query that matched it, if any
+        self.genre, genre_match = KeywordBasedClassifier.genre_match(query_string)
+
+        # Get the audience and the words in the query that matched it, if any
+        self.audience, audience_match = KeywordBasedClassifier.audience_match(query_string)
+
+        # Get the grade level and the words in the query that matched it, if any
+        self.age_from_grade, grade_match = GradeLevelClassifier.target_age_match(query_string)
+        if self.age_from_grade and self.age_from_grade[0] == None:
+            self.age_from_grade = None
+
+        # Get the age range and the words in the query that matched it, if any
+        self.age, age_match = AgeClassifier.target_age_match(query_string)
+        if self.age and self.age[0] == None:
+            self.age = None
+
+        # The query string, minus the words that told us about the
+        # classification.
+        remaining_string = query_string
+        if self.genre:
+            remaining_string = self.without_match(remaining_string, genre_match)
+        if self.audience:
+            remaining_string = self.without_match(remaining_string, audience_match)
+        if self.fiction:
+            remaining_string = self.without_match(remaining_string, self.fiction)
+        if self.age_from_grade:
+            remaining_string = self.without_match(remaining_string, grade_match)
+        if self.age:
+            remaining_string = self.without_match(remaining_string, age_match)
+        self.remaining_string = remaining_string
+
+    @property
+    def classified(self):
+        """Did the query say anything about how the books it's looking
+        for are classified?
+        """
+        return bool(
+            self.fiction or self.genre or self.audience
+            or self.age_from_grade or self.age
+        )
+
+    @classmethod
+    def without_match(cls, original_string, match):
+        # If the match was "children" and the query string was "children's",
+        # we want to remove the "'s" as well as the match. We want to remove
+        # everything up to the next word boundary that's not an apostrophe
+        # or a dash.
+        word_boundary_pattern = r"\b%s[\w'\-]*\b"
+
+        return re.compile(word_boundary_pattern % match.strip(), re.IGNORECASE).sub("", original_string)
+
+
+class SearchResultCache(object):
+    """Remembers the IDs of the works that matched a search.
+
+    Popular searches are run over and over, and most of the time spent
+    on them goes to Elasticsearch. The results are keyed on the
+    normalized query, the filters of the lane being searched, the page
+    being requested, and the index the works alias points to, so
+    moving the alias to a new index makes every old result
+    unreachable.
+
+    Results are kept in an in-process LRU cache, and, if the
+    search_result_cache policy is "postgres", in the
+    cachedsearchresults table as well.
+    """
+
+    # How many search results to keep in memory.
+    MEMORY_SIZE = 5000
+
+    # How often to check whether the works alias has been moved to a
+    # different index, in seconds.
+    ALIAS_CHECK_INTERVAL = 60
+
+    # Log the hit rates after this many lookups.
+    REPORT_EVERY = 1000
+
+    log = logging.getLogger("Search result cache")
+
+    _memory = LRUCache(MEMORY_SIZE)
+    table_hits = 0
+    table_misses = 0
+
+    # The index the works alias pointed to when we last checked.
+    _index = None
+    _index_checked_at = None
+
+    @classmethod
+    def policy(cls):
+        if not Configuration.instance:
+            return Configuration.SEARCH_RESULT_CACHE_MEMORY
+        return Configuration.search_result_cache()
+
+    @classmethod
+    def ttl(cls):
+        if not Configuration.instance:
+            return Configuration.DEFAULT_SEARCH_RESULT_CACHE_TTL
+        return Configuration.search_result_cache_ttl()
+
+    @classmethod
+    def window_size(cls):
+        """How many search results to fetch and cache at a time.
+
+        :return: A number, or None to fetch only the requested page.
+        """
+        if (not Configuration.instance
+            or cls.policy() == Configuration.SEARCH_RESULT_CACHE_OFF):
+            # Nothing would remember the rest of the window.
+            return None
+        return Configuration.search_window_size()
+
+    @classmethod
+    def normalize_query(cls, query_string):
+        """Searches are case-insensitive and don't care about extra
+        whitespace, so neither does the cache.
+        """
+        query_string = query_string or u""
+        if isinstance(query_string, str):
+            query_string = query_string.decode("utf8")
+        return u" ".join(query_string.lower().split())
+
+    @classmethod
+    def key(cls, search_client, query_string, media, languages,
+            exclude_languages, fiction, audiences, age_range, genre_ids,
+            size, offset):
+        """Build the key for a search.
+
+        :return: A tuple, or None if the search shouldn't be cached.
+        """
+        if cls.policy() == Configuration.SEARCH_RESULT_CACHE_OFF:
+            return None
+        index = cls.current_index(search_client)
+        if not index:
+            return None
+
+        def normalize_list(values):
+            if values is None:
+                return None
+            return tuple(sorted(values))
+
+        if age_range is not None:
+            age_range = tuple(age_range)
+        return (
+            index, cls.normalize_query(query_string), normalize_list(media),
+            normalize_list(languages), normalize_list(exclude_languages),
+            fiction, normalize_list(audiences), age_range,
+            normalize_list(genre_ids), size, offset,
+        )
+
+    @classmethod
+    def current_index(cls, search_client):
+        """The index the works alias points to, checked at most once
+        every ALIAS_CHECK_INTERVAL seconds.
+        """
+        now = time.time()
+        if (cls._index_checked_at is None
+            or now - cls._index_checked_at > cls.ALIAS_CHECK_INTERVAL):
+            try:
+                index = search_client.current_index()
+            except ConnectionError, e:
+                return None
+            if cls._index and index != cls._index:
+                cls.log.info(
+                    "Works alias moved from %s to %s; cached search "
+                    "results are no longer valid.", cls._index, index
+                )
+            cls._index = index
+            cls._index_checked_at = now
+        return cls._index
+
+    @classmethod
+    def index_changed(cls):
+        """The works alias was just moved. Check where it points before
+        the next lookup.
+        """
+        cls._index_checked_at = None
+
+    @classmethod
+    def table_key(cls, key):
+        return unicode(hashlib.md5(repr(key)).hexdigest())
+
+    @classmethod
+    def lookup(cls, _db, key):
+        """Find the works that matched a search last time.
+
+        :return: A list of work IDs, or None if the search needs to
+            be run.
+        """
+        if key is None:
+            return None
+        work_ids = cls._memory.get(key)
+        if (work_ids is None and
+            cls.policy() == Configuration.SEARCH_RESULT_CACHE_POSTGRES):
+            from model import CachedSearchResult
+            cached = CachedSearchResult.lookup(_db, cls.table_key(key))
+            if cached:
+                cls.table_hits += 1
+                work_ids = list(cached.work_ids)
+                expires_in = cached.expires - datetime.datetime.utcnow()
+                cls._memory.set(
+                    key, work_ids,
+                    max(expires_in.days * 86400 + expires_in.seconds, 0)
+                )
+            else:
+                cls.table_misses += 1
+        cls._maybe_report()
+        return work_ids
+
+    @classmethod
+    def remember(cls, _db, key, work_ids):
+        """Record the works that matched a search, in order."""
+        if key is None:
+            return
+        work_ids = list(work_ids)
+        ttl = cls.ttl()
+        cls._memory.set(key, work_ids, ttl)
+        if cls.policy() == Configuration.SEARCH_RESULT_CACHE_POSTGRES:
+            from model import CachedSearchResult
+            CachedSearchResult.remember(
+                _db, cls.table_key(key), work_ids,
+                datetime.timedelta(seconds=ttl)
+            )
+
+    @classmethod
+    def stats(cls):
+        """How well is the cache working?
+
+        :return: A dictionary. `hit_rate` is the fraction of lookups
+            that didn't need to go to Elasticsearch.
+        """
+        memory_hits = cls._memory.hits
+        lookups = memory_hits + cls._memory.misses
+        hits = memory_hits + cls.table_hits
+        hit_rate = 0.0
+        if lookups:
+            hit_rate = hits / float(lookups)
+        return dict(
+            lookups=lookups,
+            memory_hits=memory_hits,
+            table_hits=cls.table_hits,
+            misses=lookups - hits,
+            hit_rate=hit_rate,
+        )
+
+    @classmethod
+    def _maybe_report(cls):
+        stats = cls.stats()
+        if stats['lookups'] % cls.REPORT_EVERY == 0:
+            cls.log.info(
+                "%(lookups)d lookups: %(memory_hits)d in memory, "
+                "%(table_hits)d in the database, %(misses)d misses "
+                "(hit rate %(hit_rate).2f)", stats
+            )
+
+    @classmethod
+    def reset(cls):
+        """Forget everything kept in memory, and the hit rates."""
+        cls._memory.clear()
+        cls.table_hits = 0
+        cls.table_misses = 0
+        cls._index = None
+        cls._index_checked_at = None
+
+
 class DummyExternalSearchIndex(ExternalSearchIndex):
 
     work_document_type = 'work-type'
@@ -715,6 +1072,9 @@ class DummyExternalSearchIndex(ExternalSearchIndex):
     def exists(self, index, doc_type, id):
         return self._key(index, doc_type, id) in self.docs
 
+    def current_index(self):
+        return self.works_index
+
     def query_works(self, *args, **kwargs):
         doc_ids = sorted([dict(_id=key[2]) for key in self.docs.keys()])
         if 'offset' in kwargs and 'size' in kwargs:
@@ -723,7 +1083,16 @@ class DummyExternalSearchIndex(ExternalSearchIndex):
             doc_ids = doc_ids[offset: offset + size]
         return { "hits" : { "hits" : doc_ids }}
 
+    def query_works_multi(self, queries, fields=None):
+        return [
+            self.query_works(*query[:-2], size=query[-2], offset=query[-1])
+            for query in queries
+        ]
+
     def bulk(self, docs, **kwargs):
         for doc in docs:
-            self.index(doc['_index'], doc['_type'], doc['_id'], doc)
+            if doc.get('_op_type') == 'delete':
+                self.delete(doc['_index'], doc['_type'], doc['_id'])
+            else:
+                self.index(doc['_index'], doc['_type'], doc['_id'], doc)
         return len(docs), []
@@ -1,6 +1,8 @@
 from collections import defaultdict
 from nose.tools import set_trace
+import copy
 import datetime
+import json
 import logging
 import random
 import time
@@ -40,7 +42,9 @@ from model import (
 )
 from facets import FacetConstants
 from util import fast_query_count
+from util.cache import LRUCache
 import elasticsearch
+from external_search import SearchResultCache
 
 class Facets(FacetConstants):
 
@@ -492,6 +496,9 @@ class Lane(object):
         for lane in self.sublanes.lanes:
             lane.debug(level+1)
 
+    # Looked up when needed; see gutenberg_data_source_id.
+    _gutenberg_data_source_id = None
+
     def __init__(self, 
                  _db, 
                  full_name,
@@ -616,6 +623,34 @@ class Lane(object):
                 "children's or young adult books." % self.name
             )
 
+    @property
+    def gutenberg_data_source_id(self):
+        """The ID of the Project Gutenberg DataSource, looked up the
+        first time one of this lane's queries needs it.
+        """
+        if self._gutenberg_data_source_id is None:
+            self._gutenberg_data_source_id = DataSource.lookup(
+                self._db, DataSource.GUTENBERG
+            ).id
+        return self._gutenberg_data_source_id
+
+    def bind(self, _db, parent=None):
+        """Make a copy of this lane and its sublanes that uses a different
+        database session.
+
+        The copy shares the genres, lists and data sources that were
+        looked up when this lane was built, so making it doesn't touch
+        the database. Don't modify those shared values.
+        """
+        lane = copy.copy(self)
+        lane._db = _db
+        lane.parent = parent
+        featured_query = getattr(self, 'list_featured_works_query', None)
+        if featured_query is not None:
+            lane.list_featured_works_query = featured_query.with_session(_db)
+        lane.sublanes = self.sublanes.bind(_db, lane)
+        return lane
+
     def set_from_parent(self, field_name, value, default=None):
         if value is None:
             if self.parent:
@@ -1100,8 +1135,7 @@ class Lane(object):
             q = q.filter(work_model.audience.in_(self.audiences))
             if (Classifier.AUDIENCE_CHILDREN in self.audiences
                 or Classifier.AUDIENCE_YOUNG_ADULT in self.audiences):
-                    gutenberg = DataSource.lookup(
-                        self._db, DataSource.GUTENBERG)
+                    gutenberg_id = self.gutenberg_data_source_id
                     # TODO: A huge hack to exclude Project Gutenberg
                     # books (which were deemed appropriate for
                     # pre-1923 children but are not necessarily so for
@@ -1110,7 +1144,7 @@ class Lane(object):
                     # This hack should be removed in favor of a
                     # whitelist system and some way of allowing adults
                     # to see books aimed at pre-1923 children.
-                    q = q.filter(edition_model.data_source_id != gutenberg.id)
+                    q = q.filter(edition_model.data_source_id != gutenberg_id)
 
         if self.appeals:
             q = q.filter(work_model.primary_appeal.in_(self.appeals))
@@ -1255,77 +1289,177 @@ class Lane(object):
         )
         return self.parent.search_target
 
+    # The fields we need from the search index to find a search
+    # result in the database.
+    SEARCH_FIELDS = ["_id"]
+
     def search(self, query, search_client, pagination=None):
         """Find works in this lane that match a search query.
         """        
-           
+        [results] = self.search_lanes([self], query, search_client, pagination)
+        return results
+
+    @classmethod
+    def search_lanes(cls, lanes, query, search_client, pagination=None):
+        """Find works that match a search query in each of several lanes.
+
+        The searches that aren't already cached are sent to the search
+        index in a single request.
+
+        :return: A list containing a list of works for each lane.
+        """
         if not pagination:
             pagination = Pagination(offset=0, size=Pagination.DEFAULT_SEARCH_SIZE)
 
+        window_offset, window_size = cls._search_window(pagination)
+        searches = [
+            lane._search_arguments(query, window_size, window_offset)
+            for lane in lanes
+        ]
+        results = [None] * len(lanes)
+        if search_client:
+            doc_ids = [None] * len(lanes)
+            cache_keys = [None] * len(lanes)
+            to_run = []
+            for i, lane in enumerate(lanes):
+                if not searches[i]:
+                    continue
+                cache_keys[i] = SearchResultCache.key(
+                    search_client, *searches[i]
+                )
+                doc_ids[i] = SearchResultCache.lookup(lane._db, cache_keys[i])
+                if doc_ids[i] is None:
+                    to_run.append(i)
+
+            if to_run:
+                responses = cls._query_search_index(
+                    search_client, [searches[i] for i in to_run]
+                )
+                for i, docs in zip(to_run, responses):
+                    doc_ids[i] = []
+                    if docs:
+                        doc_ids[i] = [
+                            int(x['_id']) for x in docs['hits']['hits']
+                        ]
+                        SearchResultCache.remember(
+                            lanes[i]._db, cache_keys[i], doc_ids[i]
+                        )
+
+            start = pagination.offset - window_offset
+            for i, lane in enumerate(lanes):
+                page_ids = (doc_ids[i] or [])[start:start+pagination.size]
+                if page_ids:
+                    results[i] = lane._works_for_search_results(page_ids)
+
+        for i, lane in enumerate(lanes):
+            if not searches[i]:
+                # This lane is not searchable, and neither are any of its
+                # parents.
+                results[i] = []
+            elif not results[i]:
+                logging.debug("No elasticsearch results, falling back to database query")
+                results[i] = lane._search_database(query).limit(pagination.size).offset(pagination.offset).all()
+        return results
+
+    @classmethod
+    def _search_window(cls, pagination):
+        """Find the window of search results that contains a page.
+
+        Windows are aligned, so paging through the results of a search
+        only goes to the search index once per window.
+
+        :return: A 2-tuple (offset, size).
+        """
+        window = SearchResultCache.window_size()
+        if not window:
+            return pagination.offset, pagination.size
+        offset = (pagination.offset // window) * window
+        end = pagination.offset + pagination.size
+        size = ((end + window - 1) // window) * window - offset
+        return offset, size
+
+    def _search_arguments(self, query, size, offset):
+        """The arguments to ExternalSearchIndex.query_works that search
+        this lane.
+
+        :return: A tuple, or None if this lane can't be searched.
+        """
         search_lane = self.search_target
         if not search_lane:
-            # This lane is not searchable, and neither are any of its
-            # parents.
-            return []
+            return None
 
         if search_lane.fiction in (True, False):
             fiction = search_lane.fiction
         else:
             fiction = None
 
-        results = None
-        if search_client:
-            docs = None
-            a = time.time()
-            try:
-                docs = search_client.query_works(
-                    query, search_lane.media, search_lane.languages, search_lane.exclude_languages,
-                    fiction, list(search_lane.audiences), search_lane.age_range,
-                    search_lane.genre_ids,
-                    fields=["_id", "title", "author", "license_pool_id"],
-                    size=pagination.size,
-                    offset=pagination.offset,
-                )
-            except elasticsearch.exceptions.ConnectionError, e:
-                logging.error(
-                    "Could not connect to Elasticsearch; falling back to database search."
+        return (
+            query, search_lane.media, search_lane.languages,
+            search_lane.exclude_languages, fiction,
+            list(search_lane.audiences), search_lane.age_range,
+            search_lane.genre_ids, size, offset
+        )
+
+    @classmethod
+    def _query_search_index(cls, search_client, searches):
+        """Send searches to the search index.
+
+        :param searches: A list of tuples from _search_arguments.
+        :return: A list of search results, with None for each search
+            that couldn't be run.
+        """
+        a = time.time()
+        try:
+            if len(searches) == 1:
+                arguments = searches[0]
+                responses = [search_client.query_works(
+                    *arguments[:-2], fields=cls.SEARCH_FIELDS,
+                    size=arguments[-2], offset=arguments[-1]
+                )]
+            else:
+                responses = search_client.query_works_multi(
+                    searches, fields=cls.SEARCH_FIELDS
                 )
-            b = time.time()
-            logging.debug("Elasticsearch query completed in %.2fsec", b-a)
-            results = []
-            if docs:
-                doc_ids = [
-                    int(x['_id']) for x in docs['hits']['hits']
-                ]
-                if doc_ids:
-                    from model import MaterializedWork as mw
-                    q = self._db.query(mw).join(
-                        LicensePool, mw.license_pool_id==LicensePool.id
-                    ).filter(
-                        mw.works_id.in_(doc_ids)
-                    )
-                    q = q.options(
-                        lazyload(mw.license_pool, LicensePool.data_source),
-                        lazyload(mw.license_pool, LicensePool.identifier),
-                        lazyload(mw.license_pool, LicensePool.presentation_edition),
-                    )
-                    q = self.only_show_ready_deliverable_works(q, mw)
-                    q = self._defer_unused_opds_entry(q, work_model=mw)
-                    work_by_id = dict()
-                    a = time.time()
-                    works = q.all()
-                    for mw in works:
-                        work_by_id[mw.works_id] = mw
-                    results = [work_by_id[x] for x in doc_ids if x in work_by_id]
-                    b = time.time()
-                    logging.debug(
-                        "Obtained %d MaterializedWork objects in %.2fsec",
-                        len(results), b-a
-                    )
+        except elasticsearch.exceptions.ConnectionError, e:
+            logging.error(
+                "Could not connect to Elasticsearch; falling back to database search."
+            )
+            responses = [None] * len(searches)
+        b = time.time()
+        logging.debug(
+            "%d Elasticsearch queries completed in %.2fsec",
+            len(searches), b-a
+        )
+        return responses
 
-        if not results:
-            logging.debug("No elasticsearch results, falling back to database query")
-            results = self._search_database(query).limit(pagination.size).offset(pagination.offset).all()
+    def _works_for_search_results(self, doc_ids):
+        """Find the MaterializedWorks for search results, in the order
+        the search index returned them.
+        """
+        from model import MaterializedWork as mw
+        q = self._db.query(mw).join(
+            LicensePool, mw.license_pool_id==LicensePool.id
+        ).filter(
+            mw.works_id.in_(doc_ids)
+        )
+        q = q.options(
+            lazyload(mw.license_pool, LicensePool.data_source),
+            lazyload(mw.license_pool, LicensePool.identifier),
+            lazyload(mw.license_pool, LicensePool.presentation_edition),
+        )
+        q = self.only_show_ready_deliverable_works(q, mw)
+        q = self._defer_unused_opds_entry(q, work_model=mw)
+        work_by_id = dict()
+        a = time.time()
+        works = q.all()
+        for mw in works:
+            work_by_id[mw.works_id] = mw
+        results = [work_by_id[x] for x in doc_ids if x in work_by_id]
+        b = time.time()
+        logging.debug(
+            "Obtained %d MaterializedWork objects in %.2fsec",
+            len(results), b-a
+        )
         return results
 
     def _search_database(self, query):
@@ -1546,6 +1680,19 @@ class LaneList(object):
         self.lanes = []
         self.by_languages = defaultdict(dict)
 
+    def bind(self, _db, parent=None):
+        """Make a copy of this list, and all the lanes in it, that uses a
+        different database session.
+        """
+        bound = LaneList(parent)
+        def _add_recursively(l):
+            bound.add(l)
+            for sl in l.sublanes:
+                _add_recursively(sl)
+        for lane in self.lanes:
+            _add_recursively(lane.bind(_db, parent))
+        return bound
+
     def __len__(self):
         return len(self.lanes)
 
@@ -1648,6 +1795,55 @@ class QueryGeneratedLane(Lane):
         """
         raise NotImplementedError()
 
+class LaneTreeCache(object):
+    """Remembers the lane trees built from lane definitions.
+
+    Building a lane tree looks up every genre, custom list and data
+    source it mentions. Each process does that once for a given set
+    of definitions, and after that make_lanes hands out copies of the
+    tree bound to the caller's database session. Changing the
+    definitions in the configuration changes the key, so the tree is
+    rebuilt.
+    """
+
+    # How many different sets of lane definitions to remember.
+    MAX_SIZE = 10
+
+    _trees = LRUCache(MAX_SIZE)
+
+    @classmethod
+    def key(cls, definitions):
+        return json.dumps(definitions, sort_keys=True, default=repr)
+
+    @classmethod
+    def get(cls, _db, definitions):
+        """Find or build the lane tree for some lane definitions.
+
+        :return: A LaneList bound to `_db`.
+        """
+        key = cls.key(definitions)
+        tree = cls._trees.get(key)
+        if tree is None:
+            lanes = [Lane(_db=_db, **definition) for definition in definitions]
+            tree = LaneList.from_description(_db, None, lanes)
+            children = set([
+                Classifier.AUDIENCE_CHILDREN,
+                Classifier.AUDIENCE_YOUNG_ADULT
+            ])
+            for lanes in tree.by_languages.values():
+                for lane in lanes.values():
+                    if children.intersection(lane.audiences):
+                        # Look this up now rather than in every copy.
+                        lane.gutenberg_data_source_id
+            cls._trees.set(key, tree)
+        return tree.bind(_db)
+
+    @classmethod
+    def reset(cls):
+        """Forget every lane tree."""
+        cls._trees.clear()
+
+
 def make_lanes(_db, definitions=None):
 
     definitions = definitions or Configuration.policy(
@@ -1657,5 +1853,4 @@ def make_lanes(_db, definitions=None):
         # A lane arrangement is required for lane making.
         return None
 
-    lanes = [Lane(_db=_db, **definition) for definition in definitions]
-    return LaneList.from_description(_db, None, lanes)
+    return LaneTreeCache.get(_db, definitions)
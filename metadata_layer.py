@@ -11,20 +11,29 @@ from collections import defaultdict
 from sqlalchemy.orm.session import Session
 from nose.tools import set_trace
 from dateutil.parser import parse
-from sqlalchemy.sql.expression import and_, or_
+from sqlalchemy import inspect
+from sqlalchemy.sql.expression import and_, or_, tuple_
 from sqlalchemy.orm.exc import (
     NoResultFound,
 )
 from sqlalchemy.orm import aliased
+from sqlalchemy.orm.attributes import set_committed_value
 import csv
 import datetime
 import logging
+import traceback
 from util import LanguageCodes
 from util.median import median
+from util.cache import LRUCache
 from model import (
     get_one,
     get_one_or_create,
+    get_many,
+    get_many_or_create,
+    CachedSortName,
     CirculationEvent,
+    Classification,
+    Contribution,
     Contributor,
     CoverageRecord,
     DataSource,
@@ -39,6 +48,7 @@ from model import (
     PresentationCalculationPolicy,
     RightsStatus,
     Representation,
+    Resource,
     Work,
 )
 from classifier import NO_VALUE, NO_NUMBER
@@ -130,6 +140,8 @@ class ReplacementPolicy(object):
 
 
 class SubjectData(object):
+    __slots__ = ('type', 'identifier', 'name', 'weight')
+
     def __init__(self, type, identifier, name=None, weight=1):
         self.type = type
 
@@ -156,7 +168,126 @@ class SubjectData(object):
         )
 
 
+class SortNameCache(object):
+    """Remembers the sort names that go with display names.
+
+    The same prolific authors show up in import after import, and
+    without this, ContributorData.find_sort_name would search the
+    contributors table and then ask the metadata wrangler about every
+    one of them. Answers, including the absence of an answer, are kept
+    in an in-process LRU cache backed by the cachedsortnames table.
+    """
+
+    # How many display names to keep in memory.
+    MEMORY_SIZE = 10000
+
+    # A sort name that was found is unlikely to change.
+    POSITIVE_TTL = datetime.timedelta(days=30)
+
+    # A display name with no sort name gets looked up again sooner, in
+    # case the metadata wrangler has learned about it.
+    NEGATIVE_TTL = datetime.timedelta(days=1)
+
+    # Log the hit rates after this many lookups.
+    REPORT_EVERY = 1000
+
+    MISSING = object()
+
+    log = logging.getLogger("Sort name cache")
+
+    _memory = LRUCache(MEMORY_SIZE)
+    table_hits = 0
+    table_misses = 0
+
+    @classmethod
+    def lookup(cls, _db, display_name):
+        """Find the sort name previously worked out for a display name.
+
+        :return: A 2-tuple (found, sort_name). If `found` is True but
+            `sort_name` is None, we already know there is no sort name
+            to be found.
+        """
+        sort_name = cls._memory.get(display_name, cls.MISSING)
+        if sort_name is cls.MISSING:
+            cached = CachedSortName.lookup(_db, display_name)
+            if cached:
+                cls.table_hits += 1
+                ttl = None
+                if cached.expires:
+                    ttl = cls._seconds(
+                        cached.expires - datetime.datetime.utcnow()
+                    )
+                cls._memory.set(display_name, cached.sort_name, ttl)
+                sort_name = cached.sort_name
+            else:
+                cls.table_misses += 1
+        cls._maybe_report()
+        if sort_name is cls.MISSING:
+            return False, None
+        return True, sort_name
+
+    @classmethod
+    def remember(cls, _db, display_name, sort_name):
+        """Record the sort name that goes with a display name.
+
+        :param sort_name: The sort name, or None if none could be found.
+        """
+        if sort_name:
+            ttl = cls.POSITIVE_TTL
+        else:
+            ttl = cls.NEGATIVE_TTL
+        cls._memory.set(display_name, sort_name, cls._seconds(ttl))
+        CachedSortName.remember(_db, display_name, sort_name, ttl)
+
+    @classmethod
+    def stats(cls):
+        """How well is the cache working?
+
+        :return: A dictionary. `hit_rate` is the fraction of lookups
+            that didn't need the contributors table or the metadata
+            wrangler.
+        """
+        memory_hits = cls._memory.hits
+        lookups = memory_hits + cls.table_hits + cls.table_misses
+        hit_rate = 0.0
+        if lookups:
+            hit_rate = (memory_hits + cls.table_hits) / float(lookups)
+        return dict(
+            lookups=lookups,
+            memory_hits=memory_hits,
+            table_hits=cls.table_hits,
+            misses=cls.table_misses,
+            hit_rate=hit_rate,
+        )
+
+    @classmethod
+    def _maybe_report(cls):
+        stats = cls.stats()
+        if stats['lookups'] % cls.REPORT_EVERY == 0:
+            cls.log.info(
+                "%(lookups)d lookups: %(memory_hits)d in memory, "
+                "%(table_hits)d in the database, %(misses)d misses "
+                "(hit rate %(hit_rate).2f)", stats
+            )
+
+    @classmethod
+    def reset(cls):
+        """Forget everything kept in memory, and the hit rates."""
+        cls._memory.clear()
+        cls.table_hits = 0
+        cls.table_misses = 0
+
+    @classmethod
+    def _seconds(cls, delta):
+        return max(delta.days * 86400 + delta.seconds, 0)
+
+
 class ContributorData(object):
+    __slots__ = (
+        'sort_name', 'display_name', 'family_name', 'wikipedia_name',
+        'roles', 'lc', 'viaf', 'biography', 'aliases', 'extra',
+    )
+
     def __init__(self, sort_name=None, display_name=None,
                  family_name=None, wikipedia_name=None, roles=None,
                  lc=None, viaf=None, biography=None, aliases=None, extra=None):
@@ -282,18 +413,29 @@ class ContributorData(object):
                 "Cannot find sort name for a contributor with no display name!"
             )
 
+        # Have we worked out this display name's sort name before?
+        found, sort_name = SortNameCache.lookup(_db, self.display_name)
+        if found:
+            self.sort_name = sort_name
+            return (self.sort_name is not None)
+
         # Is there a contributor already in the database with this
         # exact sort name? If so, use their display name.
         sort_name = self.display_name_to_sort_name(_db, self.display_name)
         if sort_name:
+            SortNameCache.remember(_db, self.display_name, sort_name)
             self.sort_name = sort_name
             return True
 
         # Time to break out the big guns. Ask the metadata wrangler
         # if it can find a sort name for this display name.
-        sort_name = self.display_name_to_sort_name_through_canonicalizer(
+        sort_name, definitive = self._canonicalize(
             _db, identifiers, metadata_client
         )
+        if definitive:
+            # Don't remember a failure to find a sort name if it might
+            # have been caused by the metadata wrangler being down.
+            SortNameCache.remember(_db, self.display_name, sort_name)
         self.sort_name = sort_name
         return (self.sort_name is not None)
 
@@ -327,9 +469,16 @@ class ContributorData(object):
     def _display_name_to_sort_name(
             self, _db, metadata_client, identifier_obj
     ):
+        """Ask the canonicalizer for a sort name.
+
+        :return: A 2-tuple (sort_name, definitive). `definitive` is
+            False if the canonicalizer failed for some reason other
+            than not knowing the name.
+        """
         response = metadata_client.canonicalize_author_name(
             identifier_obj, self.display_name)
         sort_name = None
+        definitive = True
 
         if isinstance(response, basestring):
             sort_name = response
@@ -347,29 +496,47 @@ class ContributorData(object):
                     "Canonicalizer could not find sort name for %r/%s",
                     identifier_obj, self.display_name
                 )
-        return sort_name
+                definitive = (response.status_code == 404)
+        return sort_name, definitive
 
     def display_name_to_sort_name_through_canonicalizer(
             self, _db, identifiers, metadata_client):
+        sort_name, definitive = self._canonicalize(
+            _db, identifiers, metadata_client
+        )
+        return sort_name
+
+    def _canonicalize(self, _db, identifiers, metadata_client):
+        """Ask the canonicalizer for a sort name, first in the context
+        of each ISBN, then with no context.
+
+        :return: A 2-tuple (sort_name, definitive), as with
+            _display_name_to_sort_name.
+        """
         sort_name = None
+        definitive = True
         for identifier in identifiers:
             if identifier.type != Identifier.ISBN:
                 continue
             identifier_obj, ignore = identifier.load(_db)
-            sort_name = self._display_name_to_sort_name(
+            sort_name, answered = self._display_name_to_sort_name(
                 _db, metadata_client, identifier_obj
             )
+            definitive = definitive and answered
             if sort_name:
-                break
+                return sort_name, True
 
-        if not sort_name:
-            sort_name = self._display_name_to_sort_name(
-                _db, metadata_client, None
-            )
-        return sort_name
+        sort_name, answered = self._display_name_to_sort_name(
+            _db, metadata_client, None
+        )
+        if sort_name:
+            return sort_name, True
+        return None, definitive and answered
 
 
 class IdentifierData(object):
+    __slots__ = ('type', 'identifier', 'weight')
+
     def __init__(self, type, identifier, weight=1):
         self.type = type
         self.weight = weight
@@ -387,6 +554,10 @@ class IdentifierData(object):
 
 
 class LinkData(object):
+    __slots__ = (
+        'rel', 'href', 'media_type', 'content', 'thumbnail', 'rights_uri',
+    )
+
     def __init__(self, rel, href=None, media_type=None, content=None,
                  thumbnail=None, rights_uri=None):
         if not rel:
@@ -419,6 +590,8 @@ class LinkData(object):
 
 
 class MeasurementData(object):
+    __slots__ = ('quantity_measured', 'value', 'weight', 'taken_at')
+
     def __init__(self,
                  quantity_measured,
                  value,
@@ -442,6 +615,8 @@ class MeasurementData(object):
 
 
 class FormatData(object):
+    __slots__ = ('content_type', 'drm_scheme', 'link', 'rights_uri')
+
     def __init__(self, content_type, drm_scheme, link=None, rights_uri=None):
         self.content_type = content_type
         self.drm_scheme = drm_scheme
@@ -461,6 +636,8 @@ class MetaToModelUtility(object):
     Contains functionality common to both CirculationData and Metadata.
     """
 
+    __slots__ = ()
+
     def mirror_link(self, model_object, data_source, link, link_obj, policy):
         """Retrieve a copy of the given link and make sure it gets
         mirrored. If it's a full-size image, create a thumbnail and
@@ -650,6 +827,13 @@ class CirculationData(MetaToModelUtility):
         "Abstract metadata layer - Circulation data"
     )
 
+    __slots__ = (
+        '_data_source', 'data_source_obj', 'data_source_name',
+        'primary_identifier', 'licenses_owned', 'licenses_available',
+        'licenses_reserved', 'patrons_in_hold_queue', 'last_checked',
+        'formats', 'default_rights_uri', '__links',
+    )
+
     def __init__(
             self, 
             data_source,
@@ -966,6 +1150,448 @@ class CirculationData(MetaToModelUtility):
 
 
 
+class BatchLookups(object):
+    """Database objects found or created in bulk for a batch of
+    Metadata objects.
+
+    Applying Metadata one item at a time looks up every Identifier,
+    Edition, Subject, Contributor and Resource, and every
+    Classification, Equivalency, Hyperlink and Contribution connecting
+    them, with its own query. prefetch() finds or creates each kind for
+    the whole batch at once; Metadata.apply() then takes objects from
+    here, and finds or creates anything that wasn't prefetched the
+    normal way.
+    """
+
+    def __init__(self):
+        self.identifiers = {}
+        self.new_identifiers = set()
+        self.editions = {}
+        self.new_editions = set()
+        self.coverage_records = {}
+        self.subjects = {}
+        self.contributors = {}
+        self.resources = {}
+
+        # Association rows, keyed on the IDs of the objects they
+        # connect. Only the associations of covered Identifiers and
+        # Editions were looked up; anything else has to be looked up
+        # the normal way.
+        self.covered_identifier_ids = set()
+        self.covered_edition_ids = set()
+        self.classifications = {}
+        self.equivalencies = {}
+        self.links = {}
+        self.contributions = {}
+
+    @classmethod
+    def prefetch(cls, _db, metadata_list, replace=None):
+        """Find or create everything the given Metadata objects refer to.
+
+        Every item gets an Edition for its primary identifier, so those
+        Editions and Identifiers are created first. An item that
+        apply() will skip because it hasn't changed since it was last
+        applied gets nothing else; for the rest, Identifiers, Subjects,
+        Contributors and Resources are created in bulk, and the
+        associations that already exist between them are looked up.
+
+        :param replace: The ReplacementPolicy that will be passed into
+            apply().
+        """
+        lookups = cls()
+
+        usable = []
+        for metadata in metadata_list:
+            try:
+                data_source = metadata.data_source(_db)
+            except ValueError, e:
+                # Leave it to apply() to report the problem with this
+                # item.
+                continue
+            if metadata.primary_identifier:
+                usable.append((metadata, data_source))
+
+        primary_ids = set(
+            (metadata.primary_identifier.type,
+             metadata.primary_identifier.identifier)
+            for metadata, data_source in usable
+        )
+        lookups.identifiers, lookups.new_identifiers = (
+            Identifier.for_foreign_ids(_db, primary_ids)
+        )
+
+        edition_keys = set()
+        for metadata, data_source in usable:
+            identifier = lookups._prefetched_identifier(
+                metadata.primary_identifier
+            )
+            if identifier:
+                edition_keys.add((data_source.id, identifier.id))
+        lookups.editions, lookups.new_editions = get_many_or_create(
+            _db, Edition, ('data_source_id', 'primary_identifier_id'),
+            edition_keys
+        )
+
+        # Find out which items apply() will skip.
+        check_coverage = (
+            replace is None or not replace.even_if_not_apparently_updated
+        )
+        if check_coverage:
+            coverage_keys = set()
+            for metadata, data_source in usable:
+                identifier = lookups._prefetched_identifier(
+                    metadata.primary_identifier
+                )
+                if identifier and metadata.data_source_last_updated:
+                    coverage_keys.add((identifier.id, data_source.id))
+            lookups.coverage_records = dict(
+                (key, None) for key in coverage_keys
+            )
+            if coverage_keys:
+                qu = _db.query(CoverageRecord).filter(
+                    tuple_(CoverageRecord.identifier_id,
+                           CoverageRecord.data_source_id).in_(
+                               list(coverage_keys))
+                ).filter(CoverageRecord.operation==None)
+                for record in qu:
+                    key = (record.identifier_id, record.data_source_id)
+                    lookups.coverage_records[key] = record
+
+        applied = []
+        for metadata, data_source in usable:
+            identifier = lookups._prefetched_identifier(
+                metadata.primary_identifier
+            )
+            if not identifier:
+                continue
+            record = lookups.coverage_records.get(
+                (identifier.id, data_source.id)
+            )
+            if (record and metadata.data_source_last_updated
+                and record.timestamp >= metadata.data_source_last_updated):
+                continue
+            applied.append((metadata, data_source, identifier))
+
+        foreign_ids = set()
+        subject_names = {}
+        sort_names = set()
+        resource_data_sources = {}
+        for metadata, data_source, identifier in applied:
+            for identifier_data in metadata.identifiers:
+                if identifier_data.identifier:
+                    foreign_ids.add(
+                        (identifier_data.type, identifier_data.identifier)
+                    )
+            for subject in metadata.subjects:
+                if subject.type and subject.identifier:
+                    key = (subject.type, subject.identifier)
+                    if not subject_names.get(key):
+                        subject_names[key] = subject.name
+            for contributor in metadata.contributors:
+                if (contributor.sort_name and not contributor.lc
+                    and not contributor.viaf):
+                    sort_names.add(contributor.sort_name)
+            for link in metadata.links:
+                if link.href and link.rel in Hyperlink.METADATA_ALLOWED:
+                    resource_data_sources.setdefault(
+                        (link.href,), data_source.id
+                    )
+
+        others, new_others = Identifier.for_foreign_ids(
+            _db, foreign_ids - primary_ids
+        )
+        lookups.identifiers.update(others)
+        lookups.new_identifiers.update(new_others)
+
+        lookups.subjects, ignore = get_many_or_create(
+            _db, Subject, ('type', 'identifier'), subject_names.keys(),
+            create_method_kwargs=lambda key: dict(name=subject_names[key])
+        )
+        lookups.resources, ignore = get_many_or_create(
+            _db, Resource, ('url',), resource_data_sources.keys(),
+            create_method_kwargs=lambda key: dict(
+                data_source_id=resource_data_sources[key]
+            )
+        )
+
+        if sort_names:
+            # There may be several Contributors with the same sort
+            # name, so these can't go through get_many_or_create().
+            contributors = defaultdict(list)
+            qu = _db.query(Contributor).filter(
+                Contributor.sort_name.in_(sort_names)
+            )
+            for contributor in qu:
+                contributors[contributor.sort_name].append(contributor)
+            missing = [(name,) for name in sort_names
+                       if name not in contributors]
+            created, ignore = get_many_or_create(
+                _db, Contributor, ('sort_name',), missing
+            )
+            for (sort_name,), contributor in created.items():
+                contributors[sort_name].append(contributor)
+            lookups.contributors = contributors
+
+        lookups._prefetch_associations(_db, applied)
+        return lookups
+
+    def _prefetch_associations(self, _db, applied):
+        """Look up the Classifications, Equivalencies and Hyperlinks of
+        the given items' primary identifiers, and the Contributions to
+        their Editions.
+
+        The Identifiers' and Editions' collections are filled in at the
+        same time, so apply() doesn't have to load them one at a time.
+        """
+        identifiers = {}
+        editions = {}
+        for metadata, data_source, identifier in applied:
+            identifiers[identifier.id] = identifier
+            edition = self.editions.get((data_source.id, identifier.id))
+            if edition:
+                editions[edition.id] = edition
+        self.covered_identifier_ids = set(identifiers.keys())
+        self.covered_edition_ids = set(editions.keys())
+
+        new_identifier_ids = set(
+            self.identifiers[key].id for key in self.new_identifiers
+            if key in self.identifiers
+        )
+        new_edition_ids = set(
+            self.editions[key].id for key in self.new_editions
+        )
+        old_identifier_ids = self.covered_identifier_ids - new_identifier_ids
+        old_edition_ids = self.covered_edition_ids - new_edition_ids
+
+        classifications = defaultdict(list)
+        links = defaultdict(list)
+        contributions = defaultdict(list)
+        if old_identifier_ids:
+            qu = _db.query(Classification).filter(
+                Classification.identifier_id.in_(old_identifier_ids)
+            )
+            for classification in qu:
+                classifications[classification.identifier_id].append(
+                    classification
+                )
+                key = (classification.identifier_id,
+                       classification.subject_id,
+                       classification.data_source_id)
+                self.classifications.setdefault(key, classification)
+
+            qu = _db.query(Equivalency).filter(
+                Equivalency.input_id.in_(old_identifier_ids)
+            )
+            for equivalency in qu:
+                key = (equivalency.input_id, equivalency.output_id,
+                       equivalency.data_source_id)
+                self.equivalencies.setdefault(key, equivalency)
+
+            qu = _db.query(Hyperlink).filter(
+                Hyperlink.identifier_id.in_(old_identifier_ids)
+            )
+            for link in qu:
+                links[link.identifier_id].append(link)
+                key = (link.identifier_id, link.rel, link.data_source_id,
+                       link.resource_id)
+                self.links.setdefault(key, link)
+
+        if old_edition_ids:
+            qu = _db.query(Contribution).filter(
+                Contribution.edition_id.in_(old_edition_ids)
+            )
+            for contribution in qu:
+                contributions[contribution.edition_id].append(contribution)
+                key = (contribution.edition_id, contribution.contributor_id,
+                       contribution.role)
+                self.contributions[key] = contribution
+
+        for id, identifier in identifiers.items():
+            self._set_collection(
+                identifier, 'classifications', classifications[id]
+            )
+            self._set_collection(identifier, 'links', links[id])
+        for id, edition in editions.items():
+            self._set_collection(
+                edition, 'contributions', contributions[id]
+            )
+
+    @classmethod
+    def _set_collection(cls, obj, name, value):
+        """Fill in a collection that hasn't been loaded yet."""
+        if name in inspect(obj).unloaded:
+            set_committed_value(obj, name, value)
+
+    @classmethod
+    def _usable(cls, _db, row):
+        """Can a prefetched association row be used?
+
+        A row that's been deleted since it was prefetched can't be.
+        """
+        return row in _db and row not in _db.deleted
+
+    def _prefetched_identifier(self, identifier_data):
+        if not identifier_data:
+            return None
+        try:
+            key = Identifier.normalize_foreign_id(
+                identifier_data.type, identifier_data.identifier
+            )
+        except ValueError, e:
+            return None
+        return self.identifiers.get(key)
+
+    def identifier(self, _db, type, identifier):
+        """Find or create an Identifier, as Identifier.for_foreign_id does."""
+        data = IdentifierData(type, identifier)
+        found = self._prefetched_identifier(data)
+        if found:
+            key = (found.type, found.identifier)
+            return found, key in self.new_identifiers
+        return Identifier.for_foreign_id(_db, type, identifier)
+
+    def edition(self, _db, data_source, identifier_data,
+                create_if_not_exists=True):
+        """Find or create an Edition, as Edition.for_foreign_id does."""
+        identifier = self._prefetched_identifier(identifier_data)
+        if identifier:
+            key = (data_source.id, identifier.id)
+            if key in self.editions:
+                return self.editions[key], key in self.new_editions
+        return Edition.for_foreign_id(
+            _db, data_source, identifier_data.type,
+            identifier_data.identifier,
+            create_if_not_exists=create_if_not_exists
+        )
+
+    def coverage_record(self, edition, data_source):
+        """Find the CoverageRecord for an Edition, as
+        CoverageRecord.lookup does.
+        """
+        key = (edition.primary_identifier.id, data_source.id)
+        if key in self.coverage_records:
+            return self.coverage_records[key]
+        return CoverageRecord.lookup(edition, data_source)
+
+    def add_coverage_record(self, edition, data_source, timestamp=None):
+        """Create or update the CoverageRecord for an Edition, as
+        CoverageRecord.add_for does.
+        """
+        record, is_new = CoverageRecord.add_for(
+            edition, data_source, timestamp=timestamp
+        )
+        key = (edition.primary_identifier.id, data_source.id)
+        if key in self.coverage_records:
+            # A later item with the same primary identifier must see
+            # this record.
+            self.coverage_records[key] = record
+        return record, is_new
+
+    def subject(self, type, identifier, name):
+        """The prefetched Subject for a SubjectData, or None."""
+        subject = self.subjects.get((type, identifier))
+        if subject and name and not subject.name:
+            # We just discovered the name of a subject that previously
+            # had only an ID.
+            subject.name = name
+        return subject
+
+    def contributor(self, contributor_data):
+        """The prefetched Contributor for a ContributorData, or None."""
+        if contributor_data.lc or contributor_data.viaf:
+            return None
+        contributors = self.contributors.get(contributor_data.sort_name)
+        if contributors:
+            return contributors[0]
+        return None
+
+    def resource(self, href):
+        """The prefetched Resource for a URL, or None."""
+        return self.resources.get((href,))
+
+    def classification(self, _db, identifier, subject, data_source):
+        """Find or create the Classification of a covered Identifier
+        under a Subject, or return None.
+        """
+        if not subject or identifier.id not in self.covered_identifier_ids:
+            return None
+        key = (identifier.id, subject.id, data_source.id)
+        classification = self.classifications.get(key)
+        if classification is None:
+            classification = Classification(
+                identifier=identifier, subject=subject,
+                data_source=data_source
+            )
+            _db.add(classification)
+            self.classifications[key] = classification
+        elif not self._usable(_db, classification):
+            return None
+        return classification
+
+    def equivalency(self, _db, input, output, data_source):
+        """Find or create the Equivalency between a covered Identifier
+        and another one, or return None.
+        """
+        if input == output or input.id not in self.covered_identifier_ids:
+            return None
+        key = (input.id, output.id, data_source.id)
+        equivalency = self.equivalencies.get(key)
+        if equivalency is None:
+            equivalency = Equivalency(
+                input=input, output=output, data_source=data_source
+            )
+            _db.add(equivalency)
+            self.equivalencies[key] = equivalency
+        elif not self._usable(_db, equivalency):
+            return None
+        return equivalency
+
+    def link(self, _db, identifier, rel, data_source, resource):
+        """Find or create the Hyperlink from a covered Identifier to a
+        Resource, or return None.
+        """
+        if not resource or identifier.id not in self.covered_identifier_ids:
+            return None
+        key = (identifier.id, rel, data_source.id, resource.id)
+        link = self.links.get(key)
+        if link is None:
+            link = Hyperlink(
+                identifier=identifier, rel=rel, data_source=data_source,
+                resource=resource
+            )
+            _db.add(link)
+            self.links[key] = link
+        elif not self._usable(_db, link):
+            return None
+        return link
+
+    def contributions_by_role(self, _db, edition, contributor, roles):
+        """Find or create the Contributions of a Contributor to a
+        covered Edition.
+
+        :return: A dictionary mapping roles to Contributions. A role
+            whose Contribution can't be used is left out.
+        """
+        found = {}
+        if not contributor or edition.id not in self.covered_edition_ids:
+            return found
+        if isinstance(roles, basestring):
+            roles = [roles]
+        for role in roles:
+            key = (edition.id, contributor.id, role)
+            contribution = self.contributions.get(key)
+            if contribution is None:
+                contribution = Contribution(
+                    edition=edition, contributor=contributor, role=role
+                )
+                _db.add(contribution)
+                self.contributions[key] = contribution
+            elif not self._usable(_db, contribution):
+                continue
+            found[role] = contribution
+        return found
+
+
 class Metadata(MetaToModelUtility):
 
     """A (potentially partial) set of metadata for a published work."""
@@ -978,6 +1604,18 @@ class Metadata(MetaToModelUtility):
         'issued', 'published'
     ]
 
+    __slots__ = (
+        '_data_source', 'data_source_obj', 'title', 'sort_title',
+        'subtitle', 'language', 'medium', 'series', 'series_position',
+        'publisher', 'imprint', 'issued', 'published',
+        'primary_identifier', 'identifiers', 'permanent_work_id',
+        'recommendations', 'subjects', 'contributors', 'measurements',
+        'circulation', 'data_source_last_updated', '__links',
+
+        # Set by code outside this class.
+        '_license_data_source', 'license_data_source_obj', 'csv_row',
+    )
+
     def __init__(
             self,
             data_source,
@@ -1219,8 +1857,10 @@ class Metadata(MetaToModelUtility):
             raise ValueError("Data source %s not found!" % self._data_source)
         return self.data_source_obj
 
-    def edition(self, _db, create_if_not_exists=True):
+    def edition(self, _db, create_if_not_exists=True, lookups=None):
         """ Find or create the edition described by this Metadata object.
+
+        :param lookups: A BatchLookups that may already contain the edition.
         """
         if not self.primary_identifier:
             raise ValueError(
@@ -1229,9 +1869,9 @@ class Metadata(MetaToModelUtility):
 
         data_source = self.data_source(_db)
 
-        return Edition.for_foreign_id(
-            _db, data_source, self.primary_identifier.type,
-            self.primary_identifier.identifier,
+        lookups = lookups or BatchLookups()
+        return lookups.edition(
+            _db, data_source, self.primary_identifier,
             create_if_not_exists=create_if_not_exists
         )
 
@@ -1296,6 +1936,43 @@ class Metadata(MetaToModelUtility):
         return success
 
 
+    @classmethod
+    def apply_many(cls, _db, metadata_list, metadata_client=None,
+                   replace=None, failures=None):
+        """Find or create an Edition for each of the given Metadata
+        objects and apply the metadata to it.
+
+        The Identifiers, Editions, Subjects, Contributors and Resources
+        mentioned anywhere in the batch, and the associations between
+        them, are found or created in bulk first (see BatchLookups), so
+        this makes far fewer database round trips than calling
+        edition() and apply() on each item.
+
+        :param failures: If this is a dictionary, an exception raised
+            while applying one item doesn't stop the others from being
+            applied. Instead, the item's result is None, and
+            `failures` maps the item's position in `metadata_list` to
+            an (exception, traceback) 2-tuple.
+        :return: A list of (edition, made_core_changes) 2-tuples, in the
+        same order as `metadata_list`.
+        """
+        lookups = BatchLookups.prefetch(_db, metadata_list, replace)
+        results = []
+        for i, metadata in enumerate(metadata_list):
+            try:
+                edition, is_new = metadata.edition(_db, lookups=lookups)
+                result = metadata.apply(
+                    edition, metadata_client, replace=replace,
+                    lookups=lookups
+                )
+            except Exception, e:
+                if failures is None:
+                    raise
+                failures[i] = (e, traceback.format_exc())
+                result = None
+            results.append(result)
+        return results
+
     # TODO: We need to change all calls to apply() to use a ReplacementPolicy
     # instead of passing in individual `replace` arguments. Once that's done,
     # we can get rid of the `replace` arguments.
@@ -1307,11 +1984,14 @@ class Metadata(MetaToModelUtility):
               replace_formats=False,
               replace_rights=False,
               force=False,
+              lookups=None,
     ):
         """Apply this metadata to the given edition.
 
         :param mirror: Open-access books and cover images will be mirrored
         to this MirrorUploader.
+        :param lookups: A BatchLookups containing database objects that
+        were looked up ahead of time.
         :return: (edition, made_core_changes), where edition is the newly-updated object, and made_core_changes 
         answers the question: were any edition core fields harmed in the making of this update?  
         So, if title changed, return True.  
@@ -1320,6 +2000,7 @@ class Metadata(MetaToModelUtility):
         """
         _db = Session.object_session(edition)
         made_core_changes = False
+        lookups = lookups or BatchLookups()
         if replace is None:
             replace = ReplacementPolicy(
                 identifiers=replace_identifiers,
@@ -1349,7 +2030,7 @@ class Metadata(MetaToModelUtility):
         data_source = self.data_source(_db)
 
         if self.data_source_last_updated and not replace.even_if_not_apparently_updated:
-            coverage_record = CoverageRecord.lookup(edition, data_source)
+            coverage_record = lookups.coverage_record(edition, data_source)
             if coverage_record:
                 check_time = coverage_record.timestamp
                 last_time = self.data_source_last_updated
@@ -1379,7 +2060,8 @@ class Metadata(MetaToModelUtility):
         # Create equivalencies between all given identifiers and
         # the edition's primary identifier.
         contributors_changed = self.update_contributions(_db, edition, 
-                                  metadata_client, replace.contributions)
+                                  metadata_client, replace.contributions,
+                                  lookups=lookups)
         if contributors_changed:
             made_core_changes = True
 
@@ -1392,10 +2074,14 @@ class Metadata(MetaToModelUtility):
                     identifier_data.type==identifier.type):
                     # These are the same identifier.
                     continue
-                new_identifier, ignore = Identifier.for_foreign_id(
+                new_identifier, ignore = lookups.identifier(
                     _db, identifier_data.type, identifier_data.identifier)
                 identifier.equivalent_to(
-                    data_source, new_identifier, identifier_data.weight)
+                    data_source, new_identifier, identifier_data.weight,
+                    equivalency=lookups.equivalency(
+                        _db, identifier, new_identifier, data_source
+                    )
+                )
 
         new_subjects = {}
         if self.subjects:
@@ -1433,9 +2119,16 @@ class Metadata(MetaToModelUtility):
 
         # Apply all new subjects to the identifier.
         for subject in new_subjects.values():
+            subject_obj = lookups.subject(
+                subject.type, subject.identifier, subject.name
+            )
             identifier.classify(
                 data_source, subject.type, subject.identifier,
-                subject.name, weight=subject.weight)
+                subject.name, weight=subject.weight, subject=subject_obj,
+                classification=lookups.classification(
+                    _db, identifier, subject_obj, data_source
+                )
+            )
 
         # Associate all links with the primary identifier.
         if replace.links and self.links is not None:
@@ -1454,10 +2147,14 @@ class Metadata(MetaToModelUtility):
 
         for link in self.links:
             if link.rel in Hyperlink.METADATA_ALLOWED:
+                resource = lookups.resource(link.href)
                 link_obj, ignore = identifier.add_link(
                     rel=link.rel, href=link.href, data_source=data_source, 
                     license_pool=None, media_type=link.media_type,
-                    content=link.content
+                    content=link.content, resource=resource,
+                    link=lookups.link(
+                        _db, identifier, link.rel, data_source, resource
+                    )
                 )
             link_objects[link] = link_obj
 
@@ -1523,7 +2220,7 @@ class Metadata(MetaToModelUtility):
 
         # Finally, update the coverage record for this edition
         # and data source.
-        CoverageRecord.add_for(
+        lookups.add_coverage_record(
             edition, data_source, timestamp=self.data_source_last_updated
         )
         return edition, made_core_changes
@@ -1560,7 +2257,8 @@ class Metadata(MetaToModelUtility):
 
 
     def update_contributions(self, _db, edition, metadata_client=None,
-                             replace=True):
+                             replace=True, lookups=None):
+        lookups = lookups or BatchLookups()
         contributors_changed = False
         old_contributors = []
         new_contributors = []
@@ -1586,11 +2284,15 @@ class Metadata(MetaToModelUtility):
             if (contributor_data.sort_name
                 or contributor_data.lc
                 or contributor_data.viaf):
+                contributor = lookups.contributor(contributor_data)
                 contributor = edition.add_contributor(
-                    name=contributor_data.sort_name,
+                    name=contributor or contributor_data.sort_name,
                     roles=contributor_data.roles,
                     lc=contributor_data.lc,
-                    viaf=contributor_data.viaf
+                    viaf=contributor_data.viaf,
+                    contributions=lookups.contributions_by_role(
+                        _db, edition, contributor, contributor_data.roles
+                    )
                 )
                 new_contributors.append(contributor.id)
                 if contributor_data.display_name:
@@ -0,0 +1,4 @@
+-- Representation content may now be kept in a content-addressed
+-- store on disk, referenced by its SHA-256 hash.
+ALTER TABLE representations ADD COLUMN content_hash varchar;
+CREATE INDEX ix_representations_content_hash ON representations USING btree (content_hash);
@@ -0,0 +1,3 @@
+-- Cached feeds now keep a hash of their content, which is used as
+-- the ETag when the feed is served.
+ALTER TABLE cachedfeeds ADD COLUMN content_hash varchar;
@@ -0,0 +1,4 @@
+-- Cached feeds are now stored compressed. Feeds already in the
+-- 'content' column stay there until they're regenerated.
+ALTER TABLE cachedfeeds ADD COLUMN compressed_content bytea;
+ALTER TABLE cachedfeeds ADD COLUMN content_encoding varchar;
@@ -0,0 +1,7 @@
+-- Cached feeds record the works and custom lists they depend on, so
+-- they can be marked dirty when one of those changes.
+ALTER TABLE cachedfeeds ADD COLUMN work_ids integer[];
+ALTER TABLE cachedfeeds ADD COLUMN list_ids integer[];
+ALTER TABLE cachedfeeds ADD COLUMN dirty boolean NOT NULL DEFAULT false;
+CREATE INDEX ix_cachedfeeds_work_ids ON cachedfeeds USING gin (work_ids);
+CREATE INDEX ix_cachedfeeds_list_ids ON cachedfeeds USING gin (list_ids);
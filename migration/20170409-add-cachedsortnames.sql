@@ -0,0 +1,11 @@
+-- Remember the sort names worked out for contributors' display names,
+-- including display names that have no known sort name.
+CREATE TABLE cachedsortnames (
+  id SERIAL NOT NULL PRIMARY KEY,
+  display_name varchar NOT NULL,
+  sort_name varchar,
+  "timestamp" timestamp NOT NULL,
+  expires timestamp
+);
+CREATE UNIQUE INDEX ix_cachedsortnames_display_name ON cachedsortnames (display_name);
+CREATE INDEX ix_cachedsortnames_expires ON cachedsortnames (expires);
@@ -0,0 +1,11 @@
+-- Share the results of recent searches between the processes that
+-- use the database.
+CREATE TABLE cachedsearchresults (
+  id SERIAL NOT NULL PRIMARY KEY,
+  key varchar NOT NULL,
+  work_ids integer[] NOT NULL,
+  "timestamp" timestamp NOT NULL,
+  expires timestamp NOT NULL
+);
+CREATE UNIQUE INDEX ix_cachedsearchresults_key ON cachedsearchresults (key);
+CREATE INDEX ix_cachedsearchresults_expires ON cachedsearchresults (expires);
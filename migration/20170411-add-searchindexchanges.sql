@@ -0,0 +1,8 @@
+-- Changes to works that haven't been sent to the search index yet.
+CREATE TABLE searchindexchanges (
+  id SERIAL NOT NULL PRIMARY KEY,
+  work_id integer NOT NULL,
+  operation varchar NOT NULL,
+  enqueued_at timestamp NOT NULL
+);
+CREATE INDEX ix_searchindexchanges_work_id ON searchindexchanges (work_id);
@@ -0,0 +1,15 @@
+-- Store each image's thumbnail size quality penalty so covers can be
+-- ranked in the database. This is the same calculation as
+-- Representation._thumbnail_size_quality_penalty(): 1 if the size is
+-- unknown, otherwise scaled down by the deviation from a 2:3 aspect
+-- ratio and by any shortfall from a 160x240 thumbnail.
+ALTER TABLE representations ADD COLUMN thumbnail_size_quality_penalty float DEFAULT 1;
+
+UPDATE representations SET thumbnail_size_quality_penalty = (
+  least(
+    (image_width::float / image_height) / (2.0 / 3),
+    (2.0 / 3) / (image_width::float / image_height)
+  )
+  * least(1, image_width::float / 160)
+  * least(1, image_height::float / 240)
+) WHERE image_width > 0 AND image_height > 0;
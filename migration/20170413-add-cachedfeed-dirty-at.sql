@@ -0,0 +1,4 @@
+-- Cached feeds record when they were marked dirty, so a feed generated
+-- from the materialized views stays dirty until the views catch up.
+ALTER TABLE cachedfeeds ADD COLUMN dirty_at timestamp without time zone;
+UPDATE cachedfeeds SET dirty_at = now() at time zone 'utc' WHERE dirty = true;
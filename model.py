@@ -3,22 +3,26 @@ from cStringIO import StringIO
 from collections import (
     Counter,
     defaultdict,
+    namedtuple,
 )
 from lxml import etree
 from nose.tools import set_trace
 import base64
 import bisect
 import cairosvg
+import copy
 import datetime
 import isbnlib
 import json
 import logging
 import md5
+import multiprocessing
 import operator
 import os
 import random
 import re
 import requests
+import threading
 import time
 import traceback
 import urllib
@@ -41,11 +45,16 @@ from sqlalchemy import (
     Table,
 )
 from sqlalchemy.sql import select
+from sqlalchemy import event
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.orm import (
     backref,
     contains_eager,
+    deferred,
     joinedload,
     lazyload,
+    make_transient_to_detached,
+    object_mapper,
     relationship,
     sessionmaker,
     synonym,
@@ -71,6 +80,7 @@ from sqlalchemy.sql.expression import (
     literal_column,
     case,
     table,
+    tuple_,
 )
 from sqlalchemy.exc import (
     IntegrityError
@@ -115,6 +125,13 @@ from util.http import (
     HTTP,
     RemoteIntegrationException,
 )
+from util.compression import (
+    GZIP,
+    available_encodings,
+    compress,
+    decompress,
+)
+from util.content_store import ContentStore
 from util.permanent_work_id import WorkIDCalculator
 from util.personal_names import display_name_to_sort_name
 from util.summary import SummaryEvaluator
@@ -161,6 +178,11 @@ class SessionManager(object):
         MATERIALIZED_VIEW_WORKS_WORKGENRES : 'materialized_view_works_workgenres.sql',
     }
 
+    # The Timestamp service recording when the materialized views were
+    # last refreshed. The timestamp is the time the refresh started,
+    # since changes committed after that may not be in the views.
+    MATERIALIZED_VIEWS_REFRESHED = "Materialized views refreshed"
+
     # A function that calculates recursively equivalent identifiers
     # is also defined in SQL.
     RECURSIVE_EQUIVALENTS_FUNCTION = 'recursive_equivalents.sql'
@@ -270,9 +292,35 @@ class SessionManager(object):
 
     @classmethod
     def refresh_materialized_views(self, _db):
+        started = datetime.datetime.utcnow()
         for view_name in self.MATERIALIZED_VIEWS.keys():
             _db.execute("refresh materialized view %s;" % view_name)
             _db.commit()
+        self.record_materialized_views_refreshed(_db, started)
+
+    @classmethod
+    def record_materialized_views_refreshed(cls, _db, started):
+        """Note that every change committed before `started` is now
+        reflected in the materialized views.
+        """
+        stamp, is_new = get_one_or_create(
+            _db, Timestamp, service=cls.MATERIALIZED_VIEWS_REFRESHED
+        )
+        stamp.timestamp = started
+        _db.commit()
+
+    @classmethod
+    def materialized_views_refreshed_at(cls, _db):
+        """When did the last refresh of the materialized views start?
+
+        :return: A datetime, or None if no refresh has been recorded.
+        """
+        stamp = get_one(
+            _db, Timestamp, service=cls.MATERIALIZED_VIEWS_REFRESHED
+        )
+        if stamp:
+            return stamp.timestamp
+        return None
 
     @classmethod
     def session(cls, url):
@@ -369,8 +417,211 @@ def create(db, model, create_method='',
     db.flush()
     return created, True
 
+def get_many_or_create(db, model, key_names, keys, create_method_kwargs=None):
+    """Find or create many objects of the same kind at once.
+
+    Existing objects are found with a single SELECT, and all missing
+    objects are created with a single multi-row INSERT.
+
+    :param key_names: Names of the columns that together identify an
+        object, e.g. ('type', 'identifier').
+    :param keys: Tuples of values for those columns.
+    :param create_method_kwargs: A function that takes a key and
+        returns a dictionary of extra column values to use if an object
+        with that key has to be created.
+    :return: A 2-tuple (objects, new_keys). `objects` is a dictionary
+        mapping each key to its object; `new_keys` is the set of keys
+        whose objects were just created.
+    """
+    keys = set(keys)
+    if not keys:
+        return {}, set()
+
+    found = get_many(db, model, key_names, keys)
+    missing = keys - set(found.keys())
+    if not missing:
+        return found, set()
+
+    rows = []
+    for key in missing:
+        row = dict(zip(key_names, key))
+        if create_method_kwargs:
+            row.update(create_method_kwargs(key))
+        rows.append(row)
+    new_keys = missing
+    __transaction = db.begin_nested()
+    try:
+        db.execute(model.__table__.insert().values(rows))
+        __transaction.commit()
+    except IntegrityError, e:
+        # Someone else created some of these objects in the
+        # meantime. Fall back to creating them one at a time.
+        logging.info(
+            "INTEGRITY ERROR creating %d %r: %r", len(rows), model, e
+        )
+        __transaction.rollback()
+        new_keys = set()
+        for key in missing:
+            extra = {}
+            if create_method_kwargs:
+                extra = create_method_kwargs(key)
+            obj, is_new = get_one_or_create(
+                db, model, create_method_kwargs=extra,
+                **dict(zip(key_names, key))
+            )
+            if is_new:
+                new_keys.add(key)
+    found.update(get_many(db, model, key_names, missing))
+    return found, new_keys
+
+def get_many(db, model, key_names, keys):
+    """Find many existing objects of the same kind with a single SELECT.
+
+    :param key_names: Names of the columns that together identify an
+        object, e.g. ('type', 'identifier').
+    :param keys: Tuples of values for those columns.
+    :return: A dictionary mapping each key that was found to its object.
+    """
+    keys = set(keys)
+    if not keys:
+        return {}
+    columns = [getattr(model, name) for name in key_names]
+    if len(columns) == 1:
+        clause = columns[0].in_([key[0] for key in keys])
+    else:
+        clause = tuple_(*columns).in_(list(keys))
+    found = {}
+    for obj in db.query(model).filter(clause):
+        key = tuple(getattr(obj, name) for name in key_names)
+        found[key] = obj
+    return found
+
 Base = declarative_base()
 
+class LookupCache(object):
+    """A process-wide cache of the rows of a small table that rarely
+    changes, such as the datasources or genres table.
+
+    Each row is kept as a detached copy, keyed on whatever its lookup
+    method was given, and merged into the caller's session without
+    going to the database. Only committed rows are cached: a row that
+    a session created is held back until that session commits, since
+    until then it might be rolled back.
+
+    A row whose columns are changed, or which is deleted, through any
+    session is dropped from its cache when the session is flushed.
+    Changes made some other way, e.g. by another process, call for
+    invalidate() or reset_all().
+    """
+
+    # Every LookupCache, so they can all be reset at once.
+    caches = []
+
+    # Keys in Session.info: the (class, id) of every cacheable row the
+    # session has created in its current transaction, and the rows
+    # waiting for that transaction to commit before they're cached.
+    CREATED = 'lookup_cache_created'
+    STAGED = 'lookup_cache_staged'
+
+    def __init__(self):
+        self._rows = dict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        LookupCache.caches.append(self)
+
+    def get(self, _db, key):
+        """Find a cached row.
+
+        :return: The row, as an object in `_db`, or None.
+        """
+        row = self._rows.get(key)
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return _db.merge(row, load=False)
+
+    def remember(self, _db, key, obj):
+        """Cache a row found or created through `_db`.
+
+        If `_db` created the row and hasn't committed it yet, it's
+        cached when `_db` commits.
+        """
+        if obj is None or obj.id is None:
+            return
+        mapper = object_mapper(obj)
+        row = mapper.class_manager.new_instance()
+        for attribute in mapper.column_attrs:
+            setattr(row, attribute.key,
+                    copy.deepcopy(getattr(obj, attribute.key)))
+        make_transient_to_detached(row)
+        if (type(obj), obj.id) in _db.info.get(self.CREATED, ()):
+            _db.info.setdefault(self.STAGED, []).append((self, key, row))
+            return
+        self._publish(key, row)
+
+    def _publish(self, key, row):
+        with self._lock:
+            self._rows[key] = row
+
+    def invalidate(self, obj=None):
+        """Forget a row, or every row if none is given."""
+        with self._lock:
+            if obj is None:
+                self._rows.clear()
+                return
+            for key, row in self._rows.items():
+                if row.id == obj.id:
+                    del self._rows[key]
+
+    @classmethod
+    def reset_all(cls):
+        """Forget every row in every cache."""
+        for cache in cls.caches:
+            cache.invalidate()
+            cache.hits = 0
+            cache.misses = 0
+
+
+@event.listens_for(Session, 'after_flush')
+def track_lookup_rows(session, flush_context):
+    # The session's new, dirty and deleted collections, and the
+    # history of each object's attributes, still describe what was
+    # just flushed.
+    for obj in session.new:
+        if getattr(obj, '_lookup_cache', None) is not None:
+            session.info.setdefault(LookupCache.CREATED, set()).add(
+                (type(obj), obj.id)
+            )
+    for obj in session.dirty:
+        cache = getattr(obj, '_lookup_cache', None)
+        # Adding an Edition to a DataSource, say, changes the
+        # DataSource's 'editions' collection but not its row.
+        if (cache is not None
+            and session.is_modified(obj, include_collections=False)):
+            cache.invalidate(obj)
+    for obj in session.deleted:
+        cache = getattr(obj, '_lookup_cache', None)
+        if cache is not None:
+            cache.invalidate(obj)
+
+@event.listens_for(Session, 'after_commit')
+def publish_committed_lookup_rows(session):
+    for cache, key, row in session.info.pop(LookupCache.STAGED, []):
+        cache._publish(key, row)
+    session.info.pop(LookupCache.CREATED, None)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def forget_uncommitted_lookup_rows(session, previous_transaction):
+    # Even a rolled-back savepoint may have taken staged rows with it.
+    session.info.pop(LookupCache.STAGED, None)
+
+@event.listens_for(Session, 'after_rollback')
+def forget_created_lookup_rows(session):
+    session.info.pop(LookupCache.CREATED, None)
+
+
 class Patron(Base):
 
     __tablename__ = 'patrons'
@@ -825,6 +1076,9 @@ class DataSource(Base):
     ]
 
     __tablename__ = 'datasources'
+
+    # DataSource.lookup is called constantly.
+    _lookup_cache = LookupCache()
     id = Column(Integer, primary_key=True)
     name = Column(String, unique=True, index=True)
     offers_licenses = Column(Boolean, default=False)
@@ -867,6 +1121,9 @@ class DataSource(Base):
         # Turn a deprecated name (e.g. "3M" into the current name
         # (e.g. "Bibliotheca").
         name = cls.DEPRECATED_NAMES.get(name, name)
+        data_source = cls._lookup_cache.get(_db, name)
+        if data_source:
+            return data_source
         if autocreate:
             data_source, is_new = get_one_or_create(
                 _db, DataSource, name=name,
@@ -874,6 +1131,7 @@ class DataSource(Base):
             )
         else:
             data_source = get_one(_db, DataSource, name=name)
+        cls._lookup_cache.remember(_db, name, data_source)
         return data_source
 
     URI_PREFIX = u"http://librarysimplified.org/terms/sources/"
@@ -1248,6 +1506,33 @@ class WorkCoverageRecord(Base, BaseCoverageRecord):
         coverage_record.status = status
         coverage_record.timestamp = timestamp
         return coverage_record, is_new
+
+    @classmethod
+    def bulk_add(cls, _db, work_ids, operation, timestamp=None,
+                 status=CoverageRecord.SUCCESS):
+        """Record that an operation was performed on many Works, with
+        one UPDATE for the existing records and one INSERT for the rest.
+        """
+        work_ids = set(work_ids)
+        if not work_ids:
+            return
+        timestamp = timestamp or datetime.datetime.utcnow()
+        table = cls.__table__
+        _db.execute(
+            table.update().where(
+                table.c.operation==operation).where(
+                    table.c.work_id.in_(work_ids)).values(
+                        status=status, timestamp=timestamp)
+        )
+        existing = _db.query(cls.work_id).filter(
+            cls.operation==operation).filter(cls.work_id.in_(work_ids))
+        missing = work_ids - set(work_id for [work_id] in existing)
+        if missing:
+            _db.execute(table.insert().values([
+                dict(work_id=work_id, operation=operation, status=status,
+                     timestamp=timestamp)
+                for work_id in missing
+            ]))
 Index("ix_workcoveragerecords_operation_work_id", WorkCoverageRecord.operation, WorkCoverageRecord.work_id)
 
 class Equivalency(Base):
@@ -1438,6 +1723,29 @@ class Identifier(Base):
         if not foreign_identifier_type or not foreign_id:
             return None
 
+        foreign_identifier_type, foreign_id = cls.normalize_foreign_id(
+            foreign_identifier_type, foreign_id
+        )
+        if autocreate:
+            m = get_one_or_create
+        else:
+            m = get_one
+
+        result = m(_db, cls, type=foreign_identifier_type,
+                   identifier=foreign_id)
+
+        if isinstance(result, tuple):
+            return result
+        else:
+            return result, False
+
+    @classmethod
+    def normalize_foreign_id(cls, foreign_identifier_type, foreign_id):
+        """Put a foreign ID in the form in which it's stored.
+
+        :return: A (type, identifier) 2-tuple.
+        :raise ValueError: If the ID isn't valid for its type.
+        """
         # Turn a deprecated identifier type (e.g. "3M ID" into the
         # current type (e.g. "Bibliotheca ID").
         foreign_identifier_type = cls.DEPRECATED_NAMES.get(
@@ -1454,18 +1762,34 @@ class Identifier(Base):
                     foreign_id, foreign_identifier_type
                 )
             )
-        if autocreate:
-            m = get_one_or_create
-        else:
-            m = get_one
-
-        result = m(_db, cls, type=foreign_identifier_type,
-                   identifier=foreign_id)
+        return foreign_identifier_type, foreign_id
 
-        if isinstance(result, tuple):
-            return result
-        else:
-            return result, False
+    @classmethod
+    def for_foreign_ids(cls, _db, foreign_ids, autocreate=True):
+        """Find or create Identifiers for many foreign IDs at once.
+
+        :param foreign_ids: (type, identifier) 2-tuples. Invalid IDs
+            are ignored.
+        :param autocreate: If False, Identifiers that don't already
+            exist are left out of the result rather than created.
+        :return: A 2-tuple (identifiers, new_keys), as with
+            get_many_or_create. Keys are normalized (type, identifier)
+            2-tuples.
+        """
+        keys = set()
+        for foreign_identifier_type, foreign_id in foreign_ids:
+            if not foreign_identifier_type or not foreign_id:
+                continue
+            try:
+                keys.add(cls.normalize_foreign_id(
+                    foreign_identifier_type, foreign_id
+                ))
+            except ValueError, e:
+                continue
+        key_names = ('type', 'identifier')
+        if not autocreate:
+            return get_many(_db, cls, key_names, keys), set()
+        return get_many_or_create(_db, cls, key_names, keys)
 
     @classmethod
     def valid_as_foreign_identifier(cls, type, id):
@@ -1557,24 +1881,31 @@ class Identifier(Base):
 
         return cls.for_foreign_id(_db, type, identifier_string)
 
-    def equivalent_to(self, data_source, identifier, strength):
+    def equivalent_to(self, data_source, identifier, strength,
+                      equivalency=None):
         """Make one Identifier equivalent to another.
 
         `data_source` is the DataSource that believes the two 
         identifiers are equivalent.
+
+        If the Equivalency has already been looked up (or created), it
+        can be passed in as `equivalency`.
         """
         _db = Session.object_session(self)
         if self == identifier:
             # That an identifier is equivalent to itself is tautological.
             # Do nothing.
             return None
-        eq, new = get_one_or_create(
-            _db, Equivalency,
-            data_source=data_source,
-            input=self,
-            output=identifier,
-            on_multiple='interchangeable'
-        )
+        if equivalency:
+            eq, new = equivalency, False
+        else:
+            eq, new = get_one_or_create(
+                _db, Equivalency,
+                data_source=data_source,
+                input=self,
+                output=identifier,
+                on_multiple='interchangeable'
+            )
         eq.strength=strength
         if new:
             logging.info(
@@ -1628,10 +1959,15 @@ class Identifier(Base):
             _db, [self.id], levels, threshold)
 
     def add_link(self, rel, href, data_source, license_pool=None,
-                 media_type=None, content=None, content_path=None):
+                 media_type=None, content=None, content_path=None,
+                 resource=None, link=None):
         """Create a link between this Identifier and a (potentially new)
         Resource.
 
+        If the Resource for `href` has already been looked up, it can
+        be passed in as `resource`, and likewise the Hyperlink to that
+        Resource as `link`.
+
         TODO: There's some code in metadata_layer for automatically
         fetching, mirroring and scaling Representations as links are
         created. It might be good to move that code into here.
@@ -1646,17 +1982,21 @@ class Identifier(Base):
         # Find or create the Resource.
         if not href:
             href = Hyperlink.generic_uri(data_source, self, rel, content)
-        resource, new_resource = get_one_or_create(
-            _db, Resource, url=href,
-            create_method_kwargs=dict(data_source=data_source)
-        )
+        if resource is None or resource.url != href:
+            resource, new_resource = get_one_or_create(
+                _db, Resource, url=href,
+                create_method_kwargs=dict(data_source=data_source)
+            )
 
         # Find or create the Hyperlink.
-        link, new_link = get_one_or_create(
-            _db, Hyperlink, rel=rel, data_source=data_source,
-            identifier=self, resource=resource,
-            create_method_kwargs=dict(license_pool=license_pool)
-        )
+        if link is not None and link.resource == resource:
+            new_link = False
+        else:
+            link, new_link = get_one_or_create(
+                _db, Hyperlink, rel=rel, data_source=data_source,
+                identifier=self, resource=resource,
+                create_method_kwargs=dict(license_pool=license_pool)
+            )
 
         if content or content_path:
             # We have content for this resource.
@@ -1709,7 +2049,8 @@ class Identifier(Base):
             value=value, weight=weight, is_most_recent=True)[0]
 
     def classify(self, data_source, subject_type, subject_identifier,
-                 subject_name=None, weight=1):
+                 subject_name=None, weight=1, subject=None,
+                 classification=None):
         """Classify this Identifier under a Subject.
 
         :param type: Classification scheme; one of the constants from Subject.
@@ -1722,13 +2063,20 @@ class Identifier(Base):
                     book under this subject. The meaning of this
                     number depends entirely on the source of the
                     information.
+
+        ``subject``: The Subject, if it has already been looked up.
+
+        ``classification``: The Classification connecting this
+                            Identifier to the Subject, if it has
+                            already been looked up (or created).
         """
         _db = Session.object_session(self)
         # Turn the subject type and identifier into a Subject.
         classifications = []
-        subject, is_new = Subject.lookup(
-            _db, subject_type, subject_identifier, subject_name,
-        )
+        if subject is None:
+            subject, is_new = Subject.lookup(
+                _db, subject_type, subject_identifier, subject_name,
+            )
 
         logging.debug(
             "CLASSIFICATION: %s on %s/%s: %s %s/%s (wt=%d)",
@@ -1739,22 +2087,23 @@ class Identifier(Base):
 
         # Use a Classification to connect the Identifier to the
         # Subject.
-        try:
-            classification, is_new = get_one_or_create(
-                _db, Classification,
-                identifier=self,
-                subject=subject,
-                data_source=data_source)
-        except MultipleResultsFound, e:
-            # TODO: This is a hack.
-            all_classifications = _db.query(Classification).filter(
-                Classification.identifier==self,
-                Classification.subject==subject,
-                Classification.data_source==data_source)
-            all_classifications = all_classifications.all()
-            classification = all_classifications[0]
-            for i in all_classifications[1:]:
-                _db.delete(i)
+        if classification is None:
+            try:
+                classification, is_new = get_one_or_create(
+                    _db, Classification,
+                    identifier=self,
+                    subject=subject,
+                    data_source=data_source)
+            except MultipleResultsFound, e:
+                # TODO: This is a hack.
+                all_classifications = _db.query(Classification).filter(
+                    Classification.identifier==self,
+                    Classification.subject==subject,
+                    Classification.data_source==data_source)
+                all_classifications = all_classifications.all()
+                classification = all_classifications[0]
+                for i in all_classifications[1:]:
+                    _db.delete(i)
 
         classification.weight = weight
         return classification
@@ -1788,24 +2137,51 @@ class Identifier(Base):
 
     @classmethod
     def best_cover_for(cls, _db, identifier_ids):
-        # Find all image resources associated with any of
-        # these identifiers.
-        images = cls.resources_for_identifier_ids(
-            _db, identifier_ids, Hyperlink.IMAGE)
-        images = images.join(Resource.representation)
-        images = images.filter(Representation.mirrored_at != None).\
-            filter(Representation.mirror_url != None)
-        images = images.all()
-
-        champions = Resource.best_covers_among(images)
-        if not champions:
-            champion = None
-        elif len(champions) == 1:
-            [champion] = champions
-        else:
-            champion = random.choice(champions)
+        """Find the best cover among the images associated with any of
+        these identifiers.
 
-        return champion, images
+        :return: A 2-tuple (champion, champions). If several covers
+            are equally good, `champions` holds them all and
+            `champion` is chosen from among them at random.
+        """
+        identifier_ids = list(identifier_ids)
+        if not identifier_ids:
+            return None, []
+        candidates = "SELECT 0 AS key, id AS identifier_id FROM unnest(CAST(:identifier_ids AS INTEGER[])) AS id"
+        champions = Resource.best_covers_by_key(
+            _db, candidates, dict(identifier_ids=identifier_ids)
+        ).get(0, [])
+        return Resource.choose_among_champions(champions), champions
+
+    @classmethod
+    def best_covers_for(cls, _db, identifier_ids, distance=0,
+                        threshold=0.5):
+        """Find the best covers for many Identifiers at once.
+
+        :param distance: Also consider the images of identifiers
+            equivalent to each Identifier up to this many levels away.
+        :return: A dictionary mapping each Identifier ID to a list of
+            its equally good best covers. An Identifier with no usable
+            cover is left out.
+        """
+        identifier_ids = list(identifier_ids)
+        if not identifier_ids:
+            return {}
+        params = dict(
+            identifier_ids=identifier_ids, distance=distance,
+            threshold=threshold
+        )
+        if distance > 0:
+            candidates = """SELECT identifiers.id AS key,
+       equivalents.recursive_equivalent AS identifier_id
+FROM identifiers,
+     fn_recursive_equivalents(
+         identifiers.id, :distance, :threshold
+     ) AS equivalents
+WHERE identifiers.id = ANY(:identifier_ids)"""
+        else:
+            candidates = "SELECT id AS key, id AS identifier_id FROM unnest(CAST(:identifier_ids AS INTEGER[])) AS id"
+        return Resource.best_covers_by_key(_db, candidates, params)
 
     @classmethod
     def evaluate_summary_quality(cls, _db, identifier_ids,
@@ -2492,6 +2868,15 @@ class Edition(Base):
     ELECTRONIC_FORMAT = u"Electronic"
     CODEX_FORMAT = u"Codex"
 
+    # The WorkIDCalculator grouping category for each medium.
+    GROUPING_CATEGORY_FOR_MEDIUM = {
+        BOOK_MEDIUM : "book",
+        AUDIO_MEDIUM : "book",
+        MUSIC_MEDIUM : "music",
+        PERIODICAL_MEDIUM : "book",
+        VIDEO_MEDIUM : "movie",
+    }
+
     medium_to_additional_type = {
         BOOK_MEDIUM : u"http://schema.org/Book",
         AUDIO_MEDIUM : u"http://schema.org/AudioObject",
@@ -2777,8 +3162,13 @@ class Edition(Base):
             )
 
     def add_contributor(self, name, roles, aliases=None, lc=None, viaf=None,
-                        **kwargs):
-        """Assign a contributor to this Edition."""
+                        contributions=None, **kwargs):
+        """Assign a contributor to this Edition.
+
+        :param contributions: A dictionary mapping roles to
+            Contributions of this contributor to this Edition that have
+            already been looked up (or created).
+        """
         _db = Session.object_session(self)
         if isinstance(roles, basestring):
             roles = [roles]            
@@ -2795,7 +3185,10 @@ class Edition(Base):
                 contributor = contributor[0]
 
         # Then add their Contributions.
+        contributions = contributions or {}
         for role in roles:
+            if role in contributions:
+                continue
             contribution, was_new = get_one_or_create(
                 _db, Contribution, edition=self, contributor=contributor,
                 role=role)
@@ -2881,12 +3274,10 @@ class Edition(Base):
 
     def best_cover_within_distance(self, distance, threshold=0.5):
         _db = Session.object_session(self)
-        identifier_ids = [self.primary_identifier.id]
-        if distance > 0:
-            identifier_ids = Identifier.recursively_equivalent_identifier_ids(
-                _db, identifier_ids, distance, threshold=threshold)
-
-        return Identifier.best_cover_for(_db, identifier_ids)
+        champions = Identifier.best_covers_for(
+            _db, [self.primary_identifier.id], distance, threshold
+        ).get(self.primary_identifier.id, [])
+        return Resource.choose_among_champions(champions), champions
 
     @property
     def title_for_permanent_work_id(self):
@@ -2916,17 +3307,7 @@ class Edition(Base):
             return
 
         author = self.author_for_permanent_work_id
-
-        if self.medium == Edition.BOOK_MEDIUM:
-            medium = "book"
-        elif self.medium == Edition.AUDIO_MEDIUM:
-            medium = "book"
-        elif self.medium == Edition.MUSIC_MEDIUM:
-            medium = "music"
-        elif self.medium == Edition.PERIODICAL_MEDIUM:
-            medium = "book"
-        elif self.medium == Edition.VIDEO_MEDIUM:
-            medium = "movie"
+        medium = self.GROUPING_CATEGORY_FOR_MEDIUM[self.medium]
 
         w = WorkIDCalculator
         norm_title = w.normalize_title(title)
@@ -2955,6 +3336,72 @@ class Edition(Base):
         return WorkIDCalculator.permanent_id(
             norm_title, norm_author, medium)
 
+    @classmethod
+    def calculate_permanent_work_ids(cls, _db, editions, processes=1):
+        """Recalculate the permanent work IDs of many Editions at once.
+
+        The results are the same as calling calculate_permanent_work_id()
+        on each Edition, but each distinct title and author is
+        normalized only once, and all the changed IDs are written with
+        a single UPDATE.
+
+        :param processes: Normalize titles and authors in a pool of
+            this many processes.
+        :return: The number of Editions whose permanent work ID changed.
+        """
+        to_calculate = []
+        items = []
+        changes = {}
+        for edition in editions:
+            title = edition.title_for_permanent_work_id
+            if not title:
+                # If a book has no title, it has no permanent work ID.
+                if edition.permanent_work_id is not None:
+                    changes[edition] = None
+                continue
+            to_calculate.append(edition)
+            items.append((
+                title, edition.author_for_permanent_work_id,
+                cls.GROUPING_CATEGORY_FOR_MEDIUM[edition.medium]
+            ))
+
+        ids = WorkIDCalculator.permanent_ids(items, processes)
+        for edition, (title, author, medium), permanent_work_id in zip(
+                to_calculate, items, ids):
+            if permanent_work_id != edition.permanent_work_id:
+                logging.info(
+                    "Permanent work ID for %r: %s/%s/%s -> %s (was %s)",
+                    edition.id, title, author, medium, permanent_work_id,
+                    edition.permanent_work_id
+                )
+                changes[edition] = permanent_work_id
+
+        rows = []
+        for edition, permanent_work_id in changes.items():
+            if edition.id is None:
+                # This Edition hasn't been written to the database
+                # yet, so it'll get its ID when it is.
+                edition.permanent_work_id = permanent_work_id
+            else:
+                rows.append((edition.id, permanent_work_id))
+                set_committed_value(
+                    edition, 'permanent_work_id', permanent_work_id
+                )
+        if rows:
+            values = []
+            params = dict()
+            for i, (edition_id, permanent_work_id) in enumerate(rows):
+                values.append("(:id%d, :pwid%d)" % (i, i))
+                params['id%d' % i] = edition_id
+                params['pwid%d' % i] = permanent_work_id
+            _db.execute(
+                "UPDATE editions SET permanent_work_id = v.pwid "
+                "FROM (VALUES %s) AS v(id, pwid) "
+                "WHERE editions.id = v.id" % ", ".join(values),
+                params
+            )
+        return len(changes)
+
     UNKNOWN_AUTHOR = u"[Unknown]"
 
 
@@ -3043,44 +3490,58 @@ class Edition(Base):
 
     def choose_cover(self):
         """Try to find a cover that can be used for this Edition."""
+        _db = Session.object_session(self)
+        Edition.choose_covers(_db, [self])
+
+    @classmethod
+    def choose_covers(cls, _db, editions):
+        """Try to find covers for many Editions at once.
+
+        This makes one cover-ranking query for all of the Editions,
+        and another for those that didn't get a cover from it.
+        """
+        remaining = [
+            edition for edition in editions if edition.primary_identifier
+        ]
         for distance in (0, 5):
-            # If there's a cover directly associated with the
+            if not remaining:
+                break
+            # If there's a cover directly associated with an
             # Edition's primary ID, use it. Otherwise, find the
             # best cover associated with any related identifier.
-            best_cover, covers = self.best_cover_within_distance(distance)
-
-            if best_cover:
-                if not best_cover.representation:
-                    logging.warn(
-                        "Best cover for %r has no representation!",
-                        self.primary_identifier,
-                    )
+            best_covers = Identifier.best_covers_for(
+                _db, set(e.primary_identifier.id for e in remaining),
+                distance
+            )
+            not_found = []
+            for edition in remaining:
+                best_cover = Resource.choose_among_champions(
+                    best_covers.get(edition.primary_identifier.id, [])
+                )
+                if best_cover:
+                    edition.set_cover(best_cover)
                 else:
-                    rep = best_cover.representation
-                    if not rep.mirrored_at and not rep.thumbnails:
-                        logging.warn(
-                            "Best cover for %r (%s) was never mirrored or thumbnailed!",
-                            self.primary_identiifer, 
-                            rep.url
-                        )
-                self.set_cover(best_cover)
-                break
-        else:
+                    not_found.append(edition)
+            remaining = not_found
+
+        for edition in remaining:
             # No cover has been found. If the Edition currently references
             # a cover, it has since been rejected or otherwise removed.
             # All cover details need to be removed.
-            cover_info = [self.cover, self.cover_full_url, self.cover_thumbnail_url]
+            cover_info = [edition.cover, edition.cover_full_url,
+                          edition.cover_thumbnail_url]
             if any(cover_info):
-                self.cover = None
-                self.cover_full_url = None
-                self.cover_thumbnail_url = None
+                edition.cover = None
+                edition.cover_full_url = None
+                edition.cover_thumbnail_url = None
 
         # Whether or not we succeeded in setting the cover,
         # record the fact that we tried.
-        CoverageRecord.add_for(
-            self, data_source=self.data_source,
-            operation=CoverageRecord.CHOOSE_COVER_OPERATION
-        )
+        for edition in editions:
+            CoverageRecord.add_for(
+                edition, data_source=edition.data_source,
+                operation=CoverageRecord.CHOOSE_COVER_OPERATION
+            )
 
 Index("ix_editions_data_source_id_identifier_id", Edition.data_source_id, Edition.primary_identifier_id, unique=True)
 
@@ -3928,20 +4389,9 @@ class Work(Base):
             # license source. Commercial data sources have higher
             # default quality, because it's presumed that a librarian
             # put some work into deciding which books to buy.
-            default_quality = None
-            for source in licensed_data_sources:
-                q = self.default_quality_by_data_source.get(
-                    source.name, None
-                )
-                if q is None:
-                    continue
-                if default_quality is None or q > default_quality:
-                    default_quality = q                    
-
-            if not default_quality:
-                # if we still haven't found anything of a quality measurement, 
-                # then at least make it an integer zero, not none.
-                default_quality = 0
+            default_quality = self.default_quality_for_data_sources(
+                [source.name for source in licensed_data_sources]
+            )
             self.calculate_quality(identifier_ids, default_quality)
 
         if self.summary_text:
@@ -3966,6 +4416,12 @@ class Work(Base):
             # change it.
             self.last_update_time = datetime.datetime.utcnow()
 
+            # Any cached feed that includes this work is now out of date.
+            if self.id:
+                CachedFeed.mark_dirty_on_flush(
+                    Session.object_session(self), [self.id]
+                )
+
         if changed or policy.regenerate_opds_entries:
             self.calculate_opds_entries()
 
@@ -4077,6 +4533,20 @@ class Work(Base):
 
 
     def update_external_index(self, client, add_coverage_record=True):
+        if (Configuration.instance and Configuration.search_index_update()
+            == Configuration.SEARCH_INDEX_UPDATE_QUEUE):
+            # The SearchIndexUpdateMonitor will send the change to the
+            # search index along with many others.
+            _db = Session.object_session(self)
+            if not self.id:
+                _db.flush()
+            if self.presentation_ready:
+                operation = SearchIndexChange.UPDATE
+            else:
+                operation = SearchIndexChange.DELETE
+            SearchIndexChange.enqueue(_db, [self.id], operation)
+            return False
+
         client = client or ExternalSearchIndex()
         args = dict(index=client.works_index,
                     doc_type=client.work_document_type,
@@ -4144,6 +4614,88 @@ class Work(Base):
         else:
             self.set_presentation_ready(search_index_client=search_index_client)
 
+    @classmethod
+    def default_quality_for_data_sources(cls, data_source_names):
+        """The quality to assume for a work that has no quality
+        measurements, given the names of the data sources that license it.
+        """
+        default_quality = None
+        for name in data_source_names:
+            q = cls.default_quality_by_data_source.get(name, None)
+            if q is None:
+                continue
+            if default_quality is None or q > default_quality:
+                default_quality = q
+
+        if not default_quality:
+            # if we still haven't found anything of a quality measurement, 
+            # then at least make it an integer zero, not none.
+            default_quality = 0
+        return default_quality
+
+    @classmethod
+    def calculate_quality_for_works(cls, _db, work_ids):
+        """Recalculate the quality of many Works at once.
+
+        The results are the same as calling calculate_quality() on
+        each Work with all of its equivalent identifiers, but the
+        measurements are averaged by the database and all the
+        qualities are written with a single UPDATE.
+
+        :return: A dictionary mapping each Work ID to its new quality.
+        """
+        work_ids = list(work_ids)
+        if not work_ids:
+            return {}
+
+        # Gutenberg is left out here for the same reason it's left
+        # out in calculate_presentation().
+        data_source_names = defaultdict(list)
+        qu = _db.query(LicensePool.work_id, DataSource.name).join(
+            LicensePool.data_source).filter(
+                LicensePool.work_id.in_(work_ids)).filter(
+                    DataSource.name != DataSource.GUTENBERG)
+        for work_id, name in qu:
+            data_source_names[work_id].append(name)
+
+        averages = Measurement.average_normalized_values_by_work(
+            _db, work_ids
+        )
+        qualities = {}
+        for work_id in work_ids:
+            default_quality = cls.default_quality_for_data_sources(
+                data_source_names[work_id]
+            )
+            popularity, rating, quality = averages.get(
+                work_id, (None, None, None)
+            )
+            qualities[work_id] = Measurement.combined_quality(
+                popularity, rating, quality, default_value=default_quality
+            )
+
+        values = []
+        params = dict()
+        for i, (work_id, quality) in enumerate(qualities.items()):
+            values.append("(:id%d, CAST(:quality%d AS DOUBLE PRECISION))" % (i, i))
+            params['id%d' % i] = work_id
+            params['quality%d' % i] = quality
+        _db.execute(
+            "UPDATE works SET quality = v.quality "
+            "FROM (VALUES %s) AS v(id, quality) "
+            "WHERE works.id = v.id" % ", ".join(values),
+            params
+        )
+
+        # Works already in the session shouldn't keep their old quality.
+        for obj in _db.identity_map.values():
+            if isinstance(obj, Work) and obj.id in qualities:
+                set_committed_value(obj, 'quality', qualities[obj.id])
+
+        WorkCoverageRecord.bulk_add(
+            _db, work_ids, WorkCoverageRecord.QUALITY_OPERATION
+        )
+        return qualities
+
     def calculate_quality(self, identifier_ids, default_quality=0):
         _db = Session.object_session(self)
         quantities = [Measurement.POPULARITY, Measurement.RATING,
@@ -4676,6 +5228,19 @@ class Measurement(Base):
         popularity = cls._average_normalized_value(popularities)
         rating = cls._average_normalized_value(ratings)
         quality = cls._average_normalized_value(qualities)
+        return cls.combined_quality(
+            popularity, rating, quality, popularity_weight, rating_weight,
+            default_value
+        )
+
+    @classmethod
+    def combined_quality(cls, popularity, rating, quality,
+                         popularity_weight=0.3, rating_weight=0.7,
+                         default_value=0):
+        """Combine average normalized popularity, rating and quality
+        values (any of which may be None) into an overall measure of
+        quality.
+        """
         if popularity is None and rating is None and quality is None:
             # We have absolutely no idea about the quality of this work.
             return default_value
@@ -4724,6 +5289,124 @@ class Measurement(Base):
         else:
             return None
 
+    @classmethod
+    def average_normalized_values_by_work(cls, _db, work_ids, levels=5,
+                                          threshold=0.50):
+        """Find the average normalized popularity, rating and quality
+        of many Works at once.
+
+        This does in a single query what normalized_value() and
+        _average_normalized_value() do for the measurements of one
+        Work: the percentile lists and rating scales are sent along
+        as a lookup table, and the weighted averages are calculated
+        by the database, grouped by Work.
+
+        :return: A dictionary mapping each Work ID to a 3-tuple
+            (popularity, rating, quality). A Work with no relevant
+            measurements is left out.
+        """
+        work_ids = list(work_ids)
+        if not work_ids:
+            return {}
+        params = dict(
+            work_ids=work_ids, levels=levels, threshold=threshold,
+            popularity=cls.POPULARITY, downloads=cls.DOWNLOADS,
+            rating=cls.RATING, quality=cls.QUALITY,
+            metadata_wrangler=DataSource.METADATA_WRANGLER,
+        )
+
+        # Build a lookup table of the percentile lists and rating
+        # scales, keyed by data source name and quantity.
+        scales = []
+        tables = [
+            (cls.POPULARITY, cls.POPULARITY_PERCENTILES, False),
+            (cls.DOWNLOADS, cls.DOWNLOAD_PERCENTILES, False),
+            (cls.RATING, cls.RATING_SCALES, True),
+        ]
+        for quantity, table, is_scale in tables:
+            for data_source_name, values in table.items():
+                i = len(scales)
+                params['source%d' % i] = data_source_name
+                params['quantity%d' % i] = quantity
+                if is_scale:
+                    params['percentiles%d' % i] = None
+                    params['min%d' % i], params['max%d' % i] = values
+                else:
+                    params['percentiles%d' % i] = values
+                    params['min%d' % i] = params['max%d' % i] = None
+                scales.append(
+                    "(:source%(i)d, :quantity%(i)d, "
+                    "CAST(:percentiles%(i)d AS DOUBLE PRECISION[]), "
+                    "CAST(:min%(i)d AS DOUBLE PRECISION), "
+                    "CAST(:max%(i)d AS DOUBLE PRECISION))" % dict(i=i)
+                )
+
+        # The CASE expression is normalized_value(). Counting the
+        # percentiles below a value finds the same position as
+        # bisect_left().
+        query = """
+WITH scales(data_source, quantity, percentiles, scale_min, scale_max) AS (
+    VALUES %s
+),
+work_identifiers AS (
+    SELECT DISTINCT licensepools.work_id, equivalents.recursive_equivalent
+    FROM licensepools,
+         fn_recursive_equivalents(
+             licensepools.identifier_id, :levels, :threshold
+         ) AS equivalents
+    WHERE licensepools.work_id = ANY(:work_ids)
+),
+normalized AS (
+    SELECT work_identifiers.work_id,
+           CASE WHEN measurements.quantity_measured IN (:popularity, :downloads)
+                THEN 'popularity'
+                WHEN measurements.quantity_measured = :rating
+                THEN 'rating'
+                ELSE 'quality'
+           END AS category,
+           measurements.weight,
+           CASE WHEN measurements.normalized_value <> 0
+                THEN measurements.normalized_value
+                WHEN measurements.value IS NULL OR measurements.value = 0
+                THEN NULL
+                WHEN scales.percentiles IS NOT NULL
+                THEN (SELECT count(*) FROM unnest(scales.percentiles) AS p
+                      WHERE p < measurements.value)::DOUBLE PRECISION * 0.01
+                WHEN scales.scale_min IS NOT NULL
+                THEN (measurements.value - scales.scale_min)
+                     / (scales.scale_max - scales.scale_min)
+                WHEN datasources.name = :metadata_wrangler
+                THEN measurements.value
+                ELSE measurements.normalized_value
+           END AS value
+    FROM work_identifiers
+    JOIN measurements
+         ON measurements.identifier_id = work_identifiers.recursive_equivalent
+    JOIN datasources ON datasources.id = measurements.data_source_id
+    LEFT JOIN scales
+         ON scales.data_source = datasources.name
+         AND scales.quantity = measurements.quantity_measured
+    WHERE measurements.is_most_recent = true
+    AND measurements.quantity_measured IN (
+        :popularity, :downloads, :rating, :quality
+    )
+)
+SELECT work_id, category, sum(value * weight) / nullif(sum(weight), 0)
+FROM normalized
+WHERE value IS NOT NULL
+GROUP BY work_id, category
+""" % ", ".join(scales)
+
+        categories = ['popularity', 'rating', 'quality']
+        averages = {}
+        for work_id, category, average in _db.execute(query, params):
+            if work_id not in averages:
+                averages[work_id] = [None, None, None]
+            averages[work_id][categories.index(category)] = average
+        return dict(
+            (work_id, tuple(values)) for work_id, values in averages.items()
+        )
+
     @property
     def normalized_value(self):
         if self._normalized_value:
@@ -5148,6 +5831,141 @@ class Resource(Base):
 
         return champions
 
+    @classmethod
+    def choose_among_champions(cls, champions):
+        """Pick one of several equally good covers at random.
+
+        The chosen cover's quality is brought up to date along the way.
+        """
+        if not champions:
+            return None
+        if len(champions) == 1:
+            [champion] = champions
+        else:
+            champion = random.choice(champions)
+        champion.quality_as_thumbnail_image
+        return champion
+
+    @classmethod
+    def best_covers_by_key(cls, _db, candidates, params):
+        """Rank cover images in the database and load only the winners.
+
+        This calculates the same quality as quality_as_thumbnail_image
+        and applies the same rules as best_covers_among(), using the
+        thumbnail_size_quality_penalty stored with each Representation.
+
+        :param candidates: A SQL query returning (key, identifier_id)
+            rows. The images associated with each identifier compete
+            against the other images with the same key.
+        :param params: Parameters for the `candidates` query.
+        :return: A dictionary mapping each key to a list of its equally
+            good best covers.
+        """
+        _db.flush()
+        params = dict(params)
+        params.update(
+            image=Hyperlink.IMAGE,
+            minimum_quality=cls.MINIMUM_IMAGE_QUALITY,
+            estimated_weight=cls.ESTIMATED_QUALITY_WEIGHT,
+        )
+
+        # Scale each image by its source, as quality_as_thumbnail_image
+        # does.
+        source_factors = [
+            (DataSource.GUTENBERG_COVER_GENERATOR, 0.60),
+            (DataSource.GUTENBERG, 0.50),
+            (DataSource.OPEN_LIBRARY, 0.25),
+        ]
+        for i, name in enumerate(DataSource.PRESENTATION_EDITION_PRIORITY):
+            source_factors.append((name, i+2))
+        source_cases = []
+        for i, (name, factor) in enumerate(source_factors):
+            params['source%d' % i] = name
+            params['factor%d' % i] = factor
+            source_cases.append(
+                "WHEN :source%(i)d THEN CAST(:factor%(i)d AS DOUBLE PRECISION)" % dict(i=i)
+            )
+
+        # A lower number is a preferred media type, as in
+        # image_type_priority.
+        media_type_cases = []
+        for i, media_type in enumerate(Representation.IMAGE_MEDIA_TYPES):
+            params['media_type%d' % i] = media_type
+            media_type_cases.append(
+                "WHEN :media_type%(i)d THEN %(i)d" % dict(i=i)
+            )
+
+        # The quality is update_quality()'s combination of this
+        # estimated quality with the human votes.
+        query = """
+WITH candidates AS (
+    %(candidates)s
+),
+estimates AS (
+    SELECT DISTINCT candidates.key, resources.id AS resource_id,
+           coalesce(representations.thumbnail_size_quality_penalty, 1)
+           * CASE datasources.name %(source_cases)s ELSE 1 END
+           AS estimated_quality,
+           coalesce(resources.voted_quality, 0)
+           * coalesce(resources.votes_for_quality, 0) AS voted_quality,
+           coalesce(resources.votes_for_quality, 0) AS votes,
+           CASE representations.media_type %(media_type_cases)s END
+           AS media_type_priority
+    FROM candidates
+    JOIN hyperlinks
+         ON hyperlinks.identifier_id = candidates.identifier_id
+         AND hyperlinks.rel = :image
+    JOIN resources ON resources.id = hyperlinks.resource_id
+    JOIN representations
+         ON representations.id = resources.representation_id
+    LEFT JOIN datasources ON datasources.id = resources.data_source_id
+    WHERE representations.mirrored_at IS NOT NULL
+    AND representations.mirror_url IS NOT NULL
+),
+qualities AS (
+    SELECT key, resource_id, media_type_priority,
+           CASE WHEN voted_quality < 0
+                AND estimated_quality * :estimated_weight + voted_quality > 0
+                THEN -(estimated_quality * :estimated_weight + voted_quality)
+                ELSE estimated_quality * :estimated_weight + voted_quality
+           END / (:estimated_weight + votes) AS quality
+    FROM estimates
+),
+ranked AS (
+    SELECT key, resource_id,
+           rank() OVER (
+               PARTITION BY key
+               ORDER BY quality DESC, media_type_priority ASC NULLS LAST
+           ) AS rank
+    FROM qualities
+    WHERE quality >= :minimum_quality
+)
+SELECT key, resource_id FROM ranked WHERE rank = 1
+""" % dict(
+    candidates=candidates,
+    source_cases=" ".join(source_cases),
+    media_type_cases=" ".join(media_type_cases),
+)
+        champion_ids = defaultdict(list)
+        for key, resource_id in _db.execute(query, params):
+            champion_ids[key].append(resource_id)
+        if not champion_ids:
+            return {}
+
+        all_ids = set()
+        for resource_ids in champion_ids.values():
+            all_ids.update(resource_ids)
+        resources = dict(
+            (resource.id, resource) for resource in
+            _db.query(Resource).filter(Resource.id.in_(all_ids)).options(
+                joinedload('representation')
+            )
+        )
+        return dict(
+            (key, [resources[resource_id] for resource_id in resource_ids])
+            for key, resource_ids in champion_ids.items()
+        )
+
     @property
     def quality_as_thumbnail_image(self):
         """Determine this image's suitability for use as a thumbnail image.
@@ -5187,6 +6005,9 @@ class Genre(Base):
     Much, much more general than Classification.
     """
     __tablename__ = 'genres'
+
+    # Genre.lookup is called constantly.
+    _lookup_cache = LookupCache()
     id = Column(Integer, primary_key=True)
     name = Column(Unicode)
 
@@ -5211,12 +6032,16 @@ class Genre(Base):
     def lookup(cls, _db, name, autocreate=False):
         if isinstance(name, GenreData):
             name = name.name
+        result = cls._lookup_cache.get(_db, name)
+        if result:
+            return result, False
         args = (_db, Genre)
         if autocreate:
             result, new = get_one_or_create(*args, name=name)
         else:
             result = get_one(*args, name=name)
             new = False
+        cls._lookup_cache.remember(_db, name, result)
         if result is None:
             logging.getLogger().error('"%s" is not a recognized genre.', name)
         return result, new
@@ -5470,15 +6295,119 @@ class Subject(Base):
                 _db.commit()
         _db.commit()
 
-    def assign_to_genre(self):
-        """Assign this subject to a genre."""
-        classifier = Classifier.classifiers.get(self.type, None)
-        if not classifier:
-            return
-        self.checked = True
-        log = logging.getLogger("Subject-genre assignment")
+    @classmethod
+    def bulk_assign_to_genres(cls, _db, type_restriction=None, force=False,
+                              batch_size=10000, processes=1):
+        """Do what assign_to_genres() does, without loading a single
+        Subject object.
+
+        The (type, identifier, name) of each subject is read in batches
+        of `batch_size`, paging through the table by ID, and classified
+        in a pool of processes if `processes` is greater than 1. Each
+        batch of results is written with a single UPDATE and committed,
+        so an interrupted run keeps the work it's done and no
+        transaction stays open for the whole table.
+
+        :return: The number of subjects checked.
+        """
+        qu = _db.query(
+            Subject.id, Subject.type, Subject.identifier, Subject.name
+        ).filter(Subject.locked==False).filter(
+            Subject.type.in_(Classifier.classifiers.keys())
+        )
+        if type_restriction:
+            qu = qu.filter(Subject.type==type_restriction)
+        if not force:
+            qu = qu.filter(Subject.checked==False)
+        qu = qu.order_by(Subject.id)
+
+        pool = None
+        if processes > 1:
+            pool = multiprocessing.Pool(processes)
+        counter = 0
+        last_id = None
+        try:
+            while True:
+                page = qu
+                if last_id is not None:
+                    page = page.filter(Subject.id > last_id)
+                batch = [tuple(row) for row in page.limit(batch_size)]
+                if not batch:
+                    break
+                counter += cls._assign_batch_to_genres(
+                    _db, batch, pool, processes)
+                _db.commit()
+                last_id = batch[-1][0]
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        return counter
+
+    @classmethod
+    def _assign_batch_to_genres(cls, _db, batch, pool, processes):
+        """Classify a batch of (id, type, identifier, name) tuples and
+        write the results with one UPDATE.
+        """
+        if pool:
+            chunksize = max(len(batch) / (processes * 4), 1)
+            results = pool.map(_classify_subject_row, batch, chunksize)
+        else:
+            results = map(_classify_subject_row, batch)
+
+        values = []
+        params = dict()
+        for i, (subject_id, classification) in enumerate(results):
+            genre_name, audience, target_age, fiction = classification
+            genre_id = None
+            if genre_name:
+                genre, was_new = Genre.lookup(_db, genre_name, True)
+                genre_id = genre.id
+            values.append(
+                "(:id%(i)d, CAST(:genre_id%(i)d AS INTEGER), "
+                "CAST(:fiction%(i)d AS BOOLEAN), "
+                "CAST(:audience%(i)d AS audience), "
+                "CAST(:min_age%(i)d AS INTEGER), "
+                "CAST(:max_age%(i)d AS INTEGER))" % dict(i=i)
+            )
+            params['id%d' % i] = subject_id
+            params['genre_id%d' % i] = genre_id
+            params['fiction%d' % i] = fiction
+            params['audience%d' % i] = audience
+            params['min_age%d' % i], params['max_age%d' % i] = target_age
+        _db.execute(
+            "UPDATE subjects SET genre_id = v.genre_id, "
+            "fiction = v.fiction, audience = v.audience, "
+            "target_age = int4range(v.min_age, v.max_age, '[]'), "
+            "checked = true "
+            "FROM (VALUES %s) "
+            "AS v(id, genre_id, fiction, audience, min_age, max_age) "
+            "WHERE subjects.id = v.id" % ", ".join(values),
+            params
+        )
+
+        # Subjects already in the session shouldn't keep their old
+        # classification.
+        subject_ids = set(row[0] for row in batch)
+        for obj in _db.identity_map.values():
+            if isinstance(obj, Subject) and obj.id in subject_ids:
+                _db.expire(obj)
+        return len(batch)
+
+    @classmethod
+    def classification_for(cls, type, identifier, name):
+        """Find the genre, audience, target age and fiction status
+        implied by a subject, without needing a Subject object.
 
-        genredata, audience, target_age, fiction = classifier.classify(self)
+        :return: A 4-tuple (genre_name, audience, target_age, fiction),
+            or None if there's no classifier for this type of subject.
+        """
+        classifier = Classifier.classifiers.get(type, None)
+        if not classifier:
+            return None
+        genredata, audience, target_age, fiction = classifier.classify(
+            _ClassifiableSubject(type, identifier, name)
+        )
         # If the genre is erotica, the audience will always be ADULTS_ONLY,
         # no matter what the classifier says.
         if genredata == Erotica:
@@ -5492,8 +6421,25 @@ class Subject(Base):
             audience = Classifier.default_audience_for_target_age(target_age)
 
         if genredata:
+            genre_name = genredata.name
+        else:
+            genre_name = None
+        return genre_name, audience, target_age, fiction
+
+    def assign_to_genre(self):
+        """Assign this subject to a genre."""
+        classification = self.classification_for(
+            self.type, self.identifier, self.name
+        )
+        if not classification:
+            return
+        self.checked = True
+        log = logging.getLogger("Subject-genre assignment")
+
+        genre_name, audience, target_age, fiction = classification
+        if genre_name:
             _db = Session.object_session(self)
-            genre, was_new = Genre.lookup(_db, genredata.name, True)
+            genre, was_new = Genre.lookup(_db, genre_name, True)
         else:
             genre = None
         if genre != self.genre:
@@ -5527,6 +6473,20 @@ class Subject(Base):
         self.target_age = tuple_to_numericrange(target_age)
 
 
+# Just enough of a Subject to be classified.
+_ClassifiableSubject = namedtuple(
+    '_ClassifiableSubject', ['type', 'identifier', 'name']
+)
+
+def _classify_subject_row(row):
+    """Classify an (id, type, identifier, name) tuple.
+
+    This is a module-level function so it can be run in a process pool.
+    """
+    subject_id, type, identifier, name = row
+    return subject_id, Subject.classification_for(type, identifier, name)
+
+
 class Classification(Base):
     """The assignment of a Identifier to a Subject."""
     __tablename__ = 'classifications'
@@ -5689,8 +6649,32 @@ class CachedFeed(Base):
     # A 'page' feed is associated with a set of values for pagination.
     pagination = Column(Unicode, nullable=False)
 
-    # The content of the feed.
-    content = Column(Unicode, nullable=True)
+    # The content of the feed, compressed with the HTTP content-coding
+    # named in content_encoding. This is deferred so that a client
+    # that already has the current version of the feed can be told
+    # so without the content ever being loaded.
+    compressed_content = deferred(Column(Binary, nullable=True))
+    content_encoding = Column(Unicode, nullable=True)
+
+    # Feeds cached before compression was introduced keep their
+    # content here, uncompressed.
+    _content = deferred(Column("content", Unicode, nullable=True))
+
+    # A hash of the uncompressed content, used as the feed's ETag.
+    content_hash = Column(Unicode, nullable=True)
+
+    # The IDs of the works in the feed, and of the custom lists the
+    # feed's lane draws its works from. When one of these works or
+    # lists changes, the feed is marked dirty, and it's regenerated
+    # the next time it's requested, however recently it was cached.
+    work_ids = Column(ARRAY(Integer), nullable=True)
+    list_ids = Column(ARRAY(Integer), nullable=True)
+    dirty = Column(Boolean, default=False, nullable=False)
+
+    # When the feed was last marked dirty. A feed generated from the
+    # materialized views stays dirty until the views have been
+    # refreshed since then.
+    dirty_at = Column(DateTime, nullable=True)
 
     # A feed may be associated with a LicensePool.
     license_pool_id = Column(Integer, ForeignKey('licensepools.id'),
@@ -5704,6 +6688,24 @@ class CachedFeed(Base):
 
     log = logging.getLogger("CachedFeed")
 
+    # The key in Session.info under which mark_dirty_on_flush() keeps
+    # the IDs of works whose feeds should be marked dirty.
+    PENDING_DIRTY_WORK_IDS = 'cachedfeed_pending_dirty_work_ids'
+
+    # When a request claims the job of regenerating a feed, the claim
+    # lasts this many seconds, or until the feed is updated.
+    GENERATION_TIMEOUT = 60
+
+    # A request that needs a feed someone else is generating, and has
+    # no old version to fall back on, waits this many seconds for the
+    # feed to show up, checking every GENERATION_POLL_INTERVAL seconds.
+    GENERATION_WAIT = 5
+    GENERATION_POLL_INTERVAL = 0.25
+
+    # Claims on feeds being regenerated by this process.
+    _generating = {}
+    _generating_lock = threading.Lock()
+
     @classmethod
     def fetch(cls, _db, lane, type, facets, pagination, annotator,
               force_refresh=False, max_age=None):
@@ -5742,17 +6744,23 @@ class CachedFeed(Base):
 
         # Get a CachedFeed object. We will either return its .content,
         # or update its .content.
-        constraint_clause = and_(cls.content!=None, cls.timestamp!=None)
-        feed, is_new = get_one_or_create(
-            _db, cls,
-            on_multiple='interchangeable',
-            constraint=constraint_clause,
+        constraint_clause = and_(
+            or_(cls.compressed_content!=None, cls._content!=None),
+            cls.timestamp!=None
+        )
+        key = dict(
             lane_name=lane_name,
             license_pool=license_pool,
             type=type,
             languages=languages_key,
             facets=facets_key,
-            pagination=pagination_key)
+            pagination=pagination_key
+        )
+        feed, is_new = get_one_or_create(
+            _db, cls,
+            on_multiple='interchangeable',
+            constraint=constraint_clause,
+            **key)
 
         if force_refresh is True:
             # No matter what, we've been directed to treat this
@@ -5762,9 +6770,19 @@ class CachedFeed(Base):
         if max_age is Configuration.CACHE_FOREVER:
             # This feed is so expensive to generate that it must be cached
             # forever (unless force_refresh is True).
-            if not is_new and feed.content:
-                # Cacheable!
-                return feed, True
+            if not is_new and feed.has_content:
+                if not feed.dirty:
+                    # Cacheable!
+                    return feed, True
+                # Something in the feed has changed. One request
+                # regenerates it; the rest get the old version.
+                return cls._single_flight(
+                    _db, feed, lambda: get_one(
+                        _db, cls, on_multiple='interchangeable',
+                        constraint=and_(constraint_clause, cls.dirty==False),
+                        **key
+                    )
+                )
             else:
                 # We're supposed to generate this feed, but as a group
                 # feed, it's too expensive.
@@ -5784,18 +6802,256 @@ class CachedFeed(Base):
             # This feed is cheap enough to generate on the fly.
             cutoff = datetime.datetime.utcnow() - max_age
             fresh = False
-            if feed.timestamp and feed.content:
+            if feed.timestamp and feed.has_content and not feed.dirty:
                 if feed.timestamp >= cutoff:
                     fresh = True
+            if not fresh:
+                def find_fresh_feed():
+                    return get_one(
+                        _db, cls, on_multiple='interchangeable',
+                        constraint=and_(
+                            constraint_clause, cls.timestamp >= cutoff,
+                            cls.dirty==False
+                        ),
+                        **key
+                    )
+                feed, fresh = cls._single_flight(_db, feed, find_fresh_feed)
             return feed, fresh
 
         # Either there is no cached feed or it's time to update it.
         return feed, False
 
-    def update(self, _db, content):
+    @classmethod
+    def _single_flight(cls, _db, feed, find_fresh_feed):
+        """Make sure that when many requests find the same feed out of
+        date at once, only one of them regenerates it.
+
+        :param feed: A CachedFeed that needs to be regenerated.
+        :param find_fresh_feed: A function that looks for an up-to-date
+            version of the feed, generated by some other request.
+        :return: A 2-tuple (feed, usable). If `usable` is False, the
+            caller has the job of regenerating the feed.
+        """
+        if feed.claim_generation(_db):
+            return feed, False
+
+        if feed.has_content:
+            # Someone else is regenerating this feed. In the meantime,
+            # the out-of-date version will have to do.
+            return feed, True
+
+        # There's no old version to fall back on. Wait a little while
+        # for the other request to finish.
+        deadline = time.time() + cls.GENERATION_WAIT
+        while time.time() < deadline:
+            time.sleep(cls.GENERATION_POLL_INTERVAL)
+            fresh_feed = find_fresh_feed()
+            if fresh_feed:
+                return fresh_feed, True
+
+        # It's taking too long. Generate the feed ourselves.
+        cls.log.warn(
+            "Gave up waiting for another request to generate %r.", feed
+        )
+        return feed, False
+
+    @property
+    def generation_key(self):
+        """A number identifying this feed for the purpose of generating
+        it. Every CachedFeed for the same lane, facets, etc. has the
+        same key.
+        """
+        key = repr((self.lane_name, self.license_pool_id, self.type,
+                    self.languages, self.facets, self.pagination))
+        # Postgres advisory lock keys are signed 64-bit integers.
+        return int(md5.new(key).hexdigest()[:15], 16)
+
+    def claim_generation(self, _db):
+        """Try to claim the exclusive right to regenerate this feed.
+
+        :return: True if the claim succeeded, False if some other
+            request is already regenerating the feed.
+        """
+        key = self.generation_key
+        if (Configuration.instance and Configuration.feed_generation_lock()
+            == Configuration.FEED_GENERATION_LOCK_POSTGRES):
+            # The lock is released automatically when the current
+            # transaction ends.
+            return _db.execute(
+                select([func.pg_try_advisory_xact_lock(key)])
+            ).scalar()
+
+        # Claims expire after a while, so that a request that crashes
+        # doesn't keep a feed from ever being regenerated.
+        now = time.time()
+        with self._generating_lock:
+            expires = self._generating.get(key)
+            if expires and expires > now:
+                return False
+            self._generating[key] = now + self.GENERATION_TIMEOUT
+        return True
+
+    def release_generation(self):
+        with self._generating_lock:
+            self._generating.pop(self.generation_key, None)
+
+    def update(self, _db, content, work_ids=None, list_ids=None,
+               from_materialized_views=True):
+        """Replace the content of this feed.
+
+        :param work_ids: The IDs of the works in the new feed.
+        :param list_ids: The IDs of the custom lists the feed's works
+            were taken from.
+        :param from_materialized_views: Whether the feed was generated
+            from the materialized views rather than the live tables.
+            If so, and the views haven't been refreshed since the feed
+            was marked dirty, the new content is no better than the
+            old, so the feed stays dirty.
+        """
         self.content = content
         self.timestamp = datetime.datetime.utcnow()
+        self.work_ids = sorted(set(work_ids)) if work_ids else None
+        self.list_ids = sorted(set(list_ids)) if list_ids else None
+        if self.dirty and from_materialized_views and self.dirty_at:
+            refreshed_at = SessionManager.materialized_views_refreshed_at(
+                _db
+            )
+            still_dirty = refreshed_at and refreshed_at <= self.dirty_at
+        else:
+            still_dirty = False
+        if not still_dirty:
+            self.dirty = False
+            self.dirty_at = None
         _db.flush()
+        self.release_generation()
+
+    @classmethod
+    def mark_dirty(cls, _db, work_ids=None, list_ids=None):
+        """Mark every cached feed that contains one of the given works,
+        or draws from one of the given lists, as needing to be
+        regenerated.
+        """
+        work_ids = set(work_ids or [])
+        list_ids = set(list_ids or [])
+        clauses = []
+        if work_ids:
+            clauses.append(cls.work_ids.overlap(list(work_ids)))
+        if list_ids:
+            clauses.append(cls.list_ids.overlap(list(list_ids)))
+        if not clauses:
+            return
+        now = datetime.datetime.utcnow()
+        _db.execute(
+            cls.__table__.update().where(or_(*clauses)).values(
+                dirty=True, dirty_at=now
+            )
+        )
+
+        # Rather than have the database tell us which feeds changed,
+        # update the ones we already have loaded.
+        for obj in _db.identity_map.values():
+            if not isinstance(obj, cls):
+                continue
+            if (work_ids.intersection(obj.work_ids or [])
+                or list_ids.intersection(obj.list_ids or [])):
+                set_committed_value(obj, 'dirty', True)
+                set_committed_value(obj, 'dirty_at', now)
+
+    @classmethod
+    def mark_dirty_on_flush(cls, _db, work_ids):
+        """Mark cached feeds containing the given works as dirty the
+        next time the session is flushed.
+
+        Works change in large batches, so this lets a single UPDATE
+        cover every work changed since the last flush.
+        """
+        pending = _db.info.setdefault(cls.PENDING_DIRTY_WORK_IDS, set())
+        pending.update(work_ids)
+
+    @classmethod
+    def mark_pending_dirty(cls, _db):
+        """Mark feeds dirty for all works passed into
+        mark_dirty_on_flush() since the last time this was called.
+        """
+        work_ids = _db.info.pop(cls.PENDING_DIRTY_WORK_IDS, None)
+        if work_ids:
+            cls.mark_dirty(_db, work_ids=work_ids)
+
+    @property
+    def content(self):
+        """The uncompressed content of the feed, as Unicode."""
+        if self.compressed_content is None:
+            return self._content
+        content = decompress(self.compressed_content, self.content_encoding)
+        return content.decode("utf8")
+
+    @content.setter
+    def content(self, content):
+        """Compress the given content and store it along with its hash."""
+        self._content = None
+        self.content_hash = self.hash_for(content)
+        if content is None:
+            self.compressed_content = self.content_encoding = None
+            return
+        encoding = self.storage_encoding()
+        self.compressed_content = compress(
+            content, encoding, self.storage_compression_level()
+        )
+        self.content_encoding = encoding
+
+    content = synonym('_content', descriptor=content)
+
+    @classmethod
+    def storage_encoding(cls):
+        """Which content-coding should be used to store new feeds?"""
+        encoding = None
+        if Configuration.instance:
+            encoding = Configuration.cached_feed_encoding()
+        if encoding not in available_encodings():
+            encoding = GZIP
+        return encoding
+
+    @classmethod
+    def storage_compression_level(cls):
+        """How hard should new feeds be compressed?
+
+        :return: A compression level, or None to use the default level
+        for the storage encoding.
+        """
+        if not Configuration.instance:
+            return None
+        level = Configuration.cached_feed_compression_level()
+        if level is None:
+            return None
+        return int(level)
+
+    @classmethod
+    def hash_for(cls, content):
+        if content is None:
+            return None
+        if isinstance(content, unicode):
+            content = content.encode("utf8")
+        return unicode(md5.new(content).hexdigest())
+
+    @property
+    def has_content(self):
+        """Does this feed have any content?
+
+        Feeds cached before content_hash was introduced have to load
+        their content to find out.
+        """
+        if self.content_hash:
+            return True
+        return bool(self.content)
+
+    @property
+    def etag(self):
+        """A strong ETag for the current version of this feed."""
+        return self.content_hash
+
+    @property
+    def last_modified(self):
+        return self.timestamp
 
     def __repr__(self):
         if self.content:
@@ -5813,6 +7069,200 @@ Index(
     "ix_cachedfeeds_lane_name_type_facets_pagination", CachedFeed.lane_name, CachedFeed.type,
     CachedFeed.facets, CachedFeed.pagination
 )
+Index(
+    "ix_cachedfeeds_work_ids", CachedFeed.work_ids, postgresql_using='gin'
+)
+Index(
+    "ix_cachedfeeds_list_ids", CachedFeed.list_ids, postgresql_using='gin'
+)
+
+
+@event.listens_for(Session, 'after_flush')
+def mark_pending_cached_feeds_dirty(session, flush_context):
+    CachedFeed.mark_pending_dirty(session)
+
+@event.listens_for(Session, 'before_commit')
+def mark_pending_cached_feeds_dirty_before_commit(session):
+    # A commit with nothing left to flush won't trigger after_flush.
+    CachedFeed.mark_pending_dirty(session)
+
+@event.listens_for(Session, 'after_rollback')
+def forget_pending_cached_feeds_dirty(session):
+    session.info.pop(CachedFeed.PENDING_DIRTY_WORK_IDS, None)
+
+
+class CachedSortName(Base):
+    """The sort name that goes with a display name, as previously
+    worked out by ContributorData.find_sort_name.
+
+    A null sort_name records that nobody could come up with a sort
+    name for the display name.
+    """
+
+    __tablename__ = 'cachedsortnames'
+    id = Column(Integer, primary_key=True)
+    display_name = Column(Unicode, nullable=False, unique=True, index=True)
+    sort_name = Column(Unicode, nullable=True)
+
+    # When the sort name was worked out.
+    timestamp = Column(DateTime, nullable=False)
+
+    # When to stop trusting it. If null, it's good forever.
+    expires = Column(DateTime, nullable=True, index=True)
+
+    @classmethod
+    def lookup(cls, _db, display_name, now=None):
+        """Find the unexpired CachedSortName for a display name.
+
+        :return: A CachedSortName, or None.
+        """
+        now = now or datetime.datetime.utcnow()
+        return get_one(
+            _db, cls, display_name=display_name,
+            constraint=or_(cls.expires==None, cls.expires > now)
+        )
+
+    @classmethod
+    def remember(cls, _db, display_name, sort_name, ttl=None):
+        """Record the sort name that goes with a display name.
+
+        :param sort_name: The sort name, or None if none could be found.
+        :param ttl: How long to trust it, as a timedelta.
+        """
+        now = datetime.datetime.utcnow()
+        cached, is_new = get_one_or_create(
+            _db, cls, display_name=display_name,
+            create_method_kwargs=dict(timestamp=now)
+        )
+        cached.sort_name = sort_name
+        cached.timestamp = now
+        if ttl is None:
+            cached.expires = None
+        else:
+            cached.expires = now + ttl
+        return cached
+
+    def __repr__(self):
+        return "<CachedSortName %r => %r (expires %s)>" % (
+            self.display_name, self.sort_name, self.expires
+        )
+
+
+class CachedSearchResult(Base):
+    """The IDs of the works that matched a search, in order, shared
+    between every process that uses the database.
+
+    See external_search.SearchResultCache.
+    """
+
+    __tablename__ = 'cachedsearchresults'
+    id = Column(Integer, primary_key=True)
+
+    # A hash of the normalized query, the lane's filters, the page
+    # and the search index it ran against.
+    key = Column(Unicode, nullable=False, unique=True, index=True)
+    work_ids = Column(ARRAY(Integer), nullable=False)
+
+    # When the search was run.
+    timestamp = Column(DateTime, nullable=False)
+
+    # When to run the search again.
+    expires = Column(DateTime, nullable=False, index=True)
+
+    # Every this many calls, remember() deletes results that have
+    # expired, since they'll never be looked up again.
+    PURGE_EVERY = 1000
+    _remembered = 0
+
+    @classmethod
+    def lookup(cls, _db, key, now=None):
+        """Find the unexpired CachedSearchResult for a key.
+
+        :return: A CachedSearchResult, or None.
+        """
+        now = now or datetime.datetime.utcnow()
+        return get_one(
+            _db, cls, key=key, constraint=(cls.expires > now)
+        )
+
+    @classmethod
+    def remember(cls, _db, key, work_ids, ttl):
+        """Record the works that matched a search.
+
+        :param ttl: How long the result is good for, as a timedelta.
+        """
+        now = datetime.datetime.utcnow()
+        cls._remembered += 1
+        if cls._remembered % cls.PURGE_EVERY == 0:
+            cls.delete_expired(_db, now)
+        cached, is_new = get_one_or_create(
+            _db, cls, key=key,
+            create_method_kwargs=dict(
+                work_ids=work_ids, timestamp=now, expires=now + ttl
+            )
+        )
+        cached.work_ids = work_ids
+        cached.timestamp = now
+        cached.expires = now + ttl
+        return cached
+
+    @classmethod
+    def delete_expired(cls, _db, now=None):
+        """Delete every result that has expired.
+
+        :return: The number of results deleted.
+        """
+        now = now or datetime.datetime.utcnow()
+        deleted = _db.query(cls).filter(cls.expires <= now).delete(
+            synchronize_session=False
+        )
+        if deleted:
+            logging.info("Deleted %d expired search results.", deleted)
+        return deleted
+
+    def __repr__(self):
+        return "<CachedSearchResult %s: %d works (expires %s)>" % (
+            self.key, len(self.work_ids or []), self.expires
+        )
+
+
+class SearchIndexChange(Base):
+    """A change to a Work that hasn't been sent to the search index yet.
+
+    See monitor.SearchIndexUpdateMonitor.
+    """
+
+    __tablename__ = 'searchindexchanges'
+
+    UPDATE = u'update'
+    DELETE = u'delete'
+
+    id = Column(Integer, primary_key=True)
+
+    # Not a foreign key, since a work may be deleted before its
+    # removal from the search index is sent.
+    work_id = Column(Integer, nullable=False, index=True)
+    operation = Column(Unicode, nullable=False)
+    enqueued_at = Column(DateTime, nullable=False)
+
+    @classmethod
+    def enqueue(cls, _db, work_ids, operation):
+        """Record that some works need to be updated in (or removed
+        from) the search index.
+        """
+        if not work_ids:
+            return
+        now = datetime.datetime.utcnow()
+        _db.execute(
+            cls.__table__.insert(),
+            [dict(work_id=work_id, operation=operation, enqueued_at=now)
+             for work_id in work_ids]
+        )
+
+    def __repr__(self):
+        return "<SearchIndexChange %s work %s (%s)>" % (
+            self.operation, self.work_id, self.enqueued_at
+        )
 
 
 class LicensePool(Base):
@@ -6271,6 +7721,11 @@ class LicensePool(Base):
             )
             logging.info(message, *args)
 
+            # Any cached feed that includes this book now shows the
+            # wrong availability.
+            if self.work_id:
+                CachedFeed.mark_dirty_on_flush(_db, [self.work_id])
+
         return changes_made
 
     def circulation_changelog(self, old_licenses_owned, old_licenses_available,
@@ -6752,6 +8207,9 @@ class RightsStatus(Base):
     }
     
     __tablename__ = 'rightsstatus'
+
+    # RightsStatus.lookup is called constantly.
+    _lookup_cache = LookupCache()
     id = Column(Integer, primary_key=True)
 
     # A URI unique to the license. This may be a URL (e.g. Creative
@@ -6768,12 +8226,16 @@ class RightsStatus(Base):
     def lookup(cls, _db, uri):
         if not uri in cls.NAMES.keys():
             uri = cls.UNKNOWN
+        status = cls._lookup_cache.get(_db, uri)
+        if status:
+            return status
         name = cls.NAMES.get(uri)
         create_method_kwargs = dict(name=name)
-        status, ignore = get_one_or_create(
+        status, is_new = get_one_or_create(
             _db, RightsStatus, uri=uri,
             create_method_kwargs=create_method_kwargs
         )
+        cls._lookup_cache.remember(_db, uri, status)
         return status
 
     @classmethod
@@ -7128,6 +8590,11 @@ class Timestamp(Base):
             stamp.timestamp = now
         return stamp
 
+# Content that has already been written to the content store, as
+# returned by Representation.read_stream().
+_StoredContent = namedtuple('_StoredContent', ['content_hash', 'size'])
+
+
 class Representation(Base):
     """A cached document obtained from (and possibly mirrored to) the Web
     at large.
@@ -7272,8 +8739,22 @@ class Representation(Base):
     # If this representation is an image, the width of the image.
     image_width = Column(Integer, index=True)
 
-    # The content of the representation itself.
-    content = Column(Binary)
+    # The thumbnail_size_quality_penalty of this image, stored so
+    # that covers can be ranked in the database. It's kept up to date
+    # as image_width and image_height change.
+    stored_thumbnail_size_quality_penalty = Column(
+        Float, name="thumbnail_size_quality_penalty", default=1
+    )
+
+    # The content of the representation itself. Use the `content`
+    # property rather than accessing this directly; it knows whether
+    # the content is kept here or in the content store.
+    _content = Column("content", Binary)
+
+    # If the content of the representation is kept in the
+    # content-addressed store (see Representation.content_store),
+    # this is the SHA-256 hash under which it's stored.
+    content_hash = Column(Unicode, index=True)
 
     # Instead of being stored in the database, the content of the
     # representation may be stored on a local file relative to the
@@ -7298,7 +8779,7 @@ class Representation(Base):
 
     @property
     def has_content(self):
-        if self.content and self.status_code == 200 and self.fetch_exception is None:
+        if self.has_stored_content and self.status_code == 200 and self.fetch_exception is None:
             return True
         if self.local_content_path and os.path.exists(self.local_content_path) and self.fetch_exception is None:
             return True
@@ -7333,7 +8814,9 @@ class Representation(Base):
         cache.
         
         :param do_get: A function that takes arguments (url, headers)
-        and retrieves a representation over the network.
+        and retrieves a representation over the network. By default,
+        if a content store is configured, the response body is
+        streamed into it without being read into memory.
 
         :param max_age: A timedelta object representing the maximum
         time to consider a cached representation fresh. (We ignore the
@@ -7344,7 +8827,8 @@ class Representation(Base):
 
         """
         representation = None
-        do_get = do_get or cls.simple_http_get
+        if not do_get:
+            do_get = cls.default_http_get(response_reviewer)
 
         exception_handler = exception_handler or cls.record_exception
 
@@ -7372,7 +8856,7 @@ class Representation(Base):
         usable_representation = (
             representation and not representation.fetch_exception
             and (
-                representation.content or representation.local_path
+                representation.has_stored_content or representation.local_path
                 or representation.status_code and representation.status_code / 100 != 5
             )
         )
@@ -7430,6 +8914,10 @@ class Representation(Base):
             media_type = cls._best_media_type(headers, presumed_media_type)
             if isinstance(content, unicode):
                 content = content.encode("utf8")
+            # A streamed body is only actually downloaded as it's
+            # read, so read it now, while a problem with the download
+            # can still be handled like any other.
+            content = cls.read_stream(content)
         except Exception, fetch_exception:
             # This indicates there was a problem with making the HTTP
             # request, not that the HTTP request returned an error
@@ -7489,7 +8977,6 @@ class Representation(Base):
                 setattr(representation, field, value)
 
             representation.headers = cls.headers_to_string(headers)
-            representation.content = content          
             representation.update_image_size()
             return representation, False
 
@@ -7590,6 +9077,104 @@ class Representation(Base):
                 content_path = content_path[1:]
         return content_path
 
+    @classmethod
+    def content_store(cls):
+        """The ContentStore in which representation content is kept.
+
+        :return: A ContentStore, or None if representation content
+        is kept in the database.
+        """
+        if not Configuration.instance:
+            return None
+        directory = Configuration.representation_content_store_directory()
+        if not directory:
+            return None
+        return ContentStore(directory)
+
+    @property
+    def has_stored_content(self):
+        """Is there any content stored for this representation, either
+        in the database or in the content store?
+
+        Unlike checking .content, this never reads from the content
+        store.
+        """
+        return bool(self._content or self.content_hash)
+
+    @property
+    def content(self):
+        if self._content is not None or not self.content_hash:
+            return self._content
+        store = self.content_store()
+        if not store:
+            return None
+        return store.get(self.content_hash)
+
+    @content.setter
+    def content(self, content):
+        """Set the content of this representation.
+
+        If a content store is configured, the content goes into the
+        store and this representation refers to it by hash, so that
+        identical documents are only stored once. Otherwise the
+        content goes into the database.
+
+        :param content: A bytestring, an open filehandle, or an
+        iterator over bytestrings. Filehandles and iterators are
+        streamed into the content store without being loaded into
+        memory.
+        """
+        if content is None:
+            self._content = None
+            self.content_hash = None
+            return
+        if isinstance(content, unicode):
+            content = content.encode("utf8")
+        if isinstance(content, _StoredContent):
+            self.content_hash, self.file_size = content
+            self._content = None
+            return
+
+        store = self.content_store()
+        if store:
+            self.content_hash, self.file_size = store.put(content)
+            self._content = None
+            return
+
+        if not isinstance(content, bytes):
+            # We were given a stream but we have nowhere to stream
+            # it to.
+            if hasattr(content, 'read'):
+                content = content.read()
+            else:
+                content = b''.join(content)
+        self._content = content
+        self.content_hash = None
+
+    # Tell SQLAlchemy to go through the `content` property.
+    content = synonym('_content', descriptor=content)
+
+    @classmethod
+    def read_stream(cls, content):
+        """Read a streamed body all the way through.
+
+        If a content store is configured, the body goes into it a chunk
+        at a time, and what comes back can be assigned to .content
+        without storing it again. Otherwise it's read into memory.
+
+        :param content: A bytestring, an open filehandle, or an
+        iterator over bytestrings.
+        :return: A bytestring, or the content as stored.
+        """
+        if content is None or isinstance(content, bytes):
+            return content
+        store = cls.content_store()
+        if store:
+            return _StoredContent(*store.put(content))
+        if hasattr(content, 'read'):
+            return content.read()
+        return b''.join(content)
+
     @property
     def unicode_content(self):
         """Attempt to convert the content into Unicode.
@@ -7634,6 +9219,18 @@ class Representation(Base):
             return None
         return json.dumps(dict(d))
 
+    @classmethod
+    def default_http_get(cls, response_reviewer=None):
+        """The function get() uses to fetch a representation if it
+        isn't given one.
+
+        A response reviewer needs to see the content, so it only gets
+        streamed into the content store if there's no reviewer.
+        """
+        if not response_reviewer and cls.content_store():
+            return cls.streaming_http_get
+        return cls.simple_http_get
+
     @classmethod
     def simple_http_get(cls, url, headers, **kwargs):
         """The most simple HTTP-based GET."""
@@ -7642,6 +9239,24 @@ class Representation(Base):
         response = HTTP.get_with_timeout(url, headers=headers, **kwargs)
         return response.status_code, response.headers, response.content
 
+    @classmethod
+    def streaming_http_get(cls, url, headers, **kwargs):
+        """An HTTP-based GET that doesn't read the response body into
+        memory.
+
+        The body is returned as an iterator, which the content store
+        can write to disk a chunk at a time. Use this for documents
+        that might be very large, such as book content.
+        """
+        kwargs['stream'] = True
+        if not 'allow_redirects' in kwargs:
+            kwargs['allow_redirects'] = True
+        response = HTTP.get_with_timeout(url, headers=headers, **kwargs)
+        return (
+            response.status_code, response.headers,
+            response.iter_content(ContentStore.CHUNK_SIZE)
+        )
+
     @classmethod
     def simple_http_post(cls, url, headers, **kwargs):
         """The most simple HTTP-based POST."""
@@ -7805,12 +9420,22 @@ class Representation(Base):
         This works whether the representation is kept in the database
         or in a file on disk.
         """
-        if self.content:
-            return StringIO(self.content)
+        if self._content:
+            return StringIO(self._content)
+        elif self.content_hash:
+            store = self.content_store()
+            fh = None
+            if store:
+                fh = store.open(self.content_hash)
+            if fh is None:
+                raise ValueError(
+                    "Content %s is not in the content store." % self.content_hash
+                )
+            return fh
         elif self.local_path:
             if not os.path.exists(self.local_path):
                 raise ValueError("%s does not exist." % self.local_path)
-            return open(self.local_path)
+            return ContentStore.open_mapped(self.local_path)
         return None
 
     def as_image(self):
@@ -7819,7 +9444,7 @@ class Representation(Base):
             raise ValueError(
                 "Cannot load non-image representation as image: type %s." 
                 % self.media_type)
-        if not self.content and not self.local_path:
+        if not self.has_stored_content and not self.local_path:
             raise ValueError("Image representation has no content.")
 
         fh = self.content_fh()
@@ -8002,6 +9627,22 @@ class Representation(Base):
             quotient *= (1+height_shortfall)
         return quotient
 
+@event.listens_for(Representation.image_width, 'set')
+def representation_image_width_set(target, value, oldvalue, initiator):
+    target.stored_thumbnail_size_quality_penalty = (
+        Representation._thumbnail_size_quality_penalty(
+            value, target.image_height
+        )
+    )
+
+@event.listens_for(Representation.image_height, 'set')
+def representation_image_height_set(target, value, oldvalue, initiator):
+    target.stored_thumbnail_size_quality_penalty = (
+        Representation._thumbnail_size_quality_penalty(
+            target.image_width, value
+        )
+    )
+
 
 class DeliveryMechanism(Base):
     """A technique for delivering a book to a patron.
@@ -8031,6 +9672,9 @@ class DeliveryMechanism(Base):
     }
 
     __tablename__ = 'deliverymechanisms'
+
+    # DeliveryMechanism.lookup is called constantly.
+    _lookup_cache = LookupCache()
     id = Column(Integer, primary_key=True)
     content_type = Column(String, nullable=False)
     drm_scheme = Column(String)
@@ -8072,10 +9716,16 @@ class DeliveryMechanism(Base):
 
     @classmethod
     def lookup(cls, _db, content_type, drm_scheme):
-        return get_one_or_create(
+        key = (content_type, drm_scheme)
+        mechanism = cls._lookup_cache.get(_db, key)
+        if mechanism:
+            return mechanism, False
+        mechanism, is_new = get_one_or_create(
             _db, DeliveryMechanism, content_type=content_type,
             drm_scheme=drm_scheme
         )
+        cls._lookup_cache.remember(_db, key, mechanism)
+        return mechanism, is_new
 
     @property
     def implicit_medium(self):
@@ -8238,12 +9888,17 @@ class CustomList(Base):
             entry.annotation = unicode(annotation)
         if edition.work and not entry.work:
             entry.work = edition.work
+        featured_changed = (featured is not None and entry.featured != featured)
         if featured is not None:
             entry.featured = featured
 
         if was_new:
             self.updated = datetime.datetime.utcnow()
 
+        if was_new or featured_changed:
+            # Cached feeds drawn from this list are now out of date.
+            CachedFeed.mark_dirty(_db, list_ids=[self.id])
+
         return entry, was_new
 
     def remove_entry(self, edition):
@@ -8258,6 +9913,7 @@ class CustomList(Base):
 
         if existing_entries:
             self.updated = datetime.datetime.utcnow()
+            CachedFeed.mark_dirty(_db, list_ids=[self.id])
         _db.commit()
 
     def entries_for_work(self, work_or_edition):
@@ -8,21 +8,26 @@ from sqlalchemy.sql.functions import func
 from sqlalchemy.sql.expression import (
     or_,
 )
+from sqlalchemy.orm import joinedload
 
 import log # This sets the appropriate log format and level.
 from config import Configuration
 from coverage import CoverageFailure
+from external_search import ExternalSearchIndex
 from model import (
     get_one_or_create,
+    Contribution,
     CoverageRecord,
     Edition,
     CustomListEntry,
     Identifier,
     LicensePool,
     PresentationCalculationPolicy,
+    SearchIndexChange,
     Subject,
     Timestamp,
     Work,
+    WorkCoverageRecord,
 )
 
 class Monitor(object):
@@ -316,9 +321,28 @@ class SubjectAssignmentMonitor(SubjectSweepMonitor):
 class PermanentWorkIDRefreshMonitor(EditionSweepMonitor):
     """Recalculate the permanent work ID for every edition."""
 
-    def __init__(self, _db, interval_seconds=None):
+    def __init__(self, _db, interval_seconds=None, batch_size=1000,
+                 processes=1):
         super(PermanentWorkIDRefreshMonitor, self).__init__(
-            _db, "Permanent Work ID refresh", interval_seconds)
+            _db, "Permanent Work ID refresh", interval_seconds,
+            batch_size=batch_size)
+        self.processes = processes
+
+    def edition_query(self):
+        # Every edition's authors will be needed.
+        return self._db.query(Edition).options(
+            joinedload(Edition.contributions).joinedload(
+                Contribution.contributor
+            )
+        )
+
+    def process_batch(self, batch):
+        changed = Edition.calculate_permanent_work_ids(
+            self._db, batch, self.processes
+        )
+        self.log.info(
+            "Changed %d of %d permanent work IDs.", changed, len(batch)
+        )
 
     def process_edition(self, edition):
         edition.calculate_permanent_work_id()
@@ -428,6 +452,33 @@ class WorkRandomnessUpdateMonitor(WorkSweepMonitor):
         return new_offset
 
 
+class WorkQualityRefreshMonitor(WorkSweepMonitor):
+    """Recalculate the quality of every work from its measurements.
+
+    Only work IDs are loaded. The measurements are averaged and the
+    new qualities written by Work.calculate_quality_for_works().
+    """
+
+    def __init__(self, _db, interval_seconds=3600*24,
+                 default_counter=0, batch_size=1000):
+        super(WorkQualityRefreshMonitor, self).__init__(
+            _db, "Work Quality Refresh", interval_seconds, default_counter,
+            batch_size)
+
+    def run_once(self, offset):
+        if offset is None:
+            offset = 0
+        work_ids = [
+            work_id for [work_id] in self._db.query(Work.id).filter(
+                Work.id > offset).order_by(Work.id).limit(self.batch_size)
+        ]
+        if not work_ids:
+            return 0
+        Work.calculate_quality_for_works(self._db, work_ids)
+        self.log.info("Refreshed the quality of %d works.", len(work_ids))
+        return work_ids[-1]
+
+
 class CustomListEntryLicensePoolUpdateMonitor(CustomListEntrySweepMonitor):
 
     def __init__(self, _db, interval_seconds=3600*24,
@@ -440,3 +491,110 @@ class CustomListEntryLicensePoolUpdateMonitor(CustomListEntrySweepMonitor):
     def process_entry(self, entry):
         entry.set_license_pool()
 
+
+class SearchIndexUpdateMonitor(Monitor):
+    """Sends the changes recorded in the searchindexchanges table to
+    the search index in bulk.
+
+    Repeated changes to the same work are sent once, using the work's
+    current state. Changes that couldn't be sent stay in the table to
+    be tried again next time.
+    """
+
+    def __init__(self, _db, search_index_client=None, batch_size=500,
+                 interval_seconds=60):
+        super(SearchIndexUpdateMonitor, self).__init__(
+            _db, "Search Index Update Monitor", interval_seconds,
+            keep_timestamp=False
+        )
+        self.search_index_client = (
+            search_index_client or ExternalSearchIndex()
+        )
+        self.batch_size = batch_size
+
+    def run_once(self, start, cutoff):
+        # Changes made while we're running will be picked up next time.
+        [max_id] = self._db.query(func.max(SearchIndexChange.id)).one()
+        offset = 0
+        while max_id and offset < max_id:
+            offset = self.process_batch(offset, max_id)
+
+    def process_batch(self, offset, max_id):
+        """Send one batch of changes to the search index.
+
+        :return: The ID of the last change in the batch.
+        """
+        changes = self._db.query(SearchIndexChange).filter(
+            SearchIndexChange.id > offset
+        ).filter(
+            SearchIndexChange.id <= max_id
+        ).order_by(SearchIndexChange.id).limit(self.batch_size).all()
+        if not changes:
+            return max_id
+        work_ids = set(change.work_id for change in changes)
+
+        works = self._db.query(Work).filter(Work.id.in_(work_ids)).all()
+        ready = [work for work in works if work.presentation_ready]
+        unindexable = set()
+        done = set()
+        if ready:
+            successes, failures = self.search_index_client.bulk_update(ready)
+            for work in successes:
+                WorkCoverageRecord.add_for(
+                    work, operation=(
+                        WorkCoverageRecord.UPDATE_SEARCH_INDEX_OPERATION
+                        + "-" + self.search_index_client.works_index
+                    )
+                )
+                done.add(work.id)
+            for work, message in failures:
+                self.log.error("Could not index %r: %s", work, message)
+                if work and message == self.search_index_client.NO_DOCUMENT:
+                    # Trying again won't help until the work changes,
+                    # which will queue it again. Until then it doesn't
+                    # belong in the index.
+                    unindexable.add(work.id)
+        done |= self.remove_from_index(
+            (work_ids - set(work.id for work in ready)) | unindexable
+        )
+
+        # Every queued change to these works, not just the ones in
+        # this batch, has now been sent.
+        if done:
+            self._db.query(SearchIndexChange).filter(
+                SearchIndexChange.work_id.in_(done)
+            ).filter(
+                SearchIndexChange.id <= max_id
+            ).delete(synchronize_session=False)
+        self._db.commit()
+        self.log.info(
+            "Sent %d changes to %d works to the search index, %d failed.",
+            len(changes), len(done), len(work_ids) - len(done)
+        )
+        return changes[-1].id
+
+    def remove_from_index(self, work_ids):
+        """Remove works from the search index.
+
+        :return: The IDs of the works that are no longer in the index.
+        """
+        if not work_ids:
+            return set()
+        client = self.search_index_client
+        docs = [
+            dict(_op_type='delete', _index=client.works_index,
+                 _type=client.work_document_type, _id=work_id)
+            for work_id in work_ids
+        ]
+        success_count, errors = client.bulk(
+            docs, raise_on_error=False, raise_on_exception=False
+        )
+        failed = set()
+        for error in errors:
+            details = error.get('delete', {})
+            if details.get('status') == 404:
+                # It wasn't in the index to begin with.
+                continue
+            self.log.error("Could not remove work from index: %r", error)
+            failed.add(int(details.get('_id')))
+        return set(work_ids) - failed
@@ -49,6 +49,7 @@ from util.http import (
     BadResponseException, 
     HTTP,
 )
+from util.rate_limit import AdaptiveRateLimiter
 
 
 
@@ -89,6 +90,10 @@ class OneClickAPI(object):
             base_url = self.SERVER_NICKNAMES[base_url]
         self.base_url = (base_url + self.API_VERSION).encode("utf8")
 
+        self.rate_limiter = AdaptiveRateLimiter.for_integration(
+            DataSource.ONECLICK, self.library_id
+        )
+
         # expiration defaults are OneClick-general
         self.ebook_loan_length = collection.external_integration.setting('ebook_loan_length').value or '21'
         self.eaudio_loan_length = collection.external_integration.setting('eaudio_loan_length').value or '21'
@@ -141,7 +146,8 @@ class OneClickAPI(object):
 
     def _make_request(self, url, method, headers, data=None, params=None, **kwargs):
         """Actually make an HTTP request."""
-        return HTTP.request_with_timeout(
+        return self.rate_limiter.call(
+            HTTP.request_with_timeout,
             method, url, headers=headers, data=data,
             params=params, **kwargs
         )
@@ -80,6 +80,41 @@ class Annotator(object):
         """
         pass
 
+    @classmethod
+    def work_entry_fragments(cls, work, license_pool, edition, identifier,
+                             feed):
+        """Generate the tags annotate_work_entry() would add to the end
+        of an OPDS entry, without needing the entry itself.
+
+        This lets AcquisitionFeed splice a cached entry into a feed
+        without parsing it. An Annotator that overrides
+        annotate_work_entry() must also override this method, or
+        its cached entries will be parsed and annotated the slow way.
+
+        :return: A list of tags.
+        """
+        return []
+
+    @classmethod
+    def can_splice_entries(cls, annotator):
+        """Can work_entry_fragments() stand in for annotate_work_entry()
+        on the given Annotator?
+
+        This is true if the class that defines the annotator's
+        work_entry_fragments() is the same as, or a subclass of, the
+        class that defines its annotate_work_entry().
+        """
+        if not isinstance(annotator, type):
+            annotator = annotator.__class__
+        defined_by = {}
+        for klass in annotator.__mro__:
+            for name in ('annotate_work_entry', 'work_entry_fragments'):
+                if name in klass.__dict__ and name not in defined_by:
+                    defined_by[name] = klass
+        return issubclass(
+            defined_by['work_entry_fragments'], defined_by['annotate_work_entry']
+        )
+
     @classmethod
     def annotate_feed(cls, feed, lane):
         """Make any custom modifications necessary to integrate this
@@ -318,13 +353,22 @@ class VerboseAnnotator(Annotator):
                             entry):
         """Add a quality rating to the work.
         """
+        entry.extend(cls.work_entry_fragments(
+            work, license_pool, edition, identifier, feed
+        ))
+
+    @classmethod
+    def work_entry_fragments(cls, work, license_pool, edition, identifier,
+                             feed):
+        tags = []
         for type_uri, value in [
                 (Measurement.QUALITY, work.quality),
                 (None, work.rating),
                 (Measurement.POPULARITY, work.popularity),
         ]:
             if value:
-                entry.append(cls.rating_tag(type_uri, value))
+                tags.append(cls.rating_tag(type_uri, value))
+        return tags
 
     @classmethod
     def categories(cls, work):
@@ -447,7 +491,10 @@ class AcquisitionFeed(OPDSFeed):
                 lane = Lane(_db, "Everything")
             # Generate a page-type feed that is filed as a
             # groups-type feed so it will show up when the client
-            # asks for it.
+            # asks for it. page() will need to claim the job of
+            # generating that feed for itself.
+            if cached:
+                cached.release_generation()
             cached = cls.page(
                 _db, title, url, lane, annotator,
                 cache_type=cache_type,
@@ -485,7 +532,9 @@ class AcquisitionFeed(OPDSFeed):
             all_works.append(work)
 
         all_works = annotator.sort_works_for_groups_feed(all_works)
-        feed = AcquisitionFeed(_db, title, url, all_works, annotator)
+        feed = AcquisitionFeed(
+            _db, title, url, all_works, annotator, splice_entries=True
+        )
 
         # Render a 'start' link and an 'up' link.
         top_level_title = annotator.top_level_title() or "Collection Home"
@@ -505,7 +554,11 @@ class AcquisitionFeed(OPDSFeed):
 
         content = unicode(feed)
         if cached and use_cache:
-            cached.update(_db, content)
+            cached.update(
+                _db, content, work_ids=cls._work_ids(all_works),
+                list_ids=cls._list_ids(_db, lane, include_sublanes=True),
+                from_materialized_views=use_materialized_works
+            )
             return cached
         return content
 
@@ -545,7 +598,7 @@ class AcquisitionFeed(OPDSFeed):
             works = []
         else:
             works = works_q.all()
-        feed = cls(_db, title, url, works, annotator)
+        feed = cls(_db, title, url, works, annotator, splice_entries=True)
 
         # Add URLs to change faceted views of the collection.
         for args in cls.facet_links(annotator, facets):
@@ -580,10 +633,49 @@ class AcquisitionFeed(OPDSFeed):
 
         content = unicode(feed)
         if cached and use_cache:
-            cached.update(_db, content)
+            cached.update(
+                _db, content, work_ids=cls._work_ids(works),
+                list_ids=cls._list_ids(_db, lane),
+                from_materialized_views=use_materialized_works
+            )
             return cached
         return content
 
+    @classmethod
+    def _work_ids(cls, works):
+        """Find the IDs of the Works (or MaterializedWorks) in a feed."""
+        ids = []
+        for work in works:
+            if isinstance(work, BaseMaterializedWork):
+                ids.append(work.works_id)
+            else:
+                ids.append(work.id)
+        return ids
+
+    @classmethod
+    def _list_ids(cls, _db, lane, include_sublanes=False):
+        """Find the IDs of the custom lists a lane draws works from.
+
+        :param include_sublanes: Also include the lists used by the
+            lane's immediate sublanes, which provide the works for a
+            groups feed.
+        """
+        lanes = [lane]
+        if include_sublanes and getattr(lane, 'sublanes', None):
+            lanes.extend(lane.sublanes)
+        list_ids = set()
+        for lane in lanes:
+            if not isinstance(lane, Lane):
+                continue
+            if lane.list_ids:
+                list_ids.update(lane.list_ids)
+            elif lane.list_data_source_id:
+                qu = _db.query(CustomList.id).filter(
+                    CustomList.data_source_id==lane.list_data_source_id
+                )
+                list_ids.update(x for [x] in qu)
+        return list_ids
+
     @classmethod
     def search(cls, _db, title, url, lane, search_engine, query, pagination=None,
                annotator=None
@@ -595,7 +687,10 @@ class AcquisitionFeed(OPDSFeed):
             search_lane = lane
 
         results = search_lane.search(query, search_engine, pagination=pagination)
-        opds_feed = AcquisitionFeed(_db, title, url, results, annotator=annotator)
+        opds_feed = AcquisitionFeed(
+            _db, title, url, results, annotator=annotator,
+            splice_entries=True
+        )
         AcquisitionFeed.add_link_to_feed(feed=opds_feed.feed, rel='start', href=annotator.default_lane_url(), title=annotator.top_level_title())
 
         if len(results) > 0:
@@ -663,24 +758,45 @@ class AcquisitionFeed(OPDSFeed):
             yield link
 
     def __init__(self, _db, title, url, works, annotator=None,
-                 precomposed_entries=[]):
+                 precomposed_entries=[], splice_entries=False,
+                 stream_entries=False):
         """Turn a list of works, messages, and precomposed <opds> entries
         into a feed.
+
+        :param splice_entries: If this is True, entries are kept as
+        serialized strings rather than added to self.feed, and cached
+        entries are spliced into the feed without being parsed. Only
+        turn this on for a feed that's going to be turned into a
+        string, rather than inspected as a tree.
+
+        :param stream_entries: If this is True, no entries are created
+        up front. Each entry is created as the feed is sent out by
+        iter_chunks(), and thrown away once it's sent. Implies
+        `splice_entries`.
         """
         if not annotator:
             annotator = Annotator()
         self.annotator = annotator
+        self.serialize_entries = splice_entries or stream_entries
+        self.splice_entries = (
+            self.serialize_entries and Annotator.can_splice_entries(annotator)
+        )
+        self.spliced_entries = []
 
         super(AcquisitionFeed, self).__init__(title, url)
 
+        if stream_entries:
+            self.pending_works = works
+            self.pending_entries = precomposed_entries
+            return
+        self.pending_works = self.pending_entries = []
+
         for work in works:
             self.add_entry(work)
 
         # Add the precomposed entries and the messages.
         for entry in precomposed_entries:
-            if isinstance(entry, OPDSMessage):
-                entry = entry.tag
-            self.feed.append(entry)
+            self._append_entry(entry)
 
     def add_entry(self, work):
         """Attempt to create an OPDS <entry>. If successful, append it to
@@ -689,11 +805,63 @@ class AcquisitionFeed(OPDSFeed):
         entry = self.create_entry(work)
 
         if entry is not None:
-            if isinstance(entry, OPDSMessage):
-                entry = entry.tag
+            self._append_entry(entry)
+        return entry
+
+    def _append_entry(self, entry):
+        entry = self._prepare_entry(entry)
+        if self.serialize_entries:
+            self.spliced_entries.append(entry)
+        else:
             self.feed.append(entry)
+
+    def _prepare_entry(self, entry):
+        if isinstance(entry, OPDSMessage):
+            entry = entry.tag
+        if self.serialize_entries and isinstance(entry, etree._Element):
+            entry = etree.tostring(entry)
         return entry
 
+    def _entries_to_send(self):
+        """Yield every entry in the feed as a string, creating the ones
+        that are still pending along the way.
+        """
+        for entry in self.spliced_entries:
+            yield entry
+        for work in self.pending_works:
+            entry = self.create_entry(work)
+            if entry is not None:
+                yield self._prepare_entry(entry)
+        for entry in self.pending_entries:
+            yield self._prepare_entry(entry)
+
+    def iter_chunks(self):
+        """Generate the feed as a series of UTF-8 bytestrings: first the
+        feed-level tags, then the entries one at a time, then the
+        closing </feed> tag.
+
+        Feed-level tags must not be changed once this starts.
+        """
+        if not self.serialize_entries:
+            yield unicode(self)
+            return
+
+        # Serialize the feed-level tags, then send the serialized
+        # entries right before the closing </feed> tag.
+        envelope = etree.tostring(self.feed, pretty_print=True)
+        insert_at = envelope.rindex('</')
+        yield envelope[:insert_at]
+        for entry in self._entries_to_send():
+            if isinstance(entry, unicode):
+                entry = entry.encode("utf8")
+            yield entry + "\n"
+        yield envelope[insert_at:]
+
+    def __unicode__(self):
+        if not self.serialize_entries:
+            return super(AcquisitionFeed, self).__unicode__()
+        return "".join(self.iter_chunks())
+
     def create_entry(self, work, even_if_no_license_pool=False,
                      force_create=False, use_cache=True):
         """Turn a work into an entry for an acquisition feed."""
@@ -768,6 +936,21 @@ class AcquisitionFeed(OPDSFeed):
         if field and work and not force_create and use_cache:
             xml = getattr(work, field)
 
+        if xml and self.splice_entries and '</' in xml:
+            # This cached entry can be spliced into the feed as-is,
+            # with the annotations tacked onto the end.
+            fragments = self.annotator.work_entry_fragments(
+                work, license_pool, edition, identifier, self
+            )
+            group_uri, group_title = self.annotator.group_uri(
+                work, license_pool, identifier)
+            if group_uri:
+                fragments.append(AtomFeed.link(
+                    rel=OPDSFeed.GROUP_REL, href=group_uri,
+                    title=group_title
+                ))
+            return self._splice_into_entry(xml, fragments)
+
         if xml:
             xml = etree.fromstring(xml)
         else:
@@ -781,7 +964,7 @@ class AcquisitionFeed(OPDSFeed):
 
         self.annotator.annotate_work_entry(
             work, license_pool, edition, identifier, self, xml)
-            
+
         group_uri, group_title = self.annotator.group_uri(
             work, license_pool, identifier)
         if group_uri:
@@ -791,6 +974,57 @@ class AcquisitionFeed(OPDSFeed):
 
         return xml
 
+    NAMESPACE_DECLARATION = re.compile(
+        """xmlns(?::([^=\s]+))?\s*=\s*["']([^"']*)["']"""
+    )
+
+    @classmethod
+    def _splice_into_entry(cls, entry, tags):
+        """Add tags to the end of a serialized <entry> without parsing it.
+
+        :param entry: A serialized <entry> tag with a separate end tag.
+        :param tags: A list of tags to add.
+        :return: The modified <entry> as a string.
+        """
+        if not tags:
+            return entry
+        insert_at = entry.rindex('</')
+        end_of_start_tag = entry.index('>')
+
+        # If the <entry> declares every namespace we know about, the
+        # new tags can rely on those declarations instead of repeating
+        # them. Otherwise each tag must carry its own declarations.
+        if cls._declares_all_namespaces(entry[:end_of_start_tag]):
+            wrapper = etree.Element(
+                "{%s}entry" % AtomFeed.ATOM_NS, nsmap=AtomFeed.nsmap
+            )
+            wrapper.extend(tags)
+            wrapper = etree.tostring(wrapper)
+            added = wrapper[wrapper.index('>')+1:wrapper.rindex('</')]
+        else:
+            added = "".join(etree.tostring(tag) for tag in tags)
+        return entry[:insert_at] + added + entry[insert_at:]
+
+    # Nearly every cached entry starts with the same start tag, so
+    # there's no need to look at its namespace declarations every time.
+    _start_tags = {}
+    MAX_START_TAGS = 100
+
+    @classmethod
+    def _declares_all_namespaces(cls, start_tag):
+        result = cls._start_tags.get(start_tag)
+        if result is None:
+            declared = dict(
+                (prefix or None, uri) for prefix, uri in
+                cls.NAMESPACE_DECLARATION.findall(start_tag)
+            )
+            result = all(declared.get(prefix) == uri
+                         for prefix, uri in AtomFeed.nsmap.items())
+            if len(cls._start_tags) >= cls.MAX_START_TAGS:
+                cls._start_tags.clear()
+            cls._start_tags[start_tag] = result
+        return result
+
     def _make_entry_xml(self, work, license_pool, edition, identifier):
 
         # Find the .epub link
@@ -249,34 +249,26 @@ class OPDSImporter(object):
         # moving on. Let the exception propagate.
         metadata_objs, failures = self.extract_feed_data(feed, feed_url)
 
-        # make editions.  if have problem, make sure associated pool and work aren't created.
-        for key, metadata in metadata_objs.iteritems():
-            # key is identifier.urn here
-
-            # If there's a status message about this item, don't try to import it.
-            if key in failures.keys():
-                continue
+        # Import every item that doesn't have a status message in one
+        # batch. An item that can't be imported is treated as a
+        # failure that only applies to that item.
+        editions, import_failures = self.import_editions_from_metadata(
+            dict((key, metadata) for key, metadata in metadata_objs.iteritems()
+                 if key not in failures)
+        )
+        for key, tb in import_failures.items():
+            identifier, ignore = Identifier.parse_urn(self._db, key)
+            failures[key] = CoverageFailure(
+                identifier, tb, data_source=self.data_source,
+                transient=False
+            )
 
-            try:
-                # Create an edition. This will also create a pool if there's circulation data.
-                edition = self.import_edition_from_metadata(
-                    metadata, even_if_no_author, immediately_presentation_ready
-                )
-                if edition:
-                    imported_editions[key] = edition
-            except Exception, e:
-                # Rather than scratch the whole import, treat this as a failure that only applies
-                # to this item.
-                self.log.error("Error importing an OPDS item", exc_info=e)
-                identifier, ignore = Identifier.parse_urn(self._db, key)
-                data_source = self.data_source
-                failure = CoverageFailure(identifier, traceback.format_exc(), data_source=data_source, transient=False)
-                failures[key] = failure
-                # clean up any edition might have created
-                if key in imported_editions:
-                    del imported_editions[key]
-                # Move on to the next item, don't create a work.
+        # make pools and works for the editions that were imported.
+        for key, edition in editions.items():
+            # key is identifier.urn here
+            if not edition:
                 continue
+            imported_editions[key] = edition
 
             try:
                 pool, work = self.update_work_for_edition(
@@ -295,6 +287,36 @@ class OPDSImporter(object):
         return imported_editions.values(), pools.values(), works.values(), failures
 
 
+    def import_editions_from_metadata(self, metadata_objs):
+        """Find or create an Edition for each of the passed-in Metadata
+        objects, and apply the metadata to it. Do not set the editions'
+        pools or works, yet.
+
+        :param metadata_objs: A dictionary mapping identifier URNs to
+            Metadata objects.
+        :return: A 2-tuple (editions, failures). `editions` maps URNs to
+            Editions; `failures` maps the URN of each item that couldn't
+            be imported to a traceback.
+        """
+        keys = metadata_objs.keys()
+        apply_failures = {}
+        results = Metadata.apply_many(
+            self._db, [metadata_objs[key] for key in keys],
+            self.metadata_client, replace=self.replacement_policy,
+            failures=apply_failures
+        )
+        editions = {}
+        failures = {}
+        for i, key in enumerate(keys):
+            if i in apply_failures:
+                exception, tb = apply_failures[i]
+                self.log.error("Error importing an OPDS item", exc_info=exception)
+                failures[key] = tb
+            else:
+                edition, ignore = results[i]
+                editions[key] = edition
+        return editions, failures
+
     def import_edition_from_metadata(
             self, metadata, even_if_no_author, immediately_presentation_ready
     ):
@@ -305,7 +327,16 @@ class OPDSImporter(object):
         # Locate or create an Edition for this book.
         edition, is_new_edition = metadata.edition(self._db)
 
-        policy = ReplacementPolicy(
+        metadata.apply(
+            edition, self.metadata_client, replace=self.replacement_policy
+        )
+
+        return edition
+
+    @property
+    def replacement_policy(self):
+        """The ReplacementPolicy used to apply the metadata in a feed."""
+        return ReplacementPolicy(
             subjects=True,
             links=True,
             contributions=True,
@@ -316,11 +347,6 @@ class OPDSImporter(object):
             content_modifier=self.content_modifier,
             http_get=self.http_get,
         )
-        metadata.apply(
-            edition, self.metadata_client, replace=policy
-        )
-
-        return edition
 
     def update_work_for_edition(self, edition, even_if_no_author=False, immediately_presentation_ready=False):
         work = None
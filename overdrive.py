@@ -8,6 +8,7 @@ import logging
 import urlparse
 import urllib
 import sys
+from multiprocessing.pool import ThreadPool
 from config import (
     temp_config, 
     Configuration,
@@ -55,6 +56,7 @@ from util.http import (
     HTTP,
     BadResponseException,
 )
+from util.rate_limit import AdaptiveRateLimiter
 
 from testing import MockRequestsResponse
 
@@ -123,6 +125,11 @@ class OverdriveAPI(object):
             collection = collection.parent
         else:
             self.parent_library_id = None
+
+        # Requests made with the same credentials share a rate limit.
+        self.rate_limiter = AdaptiveRateLimiter.for_integration(
+            DataSource.OVERDRIVE, collection.external_account_id
+        )
             
         self.client_key = collection.external_integration.username.encode("utf8")
         self.client_secret = collection.external_integration.password.encode("utf8")
@@ -391,13 +398,15 @@ class OverdriveAPI(object):
 
     def _do_get(self, url, headers):
         """This method is overridden in MockOverdriveAPI."""
-        return Representation.simple_http_get(
-            url, headers
+        return self.rate_limiter.call(
+            Representation.simple_http_get, url, headers
         )
 
     def _do_post(self, url, payload, headers, **kwargs):
         """This method is overridden in MockOverdriveAPI."""
-        return HTTP.post_with_timeout(url, payload, headers=headers, **kwargs)
+        return self.rate_limiter.call(
+            HTTP.post_with_timeout, url, payload, headers=headers, **kwargs
+        )
 
 
 class MockOverdriveAPI(OverdriveAPI):
@@ -476,6 +485,207 @@ class MockOverdriveAPI(OverdriveAPI):
         )
 
 
+class OverdriveInventoryCrawler(object):
+    """Walk an Overdrive collection, getting availability information
+    (and, optionally, bibliographic metadata) for many books at once.
+
+    While one page of the product list is being processed, the next
+    page is fetched in the background, and the per-book requests for
+    the current page are spread across a pool of worker threads.
+
+    The worker threads only make HTTP requests. All database work --
+    including refreshing the OAuth bearer token, which is stored in
+    a Credential -- happens in the thread that's iterating over the
+    results, so the API's database session is never shared between
+    threads.
+    """
+
+    log = logging.getLogger("Overdrive inventory crawler")
+
+    def __init__(self, api, workers=8, include_metadata=False):
+        """Constructor.
+
+        :param api: An OverdriveAPI.
+        :param workers: The number of requests to have in flight at
+            once. The API's rate limiter may impose a lower limit.
+        :param include_metadata: If this is True, each book's
+            bibliographic metadata is fetched along with its
+            availability, and the crawl yields Metadata objects whose
+            `circulation` is the book's CirculationData.
+        """
+        self.api = api
+        self.workers = workers
+        self.include_metadata = include_metadata
+
+    def all_circulation(self):
+        """Crawl every book in the collection."""
+        params = dict(collection_token=self.api.collection_token,
+                      sort="dateAdded:desc")
+        first_link = self.api.make_link_safe(
+            self.api.ALL_PRODUCTS_ENDPOINT % params
+        )
+        return self.crawl(first_link)
+
+    def recently_changed_circulation(self, start):
+        """Crawl every book whose status has changed since `start`."""
+        last_update = (start - self.api.EVENT_DELAY).strftime(
+            self.api.TIME_FORMAT
+        )
+        params = dict(lastupdatetime=last_update,
+                      sort="popularity:desc",
+                      limit=self.api.PAGE_SIZE_LIMIT,
+                      collection_token=self.api.collection_token)
+        first_link = self.api.make_link_safe(
+            self.api.EVENTS_ENDPOINT % params
+        )
+        return self.crawl(first_link)
+
+    def crawl(self, first_link, rel_to_follow='next'):
+        """Walk a paginated product list starting at `first_link`.
+
+        :yield: A CirculationData (or, if `include_metadata` is set,
+            a Metadata) for every book in the list, in no particular
+            order.
+        """
+        pool = ThreadPool(self.workers)
+        try:
+            next_page = pool.apply_async(self._fetch, (first_link,))
+            while next_page:
+                page = self._json(*next_page.get())
+
+                # Start fetching the next page right away, so it's ready
+                # by the time we're done with this one.
+                next_link = OverdriveRepresentationExtractor.link(
+                    page, rel_to_follow
+                )
+                if next_link:
+                    next_page = pool.apply_async(self._fetch, (next_link,))
+                else:
+                    next_page = None
+
+                books = [
+                    x for x in
+                    OverdriveRepresentationExtractor.availability_link_list(page)
+                    if 'availability_link' in x
+                ]
+                for book, result in pool.imap_unordered(
+                        self._fetch_book, books):
+                    # One book we can't get shouldn't stop the crawl
+                    # of the whole collection.
+                    if isinstance(result, Exception):
+                        self.log.error(
+                            "Could not fetch book %s, skipping it: %r",
+                            book.get('id'), result
+                        )
+                        continue
+                    try:
+                        item = self._process_book(book, *result)
+                    except Exception, e:
+                        self.log.error(
+                            "Could not process book %s, skipping it.",
+                            book.get('id'), exc_info=e
+                        )
+                        continue
+                    if item:
+                        yield item
+        finally:
+            pool.terminate()
+
+    def _fetch(self, url):
+        """Make an authorized GET request without touching the database.
+
+        This runs in a worker thread.
+
+        :return: A 3-tuple (url, token_used, response), where
+        `response` is a (status_code, headers, content) 3-tuple.
+        """
+        token = self.api.token
+        headers = dict(Authorization="Bearer %s" % token)
+        return url, token, self.api._do_get(url, headers)
+
+    def _fetch_book(self, book):
+        """Fetch availability information (and maybe metadata) for a book.
+
+        This runs in a worker thread.
+
+        :return: A 2-tuple (book, result). `result` is a 2-tuple
+        (availability, metadata) of responses, or the exception that
+        kept them from being fetched.
+        """
+        try:
+            availability = self._fetch(book['availability_link'])
+            metadata = None
+            if self.include_metadata:
+                metadata_url = self.api.METADATA_ENDPOINT % dict(
+                    collection_token=self.api.collection_token,
+                    item_id=book['id']
+                )
+                metadata = self._fetch(metadata_url)
+        except Exception, e:
+            return book, e
+        return book, (availability, metadata)
+
+    def _retry_if_unauthorized(self, url, token, response):
+        """If a worker's request was rejected because the bearer token
+        expired, refresh the token and make the request again.
+
+        This runs in the main thread.
+        """
+        status_code, headers, content = response
+        if status_code != 401:
+            return response
+        if token == self.api.token:
+            # No one else has refreshed the token since this request
+            # was made.
+            self.api.check_creds(True)
+        return self.api.get(url, {}, exception_on_401=True)
+
+    def _json(self, url, token, response):
+        status_code, headers, content = self._retry_if_unauthorized(
+            url, token, response
+        )
+        if isinstance(content, basestring):
+            content = json.loads(content)
+        return content
+
+    def _process_book(self, book, availability, metadata):
+        """Turn the responses for one book into a CirculationData or
+        Metadata.
+        """
+        url, token, response = availability
+        status_code, headers, content = self._retry_if_unauthorized(
+            url, token, response
+        )
+        if status_code == 404:
+            # The book is no longer in the collection.
+            circulation = CirculationData(
+                data_source=DataSource.OVERDRIVE,
+                primary_identifier=IdentifierData(
+                    Identifier.OVERDRIVE_ID, book['id']
+                ),
+                licenses_owned=0,
+                licenses_available=0,
+                licenses_reserved=0,
+                patrons_in_hold_queue=0,
+            )
+        else:
+            if isinstance(content, basestring):
+                content = json.loads(content)
+            circulation = OverdriveRepresentationExtractor.book_info_to_circulation(
+                content
+            )
+        if not circulation or not metadata:
+            return circulation
+
+        info = self._json(*metadata)
+        metadata = OverdriveRepresentationExtractor.book_info_to_metadata(info)
+        if metadata.circulation:
+            # Keep the formats found in the bibliographic metadata.
+            circulation.formats = metadata.circulation.formats
+        metadata.circulation = circulation
+        return metadata
+
+
 class OverdriveRepresentationExtractor(object):
 
     """Extract useful information from Overdrive's JSON representations."""
@@ -48,6 +48,7 @@ from model import (
     LicensePool,
     Patron,
     PresentationCalculationPolicy,
+    SessionManager,
     Subject,
     Timestamp,
     Work,
@@ -1268,12 +1269,14 @@ class RefreshMaterializedViewsScript(Script):
             MaterializedWorkWithGenre,
         )
         db = self._db
+        started = datetime.datetime.utcnow()
         for i in (MaterializedWork, MaterializedWorkWithGenre):
             view_name = i.__table__.name
             a = time.time()
             db.execute("REFRESH MATERIALIZED VIEW %s %s" % (concurrently, view_name))
             b = time.time()
             print "%s refreshed in %.2f sec." % (view_name, b-a)
+        SessionManager.record_materialized_views_refreshed(db, started)
 
         # Close out this session because we're about to create another one.
         db.commit()
@@ -1922,8 +1925,31 @@ class Explain(IdentifierInputScript):
 
 class SubjectAssignmentScript(SubjectInputScript):
 
+    @classmethod
+    def arg_parser(cls):
+        parser = super(SubjectAssignmentScript, cls).arg_parser()
+        parser.add_argument(
+            '--bulk',
+            help='Reclassify every unlocked subject (of the given type) at once, with set-based SQL. --subject-filter is ignored.',
+            action='store_true',
+        )
+        parser.add_argument(
+            '--processes',
+            help='With --bulk, classify subjects in a pool of this many processes.',
+            type=int,
+            default=1,
+        )
+        return parser
+
     def run(self):
         args = self.parse_command_line(self._db)
+        if args.bulk:
+            checked = Subject.bulk_assign_to_genres(
+                self._db, args.subject_type, force=True,
+                processes=args.processes
+            )
+            self.log.info("Reclassified %d subjects.", checked)
+            return
         monitor = SubjectAssignmentMonitor(
             self._db, args.subject_type, args.subject_filter
         )
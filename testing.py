@@ -29,6 +29,7 @@ from model import (
     Hyperlink,
     Identifier,
     LicensePool,
+    LookupCache,
     Patron,
     Representation,
     Resource,
@@ -46,8 +47,13 @@ from coverage import (
     CoverageFailure,
     WorkCoverageProvider,
 )
+from metadata_layer import SortNameCache
 
-from external_search import DummyExternalSearchIndex
+from external_search import (
+    DummyExternalSearchIndex,
+    SearchResultCache,
+)
+from lane import LaneTreeCache
 import mock
 import model
 import inspect
@@ -128,6 +134,13 @@ class DatabaseTest(object):
         self.search_mock = mock.patch(model.__name__ + ".ExternalSearchIndex", DummyExternalSearchIndex)
         self.search_mock.start()
 
+        # These caches outlive the database transaction, so clear
+        # them out between tests.
+        SortNameCache.reset()
+        SearchResultCache.reset()
+        LaneTreeCache.reset()
+        LookupCache.reset_all()
+
         # TODO:  keeping this for now, but need to fix it bc it hits _isbn, 
         # which pops an isbn off the list and messes tests up.  so exclude 
         # _ functions from participating.
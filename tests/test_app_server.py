@@ -1,4 +1,7 @@
+import datetime
+import gzip
 import json
+from StringIO import StringIO
 from flask import Flask
 from flask_babel import (
     Babel,
@@ -15,9 +18,15 @@ from . import (
     DatabaseTest,
 )
 
-from opds import TestAnnotator
+from opds import (
+    AcquisitionFeed,
+    TestAnnotator,
+)
 
-from model import Identifier
+from model import (
+    CachedFeed,
+    Identifier,
+)
 
 from lane import (
     Facets,
@@ -28,6 +37,9 @@ from app_server import (
     URNLookupController,
     ErrorHandler,
     ComplaintController,
+    entry_response,
+    feed_response,
+    gzip_chunks,
     load_facets_from_request,
     load_pagination_from_request,
 )
@@ -261,6 +273,153 @@ class TestLoadMethods(object):
             eq_(0, pagination.offset)
 
 
+class TestFeedResponse(object):
+
+    def setup(self):
+        self.app = Flask(__name__)
+
+    def feed(self):
+        messages = [
+            OPDSMessage("urn:%d" % i, 404, "Not found") for i in range(3)
+        ]
+        return AcquisitionFeed(
+            None, "A feed", "http://feed/", [], precomposed_entries=messages,
+            stream_entries=True
+        )
+
+    def test_streaming_response(self):
+        feed = self.feed()
+        expect = unicode(feed)
+
+        with self.app.test_request_context('/'):
+            response = feed_response(feed, stream=True)
+            eq_(True, response.is_streamed)
+            eq_(OPDSFeed.ACQUISITION_FEED_TYPE,
+                response.headers['Content-Type'])
+            assert 'Content-Encoding' not in response.headers
+
+            # The feed header, each entry, and the footer are sent as
+            # separate chunks.
+            chunks = list(response.response)
+            eq_(5, len(chunks))
+            assert chunks[-1].strip() == "</feed>"
+            eq_(expect, "".join(chunks))
+
+    def test_streaming_response_with_gzip(self):
+        feed = self.feed()
+        expect = unicode(feed)
+        headers = {"Accept-Encoding": "gzip, deflate"}
+        with self.app.test_request_context('/', headers=headers):
+            response = feed_response(feed, stream=True)
+            eq_("gzip", response.headers['Content-Encoding'])
+            eq_("Accept-Encoding", response.headers['Vary'])
+            data = response.get_data()
+            eq_(expect, gzip.GzipFile(fileobj=StringIO(data)).read())
+
+    def test_no_streaming_by_default(self):
+        with self.app.test_request_context('/'):
+            response = feed_response(self.feed())
+            eq_(False, response.is_streamed)
+            assert '<simplified:message' in response.data
+
+    def test_conditional_response_for_cached_feed(self):
+        timestamp = datetime.datetime(2017, 1, 2, 3, 4, 5, 600)
+        cached = CachedFeed(
+            content=u"<feed/>", content_hash=CachedFeed.hash_for(u"<feed/>"),
+            timestamp=timestamp
+        )
+
+        # A client with no cached copy gets the feed, along with
+        # validators it can use next time.
+        with self.app.test_request_context('/'):
+            response = feed_response(cached)
+            eq_(200, response.status_code)
+            eq_("<feed/>", response.data)
+            eq_('"%s"' % cached.content_hash, response.headers['ETag'])
+            eq_("Mon, 02 Jan 2017 03:04:05 GMT",
+                response.headers['Last-Modified'])
+
+        def conditional(**headers):
+            with self.app.test_request_context('/', headers=headers):
+                return feed_response(cached)
+
+        # A client that has the current version gets a 304 with no body.
+        response = conditional(**{"If-None-Match": '"%s"' % cached.content_hash})
+        eq_(304, response.status_code)
+        eq_("", response.data)
+        eq_('"%s"' % cached.content_hash, response.headers['ETag'])
+
+        response = conditional(**{
+            "If-Modified-Since": "Mon, 02 Jan 2017 03:04:05 GMT"
+        })
+        eq_(304, response.status_code)
+
+        # A client with an older version gets the whole feed.
+        response = conditional(**{"If-None-Match": '"some other hash"'})
+        eq_(200, response.status_code)
+
+        response = conditional(**{
+            "If-Modified-Since": "Mon, 02 Jan 2017 03:04:04 GMT"
+        })
+        eq_(200, response.status_code)
+
+        # If-None-Match wins over If-Modified-Since.
+        response = conditional(**{
+            "If-None-Match": '"some other hash"',
+            "If-Modified-Since": "Mon, 02 Jan 2017 03:04:05 GMT",
+        })
+        eq_(200, response.status_code)
+
+    def test_compressed_cached_feed(self):
+        cached = CachedFeed(
+            content=u"<feed/>", timestamp=datetime.datetime.utcnow()
+        )
+        eq_("gzip", cached.content_encoding)
+
+        # A client that can handle gzip gets the stored bytes.
+        headers = {"Accept-Encoding": "gzip"}
+        with self.app.test_request_context('/', headers=headers):
+            response = feed_response(cached)
+            eq_(200, response.status_code)
+            eq_("gzip", response.headers['Content-Encoding'])
+            eq_("Accept-Encoding", response.headers['Vary'])
+            eq_(cached.compressed_content, response.data)
+            etag = response.headers['ETag']
+            eq_('"%s-gzip"' % cached.content_hash, etag)
+
+        # The compressed representation has its own ETag.
+        headers["If-None-Match"] = etag
+        with self.app.test_request_context('/', headers=headers):
+            eq_(304, feed_response(cached).status_code)
+
+        # Any other client gets the feed decompressed.
+        with self.app.test_request_context('/'):
+            response = feed_response(cached)
+            assert 'Content-Encoding' not in response.headers
+            eq_("Accept-Encoding", response.headers['Vary'])
+            eq_("<feed/>", response.data)
+            eq_('"%s"' % cached.content_hash, response.headers['ETag'])
+
+    def test_conditional_response_for_entry(self):
+        entry = OPDSFeed.entry(OPDSFeed.title("A title"))
+        last_update = datetime.datetime(2017, 1, 2, 3, 4, 5)
+        with self.app.test_request_context('/'):
+            response = entry_response(entry, last_modified=last_update)
+            eq_(200, response.status_code)
+            etag = response.headers['ETag']
+            eq_('"%s"' % CachedFeed.hash_for(response.data), etag)
+
+        headers = {"If-None-Match": etag}
+        with self.app.test_request_context('/', headers=headers):
+            response = entry_response(entry, last_modified=last_update)
+            eq_(304, response.status_code)
+
+    def test_gzip_chunks(self):
+        compressed = "".join(gzip_chunks(["some ", "content"]))
+        eq_("some content",
+            gzip.GzipFile(fileobj=StringIO(compressed)).read())
+
+
 class TestErrorHandler(object):
 
     def setup(self):
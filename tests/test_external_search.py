@@ -21,6 +21,8 @@ from external_search import (
     ExternalSearchIndex,
     ExternalSearchIndexVersions,
     DummyExternalSearchIndex,
+    ParsedQuery,
+    SearchResultCache,
 )
 from classifier import Classifier
 
@@ -859,6 +861,85 @@ class TestSearchQuery(DatabaseTest):
         assert "5" not in remaining_query['query']
         assert "years" not in remaining_query['query']
 
+class TestQueryWorksMulti(object):
+
+    def setup(self):
+        self.search = DummyExternalSearchIndex()
+        self.queries = [
+            (u"dragons", None, ["eng"], None, True,
+             [Classifier.AUDIENCE_CHILDREN], None, [], 10, 0),
+            (u"moby dick", None, ["eng"], None, None, [], None, [], 5, 20),
+        ]
+
+    def test_one_request_for_several_searches(self):
+        requests = []
+        def msearch(body):
+            requests.append(body)
+            return dict(responses=[
+                dict(hits=dict(hits=[dict(_id=1)])),
+                dict(error="Something went wrong"),
+            ])
+        self.search.msearch = msearch
+
+        results = ExternalSearchIndex.query_works_multi(
+            self.search, self.queries, fields=["_id"]
+        )
+
+        # The searches were sent together, each one a header naming
+        # the index followed by the search itself.
+        [body] = requests
+        eq_(4, len(body))
+        eq_([dict(index="works-current")] * 2, [body[0], body[2]])
+        for query, search in zip(self.queries, [body[1], body[3]]):
+            (query_string, media, languages, exclude_languages, fiction,
+             audience, age_range, genres, size, offset) = query
+            eq_(size, search['size'])
+            eq_(offset, search['from'])
+            eq_(["_id"], search['fields'])
+            eq_(self.search.make_search_body(
+                query_string, media, languages, exclude_languages,
+                fiction, audience, age_range, genres
+            )['query'], search['query'])
+
+        # The results come back in order, and a failed search is
+        # represented by None.
+        eq_([dict(hits=dict(hits=[dict(_id=1)])), None], results)
+
+    def test_dummy_index(self):
+        for i in range(30):
+            self.search.index("works", "work-type", i, {})
+        first, second = self.search.query_works_multi(self.queries)
+        eq_(10, len(first['hits']['hits']))
+        eq_(range(20, 25), [x['_id'] for x in second['hits']['hits']])
+
+
+class TestParsedQuery(object):
+
+    def setup(self):
+        ParsedQuery._parsed.clear()
+
+    def test_parse(self):
+        parsed = ParsedQuery.parse(u"children's science fiction dinosaurs")
+        eq_("Science Fiction", parsed.genre.name)
+        eq_(Classifier.AUDIENCE_CHILDREN, parsed.audience)
+        eq_("Fiction", parsed.fiction)
+        eq_(True, parsed.classified)
+        eq_(u"dinosaurs", parsed.remaining_string.strip())
+
+        parsed = ParsedQuery.parse(u"basketball")
+        eq_(False, parsed.fuzzy)
+        eq_(False, parsed.classified)
+
+        parsed = ParsedQuery.parse(u"age 8-10")
+        eq_((8, 10), tuple(parsed.age))
+
+    def test_parse_is_cached(self):
+        parsed = ParsedQuery.parse(u"test romance")
+        assert parsed is ParsedQuery.parse(u"test romance")
+        eq_(1, ParsedQuery._parsed.hits)
+        assert parsed is not ParsedQuery.parse(u"test mystery")
+
+
 class TestSearchFilterFromLane(DatabaseTest):
         
     def test_query_works_from_lane_definition_handles_age_range(self):
@@ -967,3 +1048,90 @@ class TestSearchErrors(ExternalSearchTest):
         eq_(1, len(failures))
         eq_(failing_work, failures[0][0])
         eq_("There was an error!", failures[0][1])
+
+
+class TestSearchResultCache(DatabaseTest):
+
+    def setup(self):
+        super(TestSearchResultCache, self).setup()
+        self.search = DummyExternalSearchIndex()
+
+    def key(self, query, **kwargs):
+        args = dict(
+            media=[Edition.BOOK_MEDIUM], languages=["eng", "spa"],
+            exclude_languages=None, fiction=True,
+            audiences=[Classifier.AUDIENCE_ADULT], age_range=None,
+            genre_ids=[3, 1], offset=0, size=50,
+        )
+        args.update(kwargs)
+        return SearchResultCache.key(self.search, query, **args)
+
+    def test_key(self):
+        key = self.key(u"Moby Dick")
+
+        # Case, extra whitespace, and the order of list filters don't
+        # matter.
+        eq_(key, self.key("  moby   DICK "))
+        eq_(key, self.key(u"moby dick", languages=["spa", "eng"],
+                          genre_ids=[1, 3]))
+
+        # Everything else does.
+        assert key != self.key(u"moby")
+        assert key != self.key(u"moby dick", fiction=False)
+        assert key != self.key(u"moby dick", offset=50)
+        assert key != self.key(u"moby dick", age_range=[8, 12])
+
+        # So does the index the works alias points to.
+        self.search.works_index = "works-v2"
+        SearchResultCache.index_changed()
+        assert key != self.key(u"moby dick")
+
+    def test_alias_is_checked_occasionally(self):
+        key = self.key(u"moby dick")
+        self.search.works_index = "works-v2"
+
+        # We don't notice the alias has moved until it's time to check
+        # again.
+        eq_(key, self.key(u"moby dick"))
+        SearchResultCache._index_checked_at -= (
+            SearchResultCache.ALIAS_CHECK_INTERVAL + 1
+        )
+        eq_("works-v2", self.key(u"moby dick")[0])
+
+    def test_lookup_and_remember(self):
+        key = self.key(u"moby dick")
+        eq_(None, SearchResultCache.lookup(self._db, key))
+        SearchResultCache.remember(self._db, key, [3, 1, 2])
+        eq_([3, 1, 2], SearchResultCache.lookup(self._db, key))
+
+        stats = SearchResultCache.stats()
+        eq_(2, stats['lookups'])
+        eq_(1, stats['memory_hits'])
+        eq_(0.5, stats['hit_rate'])
+
+    def test_postgres_backend(self):
+        with temp_config() as config:
+            config[Configuration.POLICIES] = {
+                Configuration.SEARCH_RESULT_CACHE_POLICY :
+                Configuration.SEARCH_RESULT_CACHE_POSTGRES
+            }
+            key = self.key(u"moby dick")
+            SearchResultCache.remember(self._db, key, [3, 1, 2])
+
+            # Another process would find the result in the database.
+            SearchResultCache._memory.clear()
+            eq_([3, 1, 2], SearchResultCache.lookup(self._db, key))
+            eq_(1, SearchResultCache.table_hits)
+            eq_([3, 1, 2], SearchResultCache.lookup(self._db, key))
+            eq_(1, SearchResultCache.stats()['memory_hits'])
+
+    def test_cache_can_be_turned_off(self):
+        with temp_config() as config:
+            config[Configuration.POLICIES] = {
+                Configuration.SEARCH_RESULT_CACHE_POLICY :
+                Configuration.SEARCH_RESULT_CACHE_OFF
+            }
+            key = self.key(u"moby dick")
+            eq_(None, key)
+            SearchResultCache.remember(self._db, key, [1])
+            eq_(None, SearchResultCache.lookup(self._db, key))
@@ -23,6 +23,7 @@ from lane import (
     Lane,
     LaneList,
     UndefinedLane,
+    make_lanes,
 )
 
 from config import (
@@ -30,6 +31,8 @@ from config import (
     temp_config,
 )
 
+from external_search import DummyExternalSearchIndex
+
 from model import (
     get_one_or_create,
     DataSource,
@@ -321,6 +324,105 @@ class TestLane(DatabaseTest):
         eq_(True, all_language_lane.includes_language('eng'))
         eq_(True, all_language_lane.includes_language('fre'))
 
+    def test_search_uses_cached_results(self):
+        work1 = self._work(with_open_access_download=True)
+        work2 = self._work(with_open_access_download=True)
+        work1.set_presentation_ready()
+        work2.set_presentation_ready()
+        SessionManager.refresh_materialized_views(self._db)
+
+        search_client = DummyExternalSearchIndex()
+        work1.update_external_index(search_client)
+        work2.update_external_index(search_client)
+        queries = []
+        query_works = search_client.query_works
+        def counting_query_works(*args, **kwargs):
+            queries.append(args)
+            return query_works(*args, **kwargs)
+        search_client.query_works = counting_query_works
+
+        lane = Lane(self._db, self._str, searchable=True)
+        with temp_config() as config:
+            config[Configuration.POLICIES] = {
+                Configuration.SEARCH_WINDOW_SIZE_POLICY : 100
+            }
+            results = lane.search(u"Moby Dick", search_client)
+            eq_(sorted([work1.id, work2.id]),
+                sorted(x.works_id for x in results))
+            eq_(1, len(queries))
+
+            # The same search, normalized, doesn't go to the search
+            # index again, but its works are still looked up.
+            again = lane.search(u"moby  dick", search_client)
+            eq_([x.works_id for x in results],
+                [x.works_id for x in again])
+            eq_(1, len(queries))
+
+            # Pages within the same window of results come from the
+            # cache.
+            [second] = lane.search(
+                u"moby dick", search_client, Pagination(offset=1, size=1)
+            )
+            eq_(results[1].works_id, second.works_id)
+            eq_(1, len(queries))
+
+            # A page in the next window is a different search.
+            eq_([], lane.search(
+                u"moby dick", search_client, Pagination(offset=100, size=1)
+            ))
+            eq_(2, len(queries))
+
+    def test_search_window(self):
+        def window(offset, size):
+            return Lane._search_window(Pagination(offset=offset, size=size))
+
+        # By default, only the requested page is fetched.
+        eq_((150, 10), window(150, 10))
+
+        with temp_config() as config:
+            config[Configuration.POLICIES] = {
+                Configuration.SEARCH_WINDOW_SIZE_POLICY : 100
+            }
+            eq_((0, 100), window(0, 10))
+            eq_((0, 100), window(90, 10))
+            eq_((100, 100), window(150, 10))
+            eq_((0, 200), window(95, 10))
+
+            # Without a cache, the rest of the window would be wasted.
+            config[Configuration.POLICIES][
+                Configuration.SEARCH_RESULT_CACHE_POLICY
+            ] = Configuration.SEARCH_RESULT_CACHE_OFF
+            eq_((150, 10), window(150, 10))
+
+    def test_search_lanes(self):
+        work = self._work(with_open_access_download=True)
+        work.set_presentation_ready()
+        SessionManager.refresh_materialized_views(self._db)
+
+        search_client = DummyExternalSearchIndex()
+        work.update_external_index(search_client)
+        batches = []
+        query_works_multi = search_client.query_works_multi
+        def recording_query_works_multi(searches, **kwargs):
+            batches.append(searches)
+            return query_works_multi(searches, **kwargs)
+        search_client.query_works_multi = recording_query_works_multi
+
+        fiction = Lane(self._db, u"Fiction", fiction=True, searchable=True)
+        nonfiction = Lane(
+            self._db, u"Nonfiction", fiction=False, searchable=True
+        )
+        unsearchable = Lane(self._db, u"Unsearchable")
+        results = Lane.search_lanes(
+            [fiction, unsearchable, nonfiction], u"dragons", search_client
+        )
+
+        # Both searchable lanes were searched in a single request.
+        [batch] = batches
+        eq_([True, False], [search[4] for search in batch])
+        eq_([[work.id], [], [work.id]],
+            [[x.works_id for x in r] for r in results])
+
         
 class TestLanes(DatabaseTest):
 
@@ -1085,6 +1187,38 @@ class TestLanesQuery(DatabaseTest):
         eq_([], young_adult.genre_ids)
         eq_(Lane.BOTH_FICTION_AND_NONFICTION, young_adult.fiction)
 
+    def test_make_lanes_builds_each_tree_once(self):
+        definitions = [
+            dict(full_name="Fiction", fiction=True,
+                 sublanes=[classifier.Fantasy.name]),
+            dict(full_name="Young Adult",
+                 fiction=Lane.BOTH_FICTION_AND_NONFICTION,
+                 audiences=Classifier.AUDIENCE_YOUNG_ADULT),
+        ]
+        lanes = make_lanes(self._db, definitions)
+        fantasy = lanes.by_languages['']['Fantasy']
+        eq_("Fiction", fantasy.parent.name)
+        young_adult = lanes.by_languages['']['Young Adult']
+        gutenberg = DataSource.lookup(self._db, DataSource.GUTENBERG)
+        eq_(gutenberg.id, young_adult._gutenberg_data_source_id)
+
+        # Making the same lanes again, for another session, doesn't
+        # need the database at all.
+        again = make_lanes(None, definitions)
+        eq_([x.name for x in lanes.lanes], [x.name for x in again.lanes])
+        [fiction] = [x for x in again.lanes if x.name == "Fiction"]
+        eq_(None, fiction._db)
+        [fantasy_again] = fiction.sublanes.lanes
+        eq_(fantasy.genre_ids, fantasy_again.genre_ids)
+        assert fantasy_again.parent is fiction
+        assert again.by_languages['']['Fantasy'] is fantasy_again
+        eq_(gutenberg.id, again.by_languages['']['Young Adult']
+            .gutenberg_data_source_id)
+
+        # Different definitions make a different tree.
+        other = make_lanes(self._db, definitions[:1])
+        eq_(["Fiction"], [x.name for x in other.lanes])
+
 
 class TestFilters(DatabaseTest):
 
@@ -9,6 +9,8 @@ from nose.tools import (
 from model import (
     DataSource,
     Measurement,
+    Work,
+    WorkCoverageRecord,
     get_one_or_create
 )
 
@@ -231,3 +233,54 @@ class TestMeasurement(DatabaseTest):
         eq_(0, w.quality)
         w.calculate_quality([], 0.4)
         eq_(0.4, w.quality)
+
+    def test_calculate_quality_for_works(self):
+        # This work has a popularity measurement, and an equivalent
+        # identifier with two ratings and a quality score.
+        w1 = self._work(with_open_access_download=True)
+        identifier = w1.presentation_edition.primary_identifier
+        identifier.add_measurement(self.source, Measurement.POPULARITY, 6000)
+        identifier.add_measurement(self.source, Measurement.POPULARITY, 59)
+        identifier.add_measurement(self.source, "Some other quantity", 42)
+        equivalent = self._identifier()
+        identifier.equivalent_to(self.source, equivalent, 1)
+        equivalent.add_measurement(self.source, Measurement.RATING, 8)
+        amazon = DataSource.lookup(self._db, DataSource.AMAZON)
+        equivalent.add_measurement(amazon, Measurement.RATING, 2, weight=3)
+        wrangler = DataSource.lookup(self._db, DataSource.METADATA_WRANGLER)
+        equivalent.add_measurement(wrangler, Measurement.QUALITY, 0.6)
+
+        # This work has no measurements, and its license pool comes
+        # from a source with a high default quality.
+        w2 = self._work(with_license_pool=True)
+        w2.license_pools[0].data_source = DataSource.lookup(
+            self._db, DataSource.THREEM
+        )
+
+        # This work has no measurements and no license pools at all.
+        w3 = self._work()
+
+        qualities = Work.calculate_quality_for_works(
+            self._db, [w1.id, w2.id, w3.id]
+        )
+
+        # The results are what calculate_quality() would have found.
+        expect = {}
+        for work, default in ((w1, 0), (w2, 0.65), (w3, 0)):
+            work.calculate_quality(work.all_identifier_ids(), default)
+            expect[work.id] = work.quality
+        eq_(set(expect.keys()), set(qualities.keys()))
+        for work_id, quality in expect.items():
+            eq_(round(quality, 6), round(qualities[work_id], 6))
+        eq_(0.65, qualities[w2.id])
+        eq_(0, qualities[w3.id])
+
+        # The new qualities were written to the database, and each
+        # work got a coverage record.
+        self._db.expire_all()
+        eq_(round(expect[w1.id], 6), round(w1.quality, 6))
+        for work in (w1, w2, w3):
+            record = WorkCoverageRecord.lookup(
+                work, WorkCoverageRecord.QUALITY_OPERATION
+            )
+            eq_(WorkCoverageRecord.SUCCESS, record.status)
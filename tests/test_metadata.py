@@ -1,5 +1,6 @@
 from StringIO import StringIO
 from nose.tools import (
+    assert_raises_regexp,
     eq_,
     set_trace,
 )
@@ -7,6 +8,7 @@ import datetime
 import pkgutil
 import csv
 from copy import deepcopy
+from sqlalchemy import event
 
 from metadata_layer import (
     CSVFormatError,
@@ -19,12 +21,14 @@ from metadata_layer import (
     Metadata,
     IdentifierData,
     ReplacementPolicy,
+    SortNameCache,
     SubjectData,
     ContributorData,
 )
 
 import os
 from model import (
+    CachedSortName,
     Contributor,
     CoverageRecord,
     DataSource,
@@ -34,6 +38,7 @@ from model import (
     DeliveryMechanism,
     Hyperlink, 
     Representation,
+    Resource,
     RightsStatus,
     Subject,
 )
@@ -41,9 +46,11 @@ from model import (
 from . import (
     DatabaseTest,
     DummyHTTPClient,
+    DummyMetadataClient,
 )
 
 from s3 import DummyS3Uploader
+from testing import MockRequestsResponse
 from classifier import NO_VALUE, NO_NUMBER
 
 class TestIdentifierData(object):
@@ -567,6 +574,72 @@ class TestContributorData(DatabaseTest):
         contributor_new, changed = contributor_data.apply(contributor_new)
         eq_(changed, False)
 
+    def test_find_sort_name_uses_cache(self):
+        metadata_client = DummyMetadataClient()
+        metadata_client.lookups[u"Bob Bitshifter"] = u"Bitshifter, Bob"
+
+        data = ContributorData(display_name=u"Bob Bitshifter")
+        eq_(True, data.find_sort_name(self._db, [], metadata_client))
+        eq_(u"Bitshifter, Bob", data.sort_name)
+
+        # The answer was remembered in the database.
+        cached = CachedSortName.lookup(self._db, u"Bob Bitshifter")
+        eq_(u"Bitshifter, Bob", cached.sort_name)
+        assert cached.expires > datetime.datetime.utcnow()
+
+        # The next time the name comes up, the metadata wrangler
+        # isn't asked.
+        metadata_client.lookups = {}
+        data = ContributorData(display_name=u"Bob Bitshifter")
+        eq_(True, data.find_sort_name(self._db, [], metadata_client))
+        eq_(u"Bitshifter, Bob", data.sort_name)
+        eq_(1, SortNameCache.stats()['memory_hits'])
+
+        # That's still true once the answer is no longer in memory.
+        SortNameCache.reset()
+        data = ContributorData(display_name=u"Bob Bitshifter")
+        eq_(True, data.find_sort_name(self._db, [], metadata_client))
+        eq_(u"Bitshifter, Bob", data.sort_name)
+        stats = SortNameCache.stats()
+        eq_(1, stats['table_hits'])
+        eq_(1.0, stats['hit_rate'])
+
+    def test_find_sort_name_remembers_negative_results(self):
+        metadata_client = DummyMetadataClient()
+        data = ContributorData(display_name=u"Nobody Known")
+        eq_(False, data.find_sort_name(self._db, [], metadata_client))
+        eq_(None, data.sort_name)
+
+        # The failure was remembered, but only for a little while.
+        cached = CachedSortName.lookup(self._db, u"Nobody Known")
+        eq_(None, cached.sort_name)
+        assert (cached.expires <
+                datetime.datetime.utcnow() + SortNameCache.POSITIVE_TTL)
+
+        # Even if the metadata wrangler learns the name, we don't ask
+        # again until the negative result expires.
+        metadata_client.lookups[u"Nobody Known"] = u"Known, Nobody"
+        data = ContributorData(display_name=u"Nobody Known")
+        eq_(False, data.find_sort_name(self._db, [], metadata_client))
+
+        SortNameCache.reset()
+        cached.expires = datetime.datetime.utcnow() - datetime.timedelta(1)
+        data = ContributorData(display_name=u"Nobody Known")
+        eq_(True, data.find_sort_name(self._db, [], metadata_client))
+        eq_(u"Known, Nobody", data.sort_name)
+
+    def test_find_sort_name_does_not_remember_server_errors(self):
+        class BrokenMetadataClient(object):
+            def canonicalize_author_name(self, identifier, display_name):
+                return MockRequestsResponse(500, {}, "oops")
+
+        data = ContributorData(display_name=u"Bob Bitshifter")
+        eq_(False, data.find_sort_name(
+            self._db, [], BrokenMetadataClient()
+        ))
+        eq_(None, CachedSortName.lookup(self._db, u"Bob Bitshifter"))
+        eq_((False, None), SortNameCache.lookup(self._db, u"Bob Bitshifter"))
+
 
 
 class TestMetadata(DatabaseTest):
@@ -675,6 +748,225 @@ class TestMetadata(DatabaseTest):
         eq_(equivalency.output.type, u"abc")
         eq_(equivalency.output.identifier, u"def")
 
+    def test_apply_many(self):
+        existing = self._edition(
+            data_source_name=DataSource.GUTENBERG, authors=[]
+        )
+        author = self._contributor(sort_name=u"Author, Existing")[0]
+        url = self._url
+
+        def metadata(identifier, title):
+            return Metadata(
+                DataSource.GUTENBERG,
+                title=title,
+                primary_identifier=identifier,
+                identifiers=[IdentifierData(Identifier.ISBN, u"9780674368279")],
+                contributors=[
+                    ContributorData(sort_name=u"Author, Existing"),
+                    ContributorData(sort_name=u"Author, New"),
+                ],
+                subjects=[
+                    SubjectData(Subject.TAG, u"new tag", name=u"A new tag"),
+                ],
+                links=[
+                    LinkData(rel=Hyperlink.IMAGE, href=url,
+                             media_type=Representation.JPEG_MEDIA_TYPE),
+                ],
+            )
+
+        m1 = metadata(existing.primary_identifier, u"Existing Edition")
+        m2 = metadata(
+            IdentifierData(Identifier.GUTENBERG_ID, u"12345"), u"New Edition"
+        )
+        [(e1, changed1), (e2, changed2)] = Metadata.apply_many(
+            self._db, [m1, m2]
+        )
+
+        # The existing edition was updated and a new one was created.
+        eq_(existing, e1)
+        eq_(u"Existing Edition", e1.title)
+        eq_(u"New Edition", e2.title)
+        eq_(u"12345", e2.primary_identifier.identifier)
+        eq_(True, changed1)
+        eq_(True, changed2)
+
+        # Both editions share the same Contributors, Subject, Resource
+        # and equivalent Identifier, each of which exists only once.
+        for edition in e1, e2:
+            contributors = sorted(
+                [c.contributor for c in edition.contributions],
+                key=lambda c: c.sort_name
+            )
+            eq_(author, contributors[0])
+            eq_([u"Author, Existing", u"Author, New"],
+                [c.sort_name for c in contributors])
+
+            [classification] = edition.primary_identifier.classifications
+            eq_(u"new tag", classification.subject.identifier)
+            eq_(u"A new tag", classification.subject.name)
+
+            [link] = edition.primary_identifier.links
+            eq_(url, link.resource.url)
+
+            [equivalency] = edition.primary_identifier.equivalencies
+            eq_(u"9780674368279", equivalency.output.identifier)
+
+        eq_(1, self._db.query(Contributor).filter(
+            Contributor.sort_name==u"Author, New").count())
+        eq_(1, self._db.query(Subject).filter(
+            Subject.identifier==u"new tag").count())
+
+        # Applying the same metadata one item at a time gives the
+        # same result.
+        m3 = metadata(
+            IdentifierData(Identifier.GUTENBERG_ID, u"67890"), u"One at a time"
+        )
+        e3, is_new = m3.edition(self._db)
+        m3.apply(e3)
+        eq_(sorted(c.contributor for c in e2.contributions),
+            sorted(c.contributor for c in e3.contributions))
+        eq_([c.subject for c in e2.primary_identifier.classifications],
+            [c.subject for c in e3.primary_identifier.classifications])
+        eq_([l.resource for l in e2.primary_identifier.links],
+            [l.resource for l in e3.primary_identifier.links])
+
+    def test_apply_many_creates_only_what_apply_uses(self):
+        # Metadata that won't be applied, because its data source
+        # hasn't updated it since the last time it was applied.
+        yesterday = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+        existing = self._edition(data_source_name=DataSource.GUTENBERG)
+        CoverageRecord.add_for(existing, existing.data_source)
+
+        def metadata(identifier, title, **kwargs):
+            return Metadata(
+                DataSource.GUTENBERG,
+                title=title,
+                primary_identifier=identifier,
+                identifiers=[IdentifierData(Identifier.ISBN, self._isbn)],
+                contributors=[ContributorData(sort_name=self._str)],
+                subjects=[SubjectData(Subject.TAG, self._str)],
+                links=[LinkData(rel=Hyperlink.IMAGE, href=self._url)],
+                **kwargs
+            )
+
+        def created(metadata):
+            """What objects mentioned by the metadata now exist?"""
+            [identifier] = [x for x in metadata.identifiers
+                            if x.type == Identifier.ISBN]
+            [contributor] = metadata.contributors
+            [subject] = metadata.subjects
+            [link] = metadata.links
+            return [
+                self._db.query(Identifier).filter(
+                    Identifier.identifier==identifier.identifier).count(),
+                self._db.query(Contributor).filter(
+                    Contributor.sort_name==contributor.sort_name).count(),
+                self._db.query(Subject).filter(
+                    Subject.identifier==subject.identifier).count(),
+                self._db.query(Resource).filter(
+                    Resource.url==link.href).count(),
+            ]
+
+        for apply_one_at_a_time in True, False:
+            skipped = metadata(
+                existing.primary_identifier, u"Skipped",
+                data_source_last_updated=yesterday
+            )
+            applied = metadata(
+                IdentifierData(Identifier.GUTENBERG_ID, self._str), u"Applied"
+            )
+            if apply_one_at_a_time:
+                for m in skipped, applied:
+                    edition, ignore = m.edition(self._db)
+                    m.apply(edition)
+            else:
+                Metadata.apply_many(self._db, [skipped, applied])
+
+            # Only the item that was actually applied created
+            # anything.
+            eq_([0, 0, 0, 0], created(skipped))
+            eq_([1, 1, 1, 1], created(applied))
+
+    def test_apply_many_makes_fewer_queries(self):
+        def metadata(title):
+            return Metadata(
+                DataSource.GUTENBERG,
+                title=title,
+                primary_identifier=IdentifierData(
+                    Identifier.GUTENBERG_ID, self._str
+                ),
+                identifiers=[IdentifierData(Identifier.ISBN, self._isbn)],
+                contributors=[ContributorData(sort_name=self._str),
+                              ContributorData(sort_name=self._str)],
+                subjects=[SubjectData(Subject.TAG, self._str),
+                          SubjectData(Subject.TAG, self._str)],
+                links=[LinkData(rel=Hyperlink.IMAGE, href=self._url)],
+            )
+
+        statements = []
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        def queries(apply):
+            del statements[:]
+            event.listen(self.connection, 'before_cursor_execute', count)
+            try:
+                apply([metadata(self._str) for i in range(3)])
+                self._db.flush()
+            finally:
+                event.remove(self.connection, 'before_cursor_execute', count)
+            return len(statements)
+
+        def one_at_a_time(metadata_list):
+            for m in metadata_list:
+                edition, ignore = m.edition(self._db)
+                m.apply(edition)
+
+        def in_bulk(metadata_list):
+            Metadata.apply_many(self._db, metadata_list)
+
+        # Warm up anything that's looked up once per process, like
+        # the DataSource.
+        queries(one_at_a_time)
+
+        per_item = queries(one_at_a_time)
+        batched = queries(in_bulk)
+        assert batched < per_item, (
+            "apply_many made %d queries; apply made %d" % (batched, per_item)
+        )
+
+    def test_apply_many_failures(self):
+        bad = Metadata(
+            None, primary_identifier=IdentifierData(
+                Identifier.GUTENBERG_ID, self._str
+            )
+        )
+        good = Metadata(
+            DataSource.GUTENBERG, title=u"Good",
+            primary_identifier=IdentifierData(
+                Identifier.GUTENBERG_ID, self._str
+            )
+        )
+
+        # By default, an item that can't be applied stops the batch.
+        assert_raises_regexp(
+            ValueError, "No data source specified!",
+            Metadata.apply_many, self._db, [bad, good]
+        )
+
+        # If a dictionary is passed in, the failure is recorded
+        # there and the rest of the batch is applied.
+        failures = {}
+        [bad_result, (edition, changed)] = Metadata.apply_many(
+            self._db, [bad, good], failures=failures
+        )
+        eq_(None, bad_result)
+        eq_(u"Good", edition.title)
+        [(exception, traceback)] = failures.values()
+        eq_([0], failures.keys())
+        assert isinstance(exception, ValueError)
+        assert "No data source specified!" in traceback
+
     def test_apply_no_value(self):
         edition_old, pool = self._edition(with_license_pool=True)
 
@@ -806,6 +1098,34 @@ class TestMetadata(DatabaseTest):
         # If deepcopy didn't throw an exception we're ok.
         assert m_copy is not None
 
+        # Every slot was copied, including the private list of links.
+        eq_("Hello Title", m_copy.title)
+        eq_([], m_copy.links)
+        eq_([x.identifier for x in m.identifiers],
+            [x.identifier for x in m_copy.identifiers])
+        eq_(0, m_copy.circulation.licenses_owned)
+        eq_("1", m_copy.circulation.primary_identifier.identifier)
+        eq_("subject", m_copy.subjects[0].identifier)
+
+    def test_data_classes_have_no_instance_dict(self):
+        # Imports create hundreds of thousands of these objects, so
+        # they use __slots__ instead of a per-instance __dict__.
+        identifier = IdentifierData(Identifier.GUTENBERG_ID, "1")
+        link = LinkData(Hyperlink.OPEN_ACCESS_DOWNLOAD, "example.epub")
+        objects = [
+            SubjectData(Subject.TAG, "subject"),
+            ContributorData(),
+            identifier,
+            link,
+            MeasurementData(Measurement.RATING, 5),
+            FormatData(Representation.EPUB_MEDIA_TYPE,
+                       DeliveryMechanism.NO_DRM, link=link),
+            CirculationData(DataSource.GUTENBERG, identifier),
+            Metadata(DataSource.GUTENBERG, primary_identifier=identifier),
+        ]
+        for o in objects:
+            assert not hasattr(o, '__dict__')
+
 
     def test_links_filtered(self):
         # test that filter links to only metadata-relevant ones
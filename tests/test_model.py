@@ -28,6 +28,7 @@ from sqlalchemy.orm.exc import (
     NoResultFound,
     MultipleResultsFound
 )
+from sqlalchemy.orm.session import Session
 
 from config import (
     Configuration, 
@@ -37,6 +38,8 @@ from config import (
 from model import (
     Annotation,
     BaseCoverageRecord,
+    CachedFeed,
+    CachedSearchResult,
     CirculationEvent,
     Classification,
     Collection,
@@ -63,6 +66,7 @@ from model import (
     Representation,
     Resource,
     RightsStatus,
+    SearchIndexChange,
     SessionManager,
     Subject,
     Timestamp,
@@ -74,6 +78,7 @@ from model import (
     create,
     get_one,
     get_one_or_create,
+    numericrange_to_tuple,
 )
 from external_search import (
     DummyExternalSearchIndex,
@@ -163,6 +168,59 @@ class TestDataSource(DatabaseTest):
         )
         eq_(True, new_source.offers_licenses)
         
+    def test_lookup_is_cached(self):
+        cache = DataSource._lookup_cache
+        gutenberg = DataSource.lookup(self._db, DataSource.GUTENBERG)
+        eq_(1, cache.misses)
+
+        # The second lookup, even from another session, is answered
+        # from the cache.
+        other_db = Session(self.connection)
+        try:
+            other_gutenberg = DataSource.lookup(other_db, DataSource.GUTENBERG)
+            eq_(1, cache.hits)
+            eq_(gutenberg.id, other_gutenberg.id)
+            assert other_gutenberg in other_db
+        finally:
+            other_db.close()
+        assert gutenberg is DataSource.lookup(self._db, DataSource.GUTENBERG)
+
+        # A newly created data source isn't cached until it's
+        # committed, even if it's looked up again in the meantime.
+        name = "Brand new data source " + self._str
+        new_source = DataSource.lookup(self._db, name, autocreate=True)
+        eq_(None, cache.get(self._db, name))
+        eq_(new_source, DataSource.lookup(self._db, name))
+        eq_(None, cache.get(self._db, name))
+
+        # A data source created in a transaction that's rolled back
+        # is never cached.
+        savepoint = self._db.begin_nested()
+        doomed = "Doomed data source " + self._str
+        DataSource.lookup(self._db, doomed, autocreate=True)
+        DataSource.lookup(self._db, doomed)
+        savepoint.rollback()
+
+        self._db.commit()
+        eq_(new_source, cache.get(self._db, name))
+        eq_(None, cache.get(self._db, doomed))
+
+        # Changing a data source drops it from the cache.
+        new_source.offers_licenses = True
+        self._db.flush()
+        eq_(None, cache.get(self._db, name))
+
+    def test_lookup_cache_survives_new_associated_rows(self):
+        cache = DataSource._lookup_cache
+        gutenberg = DataSource.lookup(self._db, DataSource.GUTENBERG)
+
+        # Creating an Edition adds it to the data source's 'editions'
+        # collection, but doesn't change the data source itself.
+        edition = self._edition(data_source_name=DataSource.GUTENBERG)
+        edition.data_source = gutenberg
+        self._db.flush()
+        eq_(gutenberg, cache.get(self._db, DataSource.GUTENBERG))
+
     def test_metadata_sources_for(self):
         content_cafe = DataSource.lookup(self._db, DataSource.CONTENT_CAFE)
         isbn_metadata_sources = DataSource.metadata_sources_for(
@@ -225,6 +283,41 @@ class TestIdentifier(DatabaseTest):
             self._db, Identifier.BIBLIOTHECA_ID, "foo/bar"
         )
 
+    def test_for_foreign_ids(self):
+        existing = self._identifier(Identifier.ISBN, self._isbn)
+        isbn = self._isbn
+
+        identifiers, new_keys = Identifier.for_foreign_ids(
+            self._db, [
+                (Identifier.ISBN, existing.identifier),
+                (Identifier.ISBN, isbn),
+                (Identifier.ISBN, isbn),
+                ("3M ID", "ABC"),
+                (Identifier.BIBLIOTHECA_ID, "foo/bar"),
+                (None, None),
+            ]
+        )
+
+        # The existing identifier was found, and the others were
+        # created once each. Deprecated types and capitalization were
+        # normalized, and the invalid identifier was ignored.
+        eq_(3, len(identifiers))
+        eq_(existing, identifiers[(Identifier.ISBN, existing.identifier)])
+        eq_(set([(Identifier.ISBN, isbn), (Identifier.BIBLIOTHECA_ID, "abc")]),
+            new_keys)
+        new, was_new = Identifier.for_foreign_id(
+            self._db, Identifier.ISBN, isbn
+        )
+        eq_(False, was_new)
+        eq_(new, identifiers[(Identifier.ISBN, isbn)])
+
+        # Doing it again doesn't create anything.
+        again, new_keys = Identifier.for_foreign_ids(
+            self._db, [(Identifier.ISBN, isbn)]
+        )
+        eq_(set(), new_keys)
+        eq_(new, again[(Identifier.ISBN, isbn)])
+
     def test_valid_as_foreign_identifier(self):
         m = Identifier.valid_as_foreign_identifier
 
@@ -640,6 +733,58 @@ class TestSubject(DatabaseTest):
         eq_(None, subject.genre)
         eq_(None, subject.fiction)
 
+    def test_bulk_assign_to_genres(self):
+        # This Subject's genre and audience data is totally wrong.
+        children, ignore = Subject.lookup(
+            self._db, Subject.TAG, "Children's books", None
+        )
+        children.audience = Classifier.AUDIENCE_ADULT
+        children.fiction = False
+        sf, ignore = Genre.lookup(self._db, "Science Fiction")
+        children.genre = sf
+
+        # This one identifies a genre.
+        romance, ignore = Subject.lookup(
+            self._db, Subject.TAG, "Romance", None
+        )
+
+        # This one has been locked by a human, and this one has no
+        # classifier.
+        locked, ignore = Subject.lookup(
+            self._db, Subject.TAG, "Science fiction", None
+        )
+        locked.locked = True
+        unknown, ignore = Subject.lookup(
+            self._db, "Unknown type", "Romance", None
+        )
+
+        eq_(2, Subject.bulk_assign_to_genres(self._db, batch_size=1))
+
+        # The results are the same as assign_to_genre() would have
+        # given.
+        for subject in (children, romance):
+            genre_name, audience, target_age, fiction = (
+                Subject.classification_for(
+                    subject.type, subject.identifier, subject.name
+                )
+            )
+            eq_(True, subject.checked)
+            eq_(genre_name, subject.genre and subject.genre.name)
+            eq_(audience, subject.audience)
+            eq_(target_age, numericrange_to_tuple(subject.target_age))
+            eq_(fiction, subject.fiction)
+        eq_(Classifier.AUDIENCE_CHILDREN, children.audience)
+        eq_(None, children.genre)
+        eq_("Romance", romance.genre.name)
+
+        eq_(False, locked.checked)
+        eq_(None, locked.genre)
+        eq_(False, unknown.checked)
+
+        # Checked subjects are left alone unless the check is forced.
+        eq_(0, Subject.bulk_assign_to_genres(self._db))
+        eq_(2, Subject.bulk_assign_to_genres(self._db, force=True))
+
 
 class TestContributor(DatabaseTest):
 
@@ -1169,6 +1314,38 @@ class TestEdition(DatabaseTest):
         edition.calculate_permanent_work_id()
         assert_not_equal(None, edition.permanent_work_id)
 
+    def test_calculate_permanent_work_ids(self):
+        book = self._edition(title=u"The Title", authors=[u"Author, An"])
+        audio = self._edition(title=u"The Title", authors=[u"Author, An"])
+        audio.medium = Edition.AUDIO_MEDIUM
+        other = self._edition(title=u"Another Title: A Novel")
+        untitled = self._edition()
+        untitled.permanent_work_id = u"obsolete"
+        untitled.title = None
+        editions = [book, audio, other, untitled]
+
+        # Find out what calculate_permanent_work_id would have done.
+        expect = []
+        for edition in editions:
+            edition.calculate_permanent_work_id()
+            expect.append(edition.permanent_work_id)
+            edition.permanent_work_id = u"obsolete"
+        self._db.commit()
+
+        changed = Edition.calculate_permanent_work_ids(self._db, editions)
+        eq_(4, changed)
+        eq_(expect, [e.permanent_work_id for e in editions])
+        eq_(None, untitled.permanent_work_id)
+        eq_(book.permanent_work_id, audio.permanent_work_id)
+
+        # The new values were written to the database, not just to
+        # the objects.
+        self._db.expire_all()
+        eq_(expect, [e.permanent_work_id for e in editions])
+
+        # Running it again changes nothing.
+        eq_(0, Edition.calculate_permanent_work_ids(self._db, editions))
+
 
 class TestLicensePool(DatabaseTest):
 
@@ -1941,6 +2118,31 @@ class TestWork(DatabaseTest):
         eq_(True, work.presentation_ready)
         eq_([index_key], search.docs.keys())
 
+    def test_update_external_index_can_queue_changes(self):
+        work = self._work(with_license_pool=True)
+        search = DummyExternalSearchIndex()
+        with temp_config() as config:
+            config[Configuration.POLICIES] = {
+                Configuration.SEARCH_INDEX_UPDATE_POLICY :
+                Configuration.SEARCH_INDEX_UPDATE_QUEUE
+            }
+            work.set_presentation_ready_based_on_content(
+                search_index_client=search
+            )
+            work.presentation_edition.title = None
+            work.set_presentation_ready_based_on_content(
+                search_index_client=search
+            )
+
+        # Nothing was sent to the search index. Instead, the changes
+        # were queued.
+        eq_({}, search.docs)
+        changes = self._db.query(SearchIndexChange).order_by(
+            SearchIndexChange.id).all()
+        eq_([(work.id, SearchIndexChange.UPDATE),
+             (work.id, SearchIndexChange.DELETE)],
+            [(x.work_id, x.operation) for x in changes])
+
     def test_assign_genres_from_weights(self):
         work = self._work()
 
@@ -3719,6 +3921,79 @@ class TestRepresentation(DatabaseTest):
         fh = representation.content_fh()
         eq_("some text", fh.read())
 
+    def test_content_in_content_store(self):
+        store_dir = os.path.join(self.tmp_data_dir, "content")
+        with temp_config() as config:
+            config[Configuration.REPRESENTATION_CONTENT_STORE] = store_dir
+            r1, ignore = self._representation(self._url, "text/plain")
+            r2, ignore = self._representation(self._url, "text/plain")
+            r1.set_fetched_content("the same text")
+            r2.set_fetched_content("the same text")
+
+            # The content isn't kept in the database.
+            eq_(None, r1._content)
+
+            # Both representations refer to the same blob.
+            assert r1.content_hash is not None
+            eq_(r1.content_hash, r2.content_hash)
+            eq_(len("the same text"), r1.file_size)
+            store = Representation.content_store()
+            assert store.path_for(r1.content_hash).startswith(store_dir)
+
+            eq_("the same text", r1.content)
+            eq_("the same text", r2.content_fh().read())
+            eq_(True, r1.has_stored_content)
+
+            # The content can be streamed into the store.
+            r1.content = iter(["streamed ", "text"])
+            eq_("streamed text", r1.content)
+            eq_("the same text", r2.content)
+
+            r1.content = None
+            eq_(None, r1.content_hash)
+            eq_(False, r1.has_stored_content)
+
+    def test_default_http_get(self):
+        m = Representation.default_http_get
+        with temp_config() as config:
+            config[Configuration.REPRESENTATION_CONTENT_STORE] = None
+            eq_(Representation.simple_http_get, m())
+
+            # If there's a content store, bodies are streamed into it...
+            config[Configuration.REPRESENTATION_CONTENT_STORE] = (
+                os.path.join(self.tmp_data_dir, "content")
+            )
+            eq_(Representation.streaming_http_get, m())
+
+            # ...unless a response reviewer needs to see them.
+            eq_(Representation.simple_http_get, m(object()))
+
+    def test_error_while_streaming_body(self):
+        class Interrupted(Exception):
+            pass
+
+        def stream():
+            yield "The start of a book"
+            raise Interrupted("Connection reset")
+
+        def do_get(url, headers):
+            return 200, {'content-type': 'text/plain'}, stream()
+
+        with temp_config() as config:
+            config[Configuration.REPRESENTATION_CONTENT_STORE] = (
+                os.path.join(self.tmp_data_dir, "content")
+            )
+            representation, cached = Representation.get(
+                self._db, self._url, do_get=do_get
+            )
+
+        # The failure was handled like any other problem with the
+        # request, rather than escaping from get().
+        eq_(False, cached)
+        assert "Connection reset" in representation.fetch_exception
+        eq_(None, representation.status_code)
+        eq_(False, representation.has_stored_content)
+
     def test_unicode_content_utf8_default(self):
         unicode_content = u"It’s complicated."
 
@@ -4363,6 +4638,119 @@ class TestCoverResource(DatabaseTest):
         eq_(1/4.0, f(ideal_width*4, ideal_height))
         eq_(1/4.0, f(ideal_width, ideal_height*4))
 
+    def test_stored_thumbnail_size_quality_penalty(self):
+        # The penalty is stored, so the database can rank covers,
+        # and kept up to date as the image size changes.
+        rep = Representation()
+        rep.image_width = Identifier.IDEAL_IMAGE_WIDTH
+        rep.image_height = Identifier.IDEAL_IMAGE_HEIGHT * 2
+        eq_(0.5, rep.stored_thumbnail_size_quality_penalty)
+        eq_(rep.thumbnail_size_quality_penalty,
+            rep.stored_thumbnail_size_quality_penalty)
+
+        rep.image_width = rep.image_height = None
+        eq_(1, rep.stored_thumbnail_size_quality_penalty)
+
+    def _mirrored_cover(self, identifier, name, data_source,
+                        media_type="image/png"):
+        sample_cover_path = self.sample_cover_path(name)
+        hyperlink, ignore = identifier.add_link(
+            Hyperlink.IMAGE, self._url, data_source, media_type=media_type,
+            content=open(sample_cover_path).read())
+        rep = hyperlink.resource.representation
+        rep.mirror_url = self._url
+        rep.set_as_mirrored()
+        return hyperlink.resource
+
+    def test_best_covers_for(self):
+        overdrive = DataSource.lookup(self._db, DataSource.OVERDRIVE)
+        wrangler = DataSource.lookup(self._db, DataSource.METADATA_WRANGLER)
+
+        # This identifier has a lousy cover, and two decent ones.
+        identifier = self._identifier()
+        lousy = self._mirrored_cover(
+            identifier, "tiny-image-cover.png", overdrive
+        )
+        lousy.representation.image_height = 1
+        lousy.representation.image_width = 10000
+        decent = self._mirrored_cover(
+            identifier, "test-book-cover.png", overdrive
+        )
+        decent_2 = self._mirrored_cover(
+            identifier, "test-book-cover.png", overdrive
+        )
+
+        # This identifier has no covers of its own, but it's equivalent
+        # to an identifier with a cover from the metadata wrangler.
+        identifier_2 = self._identifier()
+        equivalent = self._identifier()
+        identifier_2.equivalent_to(wrangler, equivalent, 1)
+        wrangler_cover = self._mirrored_cover(
+            equivalent, "test-book-cover.png", wrangler
+        )
+
+        # The database can't decide between the two decent covers.
+        m = Identifier.best_covers_for
+        result = m(self._db, [identifier.id, identifier_2.id])
+        eq_([identifier.id], result.keys())
+        eq_(set([decent, decent_2]), set(result[identifier.id]))
+
+        # Its ranking agrees with best_covers_among().
+        eq_(set(Resource.best_covers_among([lousy, decent, decent_2])),
+            set(result[identifier.id]))
+
+        # All else being equal, a PNG beats a JPEG.
+        decent.representation.media_type = Representation.JPEG_MEDIA_TYPE
+        result = m(self._db, [identifier.id])
+        eq_([decent_2], result[identifier.id])
+
+        # Looking further afield finds the equivalent identifier's cover.
+        result = m(self._db, [identifier.id, identifier_2.id], distance=5)
+        eq_([decent_2], result[identifier.id])
+        eq_([wrangler_cover], result[identifier_2.id])
+
+        # A rejected cover isn't considered at all.
+        decent_2.reject()
+        decent.reject()
+        result = m(self._db, [identifier.id])
+        eq_({}, result)
+
+    def test_choose_covers(self):
+        overdrive = DataSource.lookup(self._db, DataSource.OVERDRIVE)
+        wrangler = DataSource.lookup(self._db, DataSource.METADATA_WRANGLER)
+
+        # This edition has a cover of its own.
+        edition = self._edition()
+        cover = self._mirrored_cover(
+            edition.primary_identifier, "test-book-cover.png", overdrive
+        )
+
+        # This one gets a cover from an equivalent identifier.
+        edition_2 = self._edition()
+        equivalent = self._identifier()
+        edition_2.primary_identifier.equivalent_to(wrangler, equivalent, 1)
+        cover_2 = self._mirrored_cover(
+            equivalent, "test-book-cover.png", wrangler
+        )
+
+        # This one has no cover at all, and loses the one it had.
+        edition_3 = self._edition()
+        edition_3.cover_full_url = self._url
+
+        Edition.choose_covers(self._db, [edition, edition_2, edition_3])
+        eq_(cover, edition.cover)
+        eq_(cover.representation.mirror_url, edition.cover_full_url)
+        eq_(cover_2, edition_2.cover)
+        eq_(None, edition_3.cover)
+        eq_(None, edition_3.cover_full_url)
+
+        # Each edition got a coverage record.
+        for e in (edition, edition_2, edition_3):
+            record = CoverageRecord.lookup(
+                e, e.data_source, CoverageRecord.CHOOSE_COVER_OPERATION
+            )
+            assert record is not None
+
 
 class TestDeliveryMechanism(DatabaseTest):
 
@@ -5032,6 +5420,175 @@ class TestDeliveryMechanism(DatabaseTest):
             self.overdrive_streaming_text.content_type_media_type)
 
 
+class TestCachedFeed(DatabaseTest):
+
+    class MockLane(object):
+        name = "A lane"
+        languages = None
+
+    def fetch(self):
+        return CachedFeed.fetch(
+            self._db, self.MockLane(), CachedFeed.PAGE_TYPE, None, None,
+            None, max_age=60
+        )
+
+    def teardown(self):
+        CachedFeed._generating = {}
+        super(TestCachedFeed, self).teardown()
+
+    def test_single_flight_serves_stale_feed(self):
+        # The first request finds nothing in the cache, and claims
+        # the job of generating the feed.
+        feed, usable = self.fetch()
+        eq_(False, usable)
+        feed.update(self._db, u"<feed>old</feed>")
+
+        # Time passes and the feed becomes stale.
+        feed.timestamp = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+
+        # Another request claims the job of regenerating it.
+        eq_(True, feed.claim_generation(self._db))
+
+        # While that's going on, anyone else who asks gets the stale
+        # feed.
+        stale, usable = self.fetch()
+        eq_(feed, stale)
+        eq_(True, usable)
+
+        # Once the feed is regenerated, the claim is released.
+        feed.update(self._db, u"<feed>new</feed>")
+        feed.timestamp = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+        stale, usable = self.fetch()
+        eq_(False, usable)
+
+    def test_single_flight_waits_for_new_feed(self):
+        # Someone else is generating a feed we've never cached.
+        feed, usable = self.fetch()
+        eq_(False, usable)
+
+        # We wait a short time for them to finish, but they don't, so
+        # we generate the feed ourselves.
+        old_wait = CachedFeed.GENERATION_WAIT
+        CachedFeed.GENERATION_WAIT = 0
+        try:
+            feed2, usable = self.fetch()
+        finally:
+            CachedFeed.GENERATION_WAIT = old_wait
+        eq_(False, usable)
+
+    def test_claim_generation(self):
+        feed = CachedFeed(type=CachedFeed.PAGE_TYPE, pagination=u"")
+        same_key = CachedFeed(type=CachedFeed.PAGE_TYPE, pagination=u"")
+        other_key = CachedFeed(type=CachedFeed.GROUPS_TYPE, pagination=u"")
+        eq_(feed.generation_key, same_key.generation_key)
+        assert feed.generation_key != other_key.generation_key
+
+        eq_(True, feed.claim_generation(self._db))
+        eq_(False, same_key.claim_generation(self._db))
+        eq_(True, other_key.claim_generation(self._db))
+
+        # A claim eventually expires.
+        CachedFeed._generating[feed.generation_key] = 0
+        eq_(True, same_key.claim_generation(self._db))
+
+        same_key.release_generation()
+        eq_(True, feed.claim_generation(self._db))
+
+    def test_dirty_feed_waits_for_materialized_views(self):
+        now = datetime.datetime.utcnow()
+        SessionManager.record_materialized_views_refreshed(
+            self._db, now - datetime.timedelta(hours=1)
+        )
+        feed, usable = self.fetch()
+        feed.update(self._db, u"The feed", work_ids=[1])
+        eq_(True, self.fetch()[1])
+
+        # A work in the feed changes, but the materialized views don't
+        # know about it yet.
+        CachedFeed.mark_dirty(self._db, work_ids=[1])
+        eq_(True, feed.dirty)
+
+        # Regenerating the feed from the views doesn't help: the feed
+        # is still dirty, and not fresh.
+        feed.update(self._db, u"The same old feed", work_ids=[1])
+        eq_(True, feed.dirty)
+        feed, usable = self.fetch()
+        eq_(False, usable)
+        feed.release_generation()
+
+        # Neither is an expensive feed that's normally cached forever.
+        feed, usable = CachedFeed.fetch(
+            self._db, self.MockLane(), CachedFeed.PAGE_TYPE, None, None,
+            None, max_age=Configuration.CACHE_FOREVER
+        )
+        eq_(False, usable)
+
+        # Once the views have been refreshed, the regenerated feed is
+        # clean.
+        SessionManager.record_materialized_views_refreshed(
+            self._db, datetime.datetime.utcnow()
+        )
+        feed.update(self._db, u"The new feed", work_ids=[1])
+        eq_(False, feed.dirty)
+        eq_(True, self.fetch()[1])
+
+        # A feed generated from the live tables is clean right away.
+        CachedFeed.mark_dirty(self._db, work_ids=[1])
+        feed.update(self._db, u"The newest feed", work_ids=[1],
+                    from_materialized_views=False)
+        eq_(False, feed.dirty)
+
+    def test_mark_dirty_on_flush(self):
+        def make_feed(work_ids):
+            feed = CachedFeed(
+                type=CachedFeed.PAGE_TYPE, pagination=u"", work_ids=work_ids
+            )
+            self._db.add(feed)
+            return feed
+        feed1 = make_feed([1, 2])
+        feed2 = make_feed([3])
+        feed3 = make_feed([4])
+        self._db.flush()
+
+        # Nothing happens until the session is flushed...
+        CachedFeed.mark_dirty_on_flush(self._db, [1])
+        CachedFeed.mark_dirty_on_flush(self._db, [3])
+        eq_(False, feed1.dirty)
+        eq_(False, feed2.dirty)
+
+        # ...and then every feed containing one of the works is marked
+        # dirty at once.
+        self._db.flush()
+        eq_([True, True, False], [feed1.dirty, feed2.dirty, feed3.dirty])
+        eq_(None, self._db.info.get(CachedFeed.PENDING_DIRTY_WORK_IDS))
+
+        # The same thing happens on commit, even with nothing to flush.
+        CachedFeed.mark_dirty_on_flush(self._db, [4])
+        self._db.commit()
+        eq_(True, feed3.dirty)
+
+
+class TestCachedSearchResult(DatabaseTest):
+
+    def test_delete_expired(self):
+        hour = datetime.timedelta(hours=1)
+        CachedSearchResult.remember(self._db, u"old", [1], -hour)
+        CachedSearchResult.remember(self._db, u"new", [2], hour)
+        self._db.flush()
+
+        eq_(1, CachedSearchResult.delete_expired(self._db))
+        eq_([u"new"], [x.key for x in self._db.query(CachedSearchResult)])
+
+    def test_remember_deletes_expired_results_occasionally(self):
+        hour = datetime.timedelta(hours=1)
+        CachedSearchResult.remember(self._db, u"old", [1], -hour)
+        self._db.flush()
+
+        CachedSearchResult._remembered = CachedSearchResult.PURGE_EVERY - 1
+        CachedSearchResult.remember(self._db, u"new", [2], hour)
+        eq_([u"new"], [x.key for x in self._db.query(CachedSearchResult)])
+
+
 class TestCustomList(DatabaseTest):
 
     def test_find(self):
@@ -5051,6 +5608,27 @@ class TestCustomList(DatabaseTest):
         result = CustomList.find(self._db, source.name, 'My List')
         eq_(custom_list, result)
 
+    def test_add_and_remove_entry_marks_cached_feeds_dirty(self):
+        custom_list = self._customlist(num_entries=0)[0]
+        feed = CachedFeed(
+            type=CachedFeed.PAGE_TYPE, pagination=u"",
+            list_ids=[custom_list.id]
+        )
+        self._db.add(feed)
+        self._db.flush()
+
+        edition = self._edition()
+        custom_list.add_entry(edition)
+        eq_(True, feed.dirty)
+
+        # Adding the same entry again changes nothing.
+        feed.dirty = False
+        custom_list.add_entry(edition)
+        eq_(False, feed.dirty)
+
+        custom_list.remove_entry(edition)
+        eq_(True, feed.dirty)
+
     def test_add_entry(self):
         custom_list = self._customlist(num_entries=0)[0]
         now = datetime.datetime.utcnow()
@@ -13,16 +13,21 @@ from testing import (
     BrokenCoverageProvider,
 )
 
+from external_search import DummyExternalSearchIndex
+
 from model import (
     DataSource,
     Identifier,
+    SearchIndexChange,
     Subject,
     Timestamp,
+    WorkCoverageRecord,
 )
 
 from monitor import (
     Monitor,
     PresentationReadyMonitor,
+    SearchIndexUpdateMonitor,
     SubjectSweepMonitor,
 )
 
@@ -162,3 +167,79 @@ class TestSubjectSweepMonitor(DatabaseTest):
         )
         eq_([s2], specific_tag_monitor.subject_query().all())
         
+
+
+class TestSearchIndexUpdateMonitor(DatabaseTest):
+
+    def setup(self):
+        super(TestSearchIndexUpdateMonitor, self).setup()
+        self.search = DummyExternalSearchIndex()
+        self.monitor = SearchIndexUpdateMonitor(
+            self._db, search_index_client=self.search, batch_size=2
+        )
+
+    def key(self, work_id):
+        return (self.search.works_index, self.search.work_document_type,
+                work_id)
+
+    def test_run_once(self):
+        ready = self._work(with_license_pool=True)
+        ready.set_presentation_ready()
+        not_ready = self._work(with_license_pool=True)
+        not_ready.presentation_ready = False
+        self.search.index(
+            self.search.works_index, self.search.work_document_type,
+            not_ready.id, {}
+        )
+
+        # The ready work changed three times; the other work and a
+        # work that no longer exists changed once each.
+        SearchIndexChange.enqueue(
+            self._db, [ready.id, ready.id, not_ready.id, ready.id, -1],
+            SearchIndexChange.UPDATE
+        )
+        self.monitor.run_once(None, None)
+
+        # The ready work was indexed and the other work was removed
+        # from the index.
+        eq_([self.key(ready.id)], self.search.docs.keys())
+        assert WorkCoverageRecord.lookup(
+            ready, WorkCoverageRecord.UPDATE_SEARCH_INDEX_OPERATION
+            + "-" + self.search.works_index
+        )
+
+        # The queue is empty.
+        eq_([], self._db.query(SearchIndexChange).all())
+
+    def test_work_with_no_search_document(self):
+        # This work is presentation-ready, but it has no presentation
+        # edition, so there's nothing to put in the search index.
+        work = self._work(with_license_pool=True)
+        work.set_presentation_ready()
+        work.presentation_edition = None
+        self.search.index(
+            self.search.works_index, self.search.work_document_type,
+            work.id, {}
+        )
+        SearchIndexChange.enqueue(
+            self._db, [work.id], SearchIndexChange.UPDATE
+        )
+        self.monitor.run_once(None, None)
+
+        # Rather than being tried again forever, it was taken out of
+        # the index and out of the queue.
+        eq_({}, self.search.docs)
+        eq_([], self._db.query(SearchIndexChange).all())
+
+    def test_failed_changes_stay_queued(self):
+        work = self._work(with_license_pool=True)
+        work.set_presentation_ready()
+        SearchIndexChange.enqueue(
+            self._db, [work.id], SearchIndexChange.UPDATE
+        )
+        self.search.bulk_update = lambda works: (
+            [], [(work, "Connection Timeout!") for work in works]
+        )
+        self.monitor.run_once(None, None)
+        eq_([work.id], [x.work_id for x in
+                        self._db.query(SearchIndexChange)])
@@ -1048,6 +1048,10 @@ class TestOPDS(DatabaseTest):
             assert work1.title in cached1.content
             old_timestamp = cached1.timestamp
 
+            # A hash of the content is stored for use as an ETag.
+            eq_(CachedFeed.hash_for(cached1.content), cached1.content_hash)
+            eq_(cached1.content_hash, cached1.etag)
+
             work2 = self._work(
                 title="A Brand New Title", 
                 genre=Epic_Fantasy, with_open_access_download=True
@@ -1067,6 +1071,47 @@ class TestOPDS(DatabaseTest):
             assert cached3.timestamp > old_timestamp
             assert work2.title in cached3.content
 
+    def test_cache_invalidated_by_dependency(self):
+        work = self._work(title="The Original Title",
+                          genre=Epic_Fantasy, with_open_access_download=True)
+        other_work = self._work(with_open_access_download=True)
+        fantasy_lane = self.lanes.by_languages['']['Fantasy']
+
+        def make_page():
+            return AcquisitionFeed.page(
+                self._db, "test", self._url, fantasy_lane, TestAnnotator,
+                pagination=Pagination.default(), use_materialized_works=False
+            )
+
+        with temp_config() as config:
+            config['policies'] = {
+                Configuration.PAGE_MAX_AGE_POLICY : 3600
+            }
+
+            # The cached feed knows which works it contains.
+            cached = make_page()
+            eq_([work.id], cached.work_ids)
+            eq_(False, cached.dirty)
+            old_timestamp = cached.timestamp
+
+            # A change to some other work doesn't affect the feed.
+            CachedFeed.mark_dirty(self._db, work_ids=[other_work.id])
+            eq_(False, cached.dirty)
+            eq_(old_timestamp, make_page().timestamp)
+
+            # But when the availability of a book in the feed changes,
+            # the feed is marked dirty...
+            [pool] = work.license_pools
+            pool.update_availability(10, 5, 0, 0)
+            self._db.flush()
+            eq_(True, cached.dirty)
+
+            # ...and regenerated the next time it's requested, even
+            # though it's well within its maximum age.
+            cached2 = make_page()
+            assert cached2.timestamp > old_timestamp
+            eq_(False, cached2.dirty)
+
 
 class TestAcquisitionFeed(DatabaseTest):
 
@@ -1121,6 +1166,122 @@ class TestAcquisitionFeed(DatabaseTest):
             etree.tostring(entry)
         )
         
+    def test_splice_entries(self):
+        work = self._work(with_open_access_download=True)
+        work.quality = 0.5
+        work.verbose_opds_entry = etree.tostring(
+            AtomFeed.entry(AtomFeed.title("Cached title"))
+        )
+
+        def make_feed(annotator):
+            feed = AcquisitionFeed(
+                self._db, "test", "http://the-url.com/", [work], annotator,
+                splice_entries=True
+            )
+            return feed, feedparser.parse(unicode(feed))
+
+        # The cached entry is spliced into the feed without being
+        # parsed, with the group link and the quality rating added on
+        # the end.
+        class GroupsAndRatings(TestAnnotatorWithGroup):
+            opds_cache_field = Work.verbose_opds_entry.name
+
+            @classmethod
+            def annotate_work_entry(cls, work, license_pool, edition,
+                                    identifier, feed, entry):
+                entry.extend(cls.work_entry_fragments(
+                    work, license_pool, edition, identifier, feed
+                ))
+
+            @classmethod
+            def work_entry_fragments(cls, work, license_pool, edition,
+                                     identifier, feed):
+                return [cls.rating_tag(None, work.quality)]
+
+        feed, parsed = make_feed(GroupsAndRatings())
+        eq_(True, feed.splice_entries)
+        eq_([], list(feed.feed.iterchildren("{%s}entry" % AtomFeed.ATOM_NS)))
+        [entry] = feed.spliced_entries
+        assert entry.startswith(work.verbose_opds_entry[:-len("</entry>")])
+        assert '<schema:Rating schema:ratingValue="0.5000"' in entry
+
+        [parsed_entry] = parsed.entries
+        eq_("Cached title", parsed_entry['title'])
+        [group_link] = parsed_entry['links']
+        eq_(OPDSFeed.GROUP_REL, group_link['rel'])
+        eq_("http://group/%s" % work.id, group_link['href'])
+
+        # An annotator that modifies entries without saying how
+        # can't have its entries spliced; they're built the usual way.
+        class ModifiesEntries(VerboseAnnotator):
+            @classmethod
+            def annotate_work_entry(cls, work, license_pool, edition,
+                                    identifier, feed, entry):
+                entry.append(AtomFeed.E.rights("All of them"))
+        feed, parsed = make_feed(ModifiesEntries)
+        eq_(False, feed.splice_entries)
+        [parsed_entry] = parsed.entries
+        eq_("All of them", parsed_entry['rights'])
+
+    def test_stream_entries(self):
+        work = self._work(with_open_access_download=True)
+        message = OPDSMessage("urn:foo", 404, "Not found")
+        feed = AcquisitionFeed(
+            self._db, "test", "http://the-url.com/", [work], TestAnnotator,
+            precomposed_entries=[message], stream_entries=True
+        )
+
+        # No entries are created until the feed is sent.
+        eq_([], feed.spliced_entries)
+
+        chunks = list(feed.iter_chunks())
+        eq_(4, len(chunks))
+        assert chunks[0].startswith("<feed")
+        assert work.title in chunks[1]
+        assert "urn:foo" in chunks[2]
+        eq_("</feed>\n", chunks[3])
+        eq_([], feed.spliced_entries)
+
+    def test_can_splice_entries(self):
+        class OnlyAnnotates(VerboseAnnotator):
+            @classmethod
+            def annotate_work_entry(cls, *args):
+                pass
+
+        class AnnotatesWithFragments(OnlyAnnotates):
+            @classmethod
+            def work_entry_fragments(cls, *args):
+                return []
+
+        m = Annotator.can_splice_entries
+        eq_(True, m(Annotator))
+        eq_(True, m(VerboseAnnotator))
+        eq_(True, m(TestAnnotatorWithGroup()))
+        eq_(False, m(OnlyAnnotates))
+        eq_(True, m(AnnotatesWithFragments))
+
+    def test_splice_into_entry(self):
+        m = AcquisitionFeed._splice_into_entry
+
+        # An entry that declares all the usual namespaces gets new tags
+        # that rely on those declarations.
+        entry = etree.tostring(AtomFeed.entry(AtomFeed.title("A title")))
+        spliced = m(entry, [AtomFeed.link(href="http://link/")])
+        assert spliced.endswith(
+            '<title>A title</title><link href="http://link/"/></entry>'
+        )
+
+        # An entry that doesn't gets new tags that declare their own
+        # namespaces.
+        spliced = m("<entry><foo>bar</foo></entry>",
+                    [AtomFeed.link(href="http://link/")])
+        tree = etree.fromstring(spliced)
+        eq_(["foo", "{%s}link" % AtomFeed.ATOM_NS],
+            [x.tag for x in tree])
+
+        # With no tags to add, the entry is unchanged.
+        eq_(entry, m(entry, []))
+
     def test_error_when_work_has_no_identifier(self):
         """We cannot create an OPDS entry for a Work that cannot be associated
         with an Identifier.
@@ -54,13 +54,19 @@ from testing import DummyHTTPClient
 
 
 class DoomedOPDSImporter(OPDSImporter):
-    def import_edition_from_metadata(self, metadata, *args):
-        if metadata.title == "Johnny Crow's Party":
-            # This import succeeds.
-            return super(DoomedOPDSImporter, self).import_edition_from_metadata(metadata, *args)
-        else:
-            # Any other import fails.
-            raise Exception("Utter failure!")
+    def import_editions_from_metadata(self, metadata_objs):
+        # Only the import of "Johnny Crow's Party" succeeds.
+        survivors = dict(
+            (key, metadata) for key, metadata in metadata_objs.items()
+            if metadata.title == "Johnny Crow's Party"
+        )
+        editions, failures = super(
+            DoomedOPDSImporter, self).import_editions_from_metadata(survivors)
+        # Any other import fails.
+        for key in metadata_objs:
+            if key not in survivors:
+                failures[key] = "Utter failure!"
+        return editions, failures
 
 class DoomedWorkOPDSImporter(OPDSImporter):
     """An OPDS Importer that imports editions but can't create works."""
@@ -12,6 +12,7 @@ from overdrive import (
     OverdriveAPI,
     MockOverdriveAPI,
     OverdriveAdvantageAccount,
+    OverdriveInventoryCrawler,
     OverdriveRepresentationExtractor,
     OverdriveBibliographicCoverageProvider,
 )
@@ -20,6 +21,8 @@ from coverage import (
     CoverageFailure,
 )
 
+from util.http import RequestTimedOut
+
 from model import (
     Collection,
     Contributor,
@@ -193,6 +196,136 @@ class TestOverdriveAPI(OverdriveTest):
             overdrive_child._library_endpoint
         )
 
+class MockOverdriveAPIByURL(MockOverdriveAPI):
+    """Responds to requests based on their URLs rather than the order
+    in which they were made, since the crawler makes many requests at
+    once.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(MockOverdriveAPIByURL, self).__init__(*args, **kwargs)
+        self.responses_by_url = {}
+
+    def queue_response_for(self, url, status_code, content=None):
+        self.responses_by_url.setdefault(url, []).append(
+            (status_code, {}, content)
+        )
+
+    def queue_exception_for(self, url, exception):
+        self.responses_by_url.setdefault(url, []).append(exception)
+
+    def _do_get(self, url, headers):
+        self.requests.append(url)
+        response = self.responses_by_url[url].pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class TestOverdriveInventoryCrawler(OverdriveTest):
+
+    def test_crawl(self):
+        api = MockOverdriveAPIByURL(self._db)
+        raw, page1 = self.sample_json("overdrive_book_list.json")
+        page1['links']['next'] = dict(href="http://page2/")
+        api.queue_response_for("http://page1/", 200, json.dumps(page1))
+        api.queue_response_for(
+            "http://page2/", 200, json.dumps(dict(products=[]))
+        )
+
+        [available, gone, expired] = [
+            OverdriveAPI.make_link_safe(x['links']['availability']['href'])
+            for x in page1['products']
+        ]
+        [available_id, gone_id, expired_id] = [
+            x['id'] for x in page1['products']
+        ]
+        raw, info = self.sample_json("overdrive_availability_information.json")
+        info['id'] = available_id
+        api.queue_response_for(available, 200, json.dumps(info))
+
+        # This book has left the collection.
+        api.queue_response_for(gone, 404)
+
+        # The bearer token expired before we got to this book.
+        info['id'] = expired_id
+        api.queue_response_for(expired, 401)
+        api.queue_response_for(expired, 200, json.dumps(info))
+
+        token_requests_before = len(api.access_token_requests)
+        crawler = OverdriveInventoryCrawler(api, workers=2)
+        results = dict(
+            (x.primary_identifier.identifier, x)
+            for x in crawler.crawl("http://page1/")
+        )
+        eq_(set([available_id, gone_id, expired_id]), set(results.keys()))
+
+        eq_(5, results[available_id].licenses_owned)
+        eq_(5, results[expired_id].licenses_available)
+        eq_(0, results[gone_id].licenses_owned)
+
+        # Both pages were requested, and the expired token was refreshed.
+        assert "http://page2/" in api.requests
+        eq_(2, api.requests.count(expired))
+        eq_(token_requests_before + 1, len(api.access_token_requests))
+
+    def test_crawl_skips_books_that_fail(self):
+        api = MockOverdriveAPIByURL(self._db)
+        raw, page = self.sample_json("overdrive_book_list.json")
+        api.queue_response_for("http://page1/", 200, json.dumps(page))
+
+        [available, timed_out, garbled] = [
+            OverdriveAPI.make_link_safe(x['links']['availability']['href'])
+            for x in page['products']
+        ]
+        [available_id, timed_out_id, garbled_id] = [
+            x['id'] for x in page['products']
+        ]
+        raw, info = self.sample_json("overdrive_availability_information.json")
+        info['id'] = available_id
+        api.queue_response_for(available, 200, json.dumps(info))
+
+        # One request times out, and another gets a response that
+        # can't be parsed.
+        api.queue_exception_for(
+            timed_out, RequestTimedOut(timed_out, "Timed out")
+        )
+        api.queue_response_for(garbled, 200, "<html>Not JSON</html>")
+
+        crawler = OverdriveInventoryCrawler(api, workers=2)
+        results = list(crawler.crawl("http://page1/"))
+
+        # The rest of the crawl went ahead without those books.
+        eq_([available_id],
+            [x.primary_identifier.identifier for x in results])
+
+    def test_crawl_with_metadata(self):
+        api = MockOverdriveAPIByURL(self._db)
+        raw, page = self.sample_json("overdrive_book_list.json")
+        page['products'] = page['products'][:1]
+        [product] = page['products']
+        api.queue_response_for("http://page1/", 200, json.dumps(page))
+
+        raw, info = self.sample_json("overdrive_availability_information.json")
+        info['id'] = product['id']
+        api.queue_response_for(
+            OverdriveAPI.make_link_safe(product['links']['availability']['href']),
+            200, json.dumps(info)
+        )
+        raw, metadata_info = self.sample_json("overdrive_metadata.json")
+        metadata_info['id'] = product['id']
+        metadata_url = api.METADATA_ENDPOINT % dict(
+            collection_token=api.collection_token, item_id=product['id']
+        )
+        api.queue_response_for(metadata_url, 200, json.dumps(metadata_info))
+
+        crawler = OverdriveInventoryCrawler(api, include_metadata=True)
+        [metadata] = list(crawler.crawl("http://page1/"))
+        eq_(metadata_info['title'], metadata.title)
+        eq_(5, metadata.circulation.licenses_owned)
+        assert len(metadata.circulation.formats) > 0
+
+
 class TestOverdriveRepresentationExtractor(OverdriveTest):
 
     def test_availability_info(self):
@@ -0,0 +1,77 @@
+from nose.tools import (
+    eq_,
+    set_trace,
+)
+
+from util.cache import LRUCache
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class TestLRUCache(object):
+
+    def setup(self):
+        self.clock = FakeClock()
+        self.cache = LRUCache(max_size=2, clock=self.clock.time)
+
+    def test_get_and_set(self):
+        eq_(None, self.cache.get("a"))
+        eq_("default", self.cache.get("a", "default"))
+
+        self.cache.set("a", 1)
+        eq_(1, self.cache.get("a"))
+
+        # A stored None is distinguishable from a missing value.
+        missing = object()
+        self.cache.set("b", None)
+        eq_(None, self.cache.get("b", missing))
+
+        self.cache.invalidate("a")
+        assert self.cache.get("a", missing) is missing
+
+    def test_least_recently_used_value_is_evicted(self):
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+
+        # Using "a" makes "b" the least recently used value.
+        self.cache.get("a")
+        self.cache.set("c", 3)
+        eq_(2, len(self.cache))
+        eq_(1, self.cache.get("a"))
+        eq_(None, self.cache.get("b"))
+        eq_(3, self.cache.get("c"))
+
+    def test_ttl(self):
+        cache = LRUCache(ttl=10, clock=self.clock.time)
+        cache.set("default ttl", 1)
+        cache.set("short ttl", 2, ttl=1)
+
+        self.clock.now += 5
+        eq_(1, cache.get("default ttl"))
+        eq_(None, cache.get("short ttl"))
+
+        self.clock.now += 5
+        eq_(None, cache.get("default ttl"))
+
+    def test_hit_rate(self):
+        eq_(0, self.cache.hit_rate)
+        self.cache.set("a", 1)
+        self.cache.get("a")
+        self.cache.get("a")
+        self.cache.get("a")
+        self.cache.get("b")
+        eq_(3, self.cache.hits)
+        eq_(1, self.cache.misses)
+        eq_(0.75, self.cache.hit_rate)
+
+        self.cache.clear()
+        eq_(0, len(self.cache))
+        eq_(0, self.cache.hits)
+        eq_(0, self.cache.misses)
@@ -0,0 +1,43 @@
+# encoding: utf-8
+from nose.tools import (
+    assert_raises,
+    eq_,
+    set_trace,
+)
+
+from util import compression
+from util.compression import (
+    BROTLI,
+    GZIP,
+    available_encodings,
+    compress,
+    decompress,
+)
+
+
+class TestCompression(object):
+
+    def test_gzip(self):
+        data = compress(u"A document ☃" * 100, GZIP)
+        assert data.startswith('\x1f\x8b')
+        assert len(data) < 100
+        eq_(u"A document ☃" * 100, decompress(data, GZIP).decode("utf8"))
+
+    def test_default_level(self):
+        document = u"A document ☃" * 100
+        eq_(compress(document, GZIP, compression.DEFAULT_LEVELS[GZIP]),
+            compress(document, GZIP))
+        assert compress(document, GZIP, 9) != compress(document, GZIP, 1)
+
+    def test_brotli(self):
+        if not compression.brotli:
+            # Brotli is optional.
+            eq_([GZIP], available_encodings())
+            assert_raises(ValueError, compress, "A document", BROTLI)
+            return
+        eq_([GZIP, BROTLI], available_encodings())
+        eq_("A document", decompress(compress("A document", BROTLI), BROTLI))
+
+    def test_unknown_encoding(self):
+        assert_raises(ValueError, compress, "A document", "compress")
+        assert_raises(ValueError, decompress, "A document", "compress")
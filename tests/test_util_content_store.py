@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from nose.tools import (
+    eq_,
+    set_trace,
+)
+
+from util.content_store import ContentStore
+
+
+class TestContentStore(object):
+
+    def setup(self):
+        self.root = tempfile.mkdtemp()
+        self.store = ContentStore(self.root)
+
+    def teardown(self):
+        shutil.rmtree(self.root)
+
+    def test_path_for(self):
+        content_hash = ContentStore.hash_for("some content")
+        eq_(os.path.join(
+            self.root, content_hash[:2], content_hash[2:4], content_hash),
+            self.store.path_for(content_hash)
+        )
+
+    def test_put_and_get(self):
+        content_hash, size = self.store.put("some content")
+        eq_(ContentStore.hash_for("some content"), content_hash)
+        eq_(12, size)
+        eq_(True, self.store.exists(content_hash))
+        eq_("some content", self.store.get(content_hash))
+
+        fh = self.store.open(content_hash)
+        eq_("some", fh.read(4))
+        fh.seek(0)
+        eq_("some content", fh.read())
+
+        self.store.delete(content_hash)
+        eq_(False, self.store.exists(content_hash))
+        eq_(None, self.store.open(content_hash))
+        eq_(None, self.store.get(content_hash))
+
+    def test_identical_content_is_stored_once(self):
+        hash1, ignore = self.store.put("some content")
+        hash2, ignore = self.store.put(StringIO("some content"))
+        hash3, ignore = self.store.put(iter(["some ", "content"]))
+        eq_(hash1, hash2)
+        eq_(hash1, hash3)
+
+        # Apart from the sharding directories, there's one blob in the
+        # store and no temporary files left behind.
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            files.extend(filenames)
+        eq_([hash1], files)
+
+    def test_empty_content(self):
+        content_hash, size = self.store.put("")
+        eq_(0, size)
+        eq_("", self.store.get(content_hash))
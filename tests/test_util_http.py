@@ -1,3 +1,5 @@
+import datetime
+import httplib
 import requests
 import json
 from util.http import (
@@ -8,11 +10,13 @@ from util.http import (
     RequestTimedOut,
 )
 from nose.tools import (
+    assert_raises,
     assert_raises_regexp,
     eq_, 
     set_trace
 )
 from testing import MockRequestsResponse
+from StringIO import StringIO
 
 class TestHTTP(object):
 
@@ -177,6 +181,98 @@ class TestHTTP(object):
             assert isinstance(v, bytes)
         assert isinstance(data, bytes)
 
+    def test_session_for(self):
+        # Requests to the same host share a session, and thus a pool
+        # of keep-alive connections.
+        HTTP.close_sessions()
+        s1 = HTTP.session_for("https://example.com/foo")
+        s2 = HTTP.session_for("https://example.com/bar?baz=1")
+        s3 = HTTP.session_for("https://example.org/foo")
+        s4 = HTTP.session_for("http://example.com/foo")
+        assert s1 is s2
+        assert s1 is not s3
+        assert s1 is not s4
+        assert 'gzip' in s1.headers['Accept-Encoding']
+
+        adapter = s1.get_adapter("https://example.com/")
+        eq_(HTTP.POOL_MAXSIZE, adapter._pool_maxsize)
+
+        # Reconfiguring the pools throws away the old sessions.
+        old_size = HTTP.POOL_MAXSIZE
+        HTTP.configure_pools(pool_maxsize=2)
+        try:
+            s5 = HTTP.session_for("https://example.com/foo")
+            assert s5 is not s1
+            eq_(2, s5.get_adapter("https://example.com/")._pool_maxsize)
+        finally:
+            HTTP.configure_pools(pool_maxsize=old_size)
+
+    def test_sessions_keep_no_cookies(self):
+        # A host's session is shared by every caller, so cookies set
+        # in a response to one caller are not kept, or sent along
+        # with the next caller's request.
+        HTTP.close_sessions()
+        session = HTTP.session_for("https://example.com/")
+        request = requests.cookies.MockRequest(
+            requests.Request("GET", "https://example.com/").prepare()
+        )
+        headers = httplib.HTTPMessage(StringIO("Set-Cookie: patron=secret\r\n\r\n"))
+        response = requests.cookies.MockResponse(headers)
+
+        # An ordinary cookie jar would keep this cookie...
+        jar = requests.cookies.RequestsCookieJar()
+        jar.extract_cookies(response, request)
+        eq_(["patron"], [cookie.name for cookie in jar])
+
+        # ...but the session's jar doesn't.
+        session.cookies.extract_cookies(response, request)
+        eq_([], list(session.cookies))
+
+    def test_timing_hooks(self):
+        timings = []
+        def hook(host, time_to_first_byte, total_time, response):
+            timings.append((host, time_to_first_byte, total_time, response))
+
+        def fake_200_response(*args, **kwargs):
+            response = MockRequestsResponse(200, content="Success!")
+            response.elapsed = datetime.timedelta(seconds=0.5)
+            return response
+
+        def immediately_timeout(*args, **kwargs):
+            raise requests.exceptions.Timeout("I give up")
+
+        HTTP.timing_hooks.append(hook)
+        HTTP.statistics.clear()
+        try:
+            response = HTTP._request_with_timeout(
+                "http://timed.com/", fake_200_response
+            )
+            assert_raises(
+                RequestTimedOut, HTTP._request_with_timeout,
+                "http://timed.com/", immediately_timeout
+            )
+        finally:
+            HTTP.timing_hooks.remove(hook)
+
+        [(host, ttfb, total, r), (host2, ttfb2, total2, r2)] = timings
+        eq_("timed.com", host)
+        eq_(0.5, ttfb)
+        eq_(response, r)
+
+        # A failed request is reported with no response.
+        eq_("timed.com", host2)
+        eq_(None, ttfb2)
+        eq_(None, r2)
+
+        stats = HTTP.statistics["timed.com"]
+        eq_(2, stats.requests)
+        eq_(1, stats.errors)
+
+        # The failed request doesn't drag down the average time to
+        # first byte.
+        eq_(0.5, stats.average_time_to_first_byte)
+
+
 class TestRemoteIntegrationException(object):
 
     def test_with_service_name(self):
@@ -202,11 +298,16 @@ class TestRemoteIntegrationException(object):
 class TestBadResponseException(object):
 
     def test_helper_constructor(self):
-        response = MockRequestsResponse(102, content="nonsense")
+        response = MockRequestsResponse(
+            102, {"Retry-After": "10"}, content="nonsense"
+        )
         exc = BadResponseException.from_response(
             "http://url/", "Terrible response, just terrible", response
         )
 
+        # The response headers are kept.
+        eq_("10", exc.headers["Retry-After"])
+
         # Turn the exception into a problem detail document, and it's full
         # of useful information.
         doc, status_code, headers = exc.as_problem_detail_document(debug=True).response
@@ -0,0 +1,58 @@
+# encoding: utf-8
+from nose.tools import (
+    eq_,
+    set_trace,
+)
+
+from util.permanent_work_id import WorkIDCalculator
+
+
+class TestPermanentIDs(object):
+
+    ITEMS = [
+        (u"The Title", u"Author, An", "book"),
+        (u"The Title", u"Author, An", "music"),
+        (u"Another Title: A Novel", u"Author, An", "book"),
+        (u"Títle [Illustrated]", u"edited by Somebody Else", "book"),
+        (u"The Title", None, "book"),
+        (None, None, "movie"),
+    ]
+
+    def setup(self):
+        WorkIDCalculator._normalized_titles.clear()
+        WorkIDCalculator._normalized_authors.clear()
+
+    def expect(self, items):
+        w = WorkIDCalculator
+        return [
+            w.permanent_id(
+                w.normalize_title(title), w.normalize_author(author),
+                grouping_category
+            )
+            for title, author, grouping_category in items
+        ]
+
+    def test_permanent_ids(self):
+        eq_(self.expect(self.ITEMS),
+            WorkIDCalculator.permanent_ids(self.ITEMS))
+
+        # Each distinct title and author was normalized once, and
+        # remembered for the next batch.
+        eq_(4, len(WorkIDCalculator._normalized_titles))
+        eq_(3, len(WorkIDCalculator._normalized_authors))
+        eq_(self.expect(self.ITEMS),
+            WorkIDCalculator.permanent_ids(self.ITEMS))
+        eq_(len(self.ITEMS), WorkIDCalculator._normalized_authors.hits)
+
+    def test_permanent_ids_with_process_pool(self):
+        old_minimum = WorkIDCalculator.MIN_STRINGS_FOR_POOL
+        WorkIDCalculator.MIN_STRINGS_FOR_POOL = 1
+        try:
+            items = self.ITEMS + [
+                (u"Title %d" % i, u"Author %d" % (i % 7), "book")
+                for i in range(50)
+            ]
+            eq_(self.expect(items),
+                WorkIDCalculator.permanent_ids(items, processes=2))
+        finally:
+            WorkIDCalculator.MIN_STRINGS_FOR_POOL = old_minimum
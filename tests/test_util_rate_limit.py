@@ -0,0 +1,177 @@
+from nose.tools import (
+    assert_raises,
+    eq_,
+    set_trace,
+)
+
+from testing import MockRequestsResponse
+from util.http import (
+    BadResponseException,
+    HTTP,
+    RequestTimedOut,
+)
+from util.rate_limit import (
+    AdaptiveRateLimiter,
+    RateLimitWaitTooLong,
+)
+
+
+class FakeClock(object):
+    """A clock that only moves forward when someone sleeps."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestAdaptiveRateLimiter(object):
+
+    def setup(self):
+        self.clock = FakeClock()
+        self.limiter = AdaptiveRateLimiter(
+            "test", rate=2, burst=2, min_rate=0.5, max_rate=3,
+            increase=0.5, clock=self.clock.time, sleep=self.clock.sleep
+        )
+
+    def test_for_integration(self):
+        AdaptiveRateLimiter.reset()
+        l1 = AdaptiveRateLimiter.for_integration("Overdrive", "library 1")
+        l2 = AdaptiveRateLimiter.for_integration("Overdrive", "library 1")
+        l3 = AdaptiveRateLimiter.for_integration("Overdrive", "library 2")
+        assert l1 is l2
+        assert l1 is not l3
+        eq_("Overdrive/library 1", l1.name)
+
+    def test_token_bucket(self):
+        # The bucket starts out full, so two requests can go out
+        # immediately.
+        self.limiter.acquire()
+        self.limiter.acquire()
+        eq_([], self.clock.sleeps)
+        eq_(2, self.limiter.in_flight)
+
+        # The third request has to wait for a token to come in.
+        self.limiter.acquire()
+        eq_([0.5], self.clock.sleeps)
+        eq_(0, self.limiter.queue_depth)
+
+        for i in range(3):
+            self.limiter.release()
+        eq_(0, self.limiter.in_flight)
+
+    def test_additive_increase(self):
+        self.limiter.record(200, latency=0.1)
+        eq_(2.5, self.limiter.rate)
+
+        # A slow response doesn't make us go faster.
+        self.limiter.record(200, latency=10)
+        eq_(2.5, self.limiter.rate)
+
+        # The rate never goes above the maximum.
+        self.limiter.record(200, latency=0.1)
+        self.limiter.record(200, latency=0.1)
+        eq_(3, self.limiter.rate)
+
+    def test_multiplicative_decrease(self):
+        self.limiter.record(429)
+        eq_(1, self.limiter.rate)
+        self.limiter.record("503")
+        eq_(0.5, self.limiter.rate)
+
+        # The rate never goes below the minimum.
+        self.limiter.record(failure=True)
+        eq_(0.5, self.limiter.rate)
+
+    def test_retry_after(self):
+        self.limiter.record(429, retry_after="30")
+        self.limiter.acquire()
+        eq_([30], self.clock.sleeps)
+
+    def test_max_wait(self):
+        # The vendor asks for a longer break than a caller is willing
+        # to wait.
+        self.limiter.record(503, retry_after="3600")
+        assert_raises(RateLimitWaitTooLong, self.limiter.acquire)
+
+        # The caller didn't sleep at all, and isn't holding a slot.
+        eq_([], self.clock.sleeps)
+        eq_(0, self.limiter.in_flight)
+        eq_(0, self.limiter.queue_depth)
+
+        # A caller that's willing to wait can.
+        self.limiter.acquire(max_wait=4000)
+        eq_([3600], self.clock.sleeps)
+        self.limiter.release()
+
+        # A limiter can be told to wait as long as it takes.
+        limiter = AdaptiveRateLimiter(
+            "patient", max_wait=None, clock=self.clock.time,
+            sleep=self.clock.sleep
+        )
+        limiter.record(429, retry_after="7200")
+        limiter.acquire()
+        eq_(7200, self.clock.sleeps[-1])
+
+    def test_retry_after_through_http(self):
+        # A 503 goes through HTTP's usual response processing, which
+        # turns it into a BadResponseException. Its Retry-After header
+        # still stops all requests.
+        def unavailable(*args, **kwargs):
+            return MockRequestsResponse(503, {"Retry-After": "20"}, "")
+
+        assert_raises(
+            BadResponseException, self.limiter.call,
+            HTTP._request_with_timeout, "http://url/", unavailable
+        )
+        eq_(1, self.limiter.rate)
+        eq_(self.clock.now + 20, self.limiter.blocked_until)
+
+    def test_parse_retry_after(self):
+        m = AdaptiveRateLimiter.parse_retry_after
+        eq_(None, m(None))
+        eq_(None, m("nonsense"))
+        eq_(120, m("120"))
+        eq_(10, m("Wed, 21 Oct 2015 07:28:10 GMT", now=1445412480))
+
+    def test_call(self):
+        def fast_response(*args, **kwargs):
+            return MockRequestsResponse(200, {}, "ok")
+
+        def slow_down(*args, **kwargs):
+            return MockRequestsResponse(429, {"retry-after": "5"}, "")
+
+        def server_error(*args, **kwargs):
+            return HTTP._process_response(
+                "http://url/", MockRequestsResponse(503, {}, "")
+            )
+
+        def timeout(*args, **kwargs):
+            raise RequestTimedOut("http://url/", "I give up")
+
+        response = self.limiter.call(fast_response)
+        eq_(200, response.status_code)
+        eq_(2.5, self.limiter.rate)
+
+        self.limiter.call(slow_down)
+        eq_(1.25, self.limiter.rate)
+        eq_(self.clock.now + 5, self.limiter.blocked_until)
+
+        assert_raises(BadResponseException, self.limiter.call, server_error)
+        eq_(0.625, self.limiter.rate)
+
+        assert_raises(RequestTimedOut, self.limiter.call, timeout)
+        eq_(0.5, self.limiter.rate)
+
+        # A 3-tuple response is also understood.
+        self.limiter.call(lambda: (200, {}, "ok"))
+        eq_(1, self.limiter.rate)
+
+        # No matter what happened, every request was released.
+        eq_(0, self.limiter.in_flight)
@@ -0,0 +1,82 @@
+from StringIO import StringIO
+
+from nose.tools import (
+    eq_,
+    set_trace,
+)
+
+from util.xmlparser import XMLParser
+
+
+class MockParser(XMLParser):
+    """Turn each <item> tag into its title and the number of earlier
+    <item> tags still in memory when it was processed.
+    """
+
+    def process_one(self, tag, namespaces):
+        title = self.text_of_subtag(tag, "ns:title", namespaces)
+        earlier = list(tag.itersiblings(preceding=True))
+        return title, len(earlier)
+
+
+class TestXMLParser(object):
+
+    NAMESPACES = {"ns": "http://example.com/"}
+
+    DOCUMENT = """<?xml version="1.0" encoding="utf-8"?>
+<items xmlns="http://example.com/">
+  <item><title>One</title></item>
+  <item><title>Two</title></item>
+  <item><title>Three</title></item>
+</items>"""
+
+    def test_process_all(self):
+        parser = MockParser()
+        eq_(["One", "Two", "Three"],
+            [title for title, size in parser.process_all(
+                self.DOCUMENT, "//ns:item", self.NAMESPACES)]
+        )
+
+    def test_processed_elements_are_cleared(self):
+        seen = []
+        class ClearingParser(XMLParser):
+            def process_one(self, tag, namespaces):
+                seen.extend(tag.itersiblings(preceding=True))
+                return True
+
+        parser = ClearingParser()
+        list(parser.process_all_streaming(
+            self.DOCUMENT, "ns:item", self.NAMESPACES
+        ))
+        eq_(2, len(seen))
+        for item in seen:
+            eq_(0, len(item))
+
+    def test_process_all_streaming(self):
+        parser = MockParser()
+        results = list(
+            parser.process_all_streaming(
+                self.DOCUMENT, "ns:item", self.NAMESPACES
+            )
+        )
+        eq_(["One", "Two", "Three"], [title for title, size in results])
+
+        # Items are thrown away once they've been processed, so
+        # process_one never sees more than one earlier item, and that
+        # item has been cleared out.
+        eq_([0, 1, 1], [size for title, size in results])
+
+        # A filehandle or a Unicode string works as well as a bytestring.
+        for document in (StringIO(self.DOCUMENT), unicode(self.DOCUMENT)):
+            eq_(3, len(list(parser.process_all_streaming(
+                document, "ns:item", self.NAMESPACES
+            ))))
+
+    def test_compiled_expressions_are_reused(self):
+        parser = MockParser()
+        list(parser.process_all_streaming(
+            self.DOCUMENT, "ns:item", self.NAMESPACES
+        ))
+        compiled = XMLParser._compile("ns:title", self.NAMESPACES)
+        assert compiled is XMLParser._compile("ns:title", self.NAMESPACES)
+        assert compiled is not XMLParser._compile("ns:title", {"ns": "http://other/"})
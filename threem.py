@@ -45,6 +45,7 @@ from metadata_layer import (
 )
 
 from util.http import HTTP
+from util.rate_limit import AdaptiveRateLimiter
 from util.xmlparser import XMLParser
 
 class ThreeMAPI(object):
@@ -87,6 +88,10 @@ class ThreeMAPI(object):
                 "Bibliotheca configuration is incomplete."
             )
 
+        self.rate_limiter = AdaptiveRateLimiter.for_integration(
+            DataSource.BIBLIOTHECA, self.library_id
+        )
+
         self.item_list_parser = ItemListParser()
 
     @classmethod
@@ -202,11 +207,15 @@ class ThreeMAPI(object):
 
     def _request_with_timeout(self, method, url, *args, **kwargs):
         """This will be overridden in MockThreeMAPI."""
-        return HTTP.request_with_timeout(method, url, *args, **kwargs)
+        return self.rate_limiter.call(
+            HTTP.request_with_timeout, method, url, *args, **kwargs
+        )
 
     def _simple_http_get(self, url, headers, *args, **kwargs):
         """This will be overridden in MockThreeMAPI."""
-        return Representation.simple_http_get(url, headers, *args, **kwargs)
+        return self.rate_limiter.call(
+            Representation.simple_http_get, url, headers, *args, **kwargs
+        )
 
 
 class MockThreeMAPI(ThreeMAPI):
@@ -268,7 +277,7 @@ class ItemListParser(XMLParser):
     NAMESPACES = {}
 
     def parse(self, xml):
-        for i in self.process_all(xml, "//Item"):
+        for i in self.process_all_streaming(xml, "Item"):
             yield i
 
     parenthetical = re.compile(" \([^)]+\)$")
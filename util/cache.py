@@ -0,0 +1,87 @@
+"""A size-limited, in-process cache."""
+from collections import OrderedDict
+import threading
+import time
+
+
+class LRUCache(object):
+    """Keep the most recently used values, up to a fixed number of them.
+
+    A value may be given a time-to-live, after which it's treated as
+    missing. The cache counts hits and misses so its users can report
+    how well it's working.
+    """
+
+    def __init__(self, max_size=1000, ttl=None, clock=time.time):
+        """Constructor.
+
+        :param max_size: Once the cache holds this many values, adding
+            another one evicts the least recently used.
+        :param ttl: The default time-to-live of a value, in seconds.
+            None means values never expire.
+        :param clock: A function returning the current time, for tests.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Look up a value, counting a hit or a miss.
+
+        :return: The value, or `default` if it's missing or expired.
+        """
+        with self._lock:
+            item = self._values.pop(key, None)
+            if item is not None:
+                value, expires = item
+                if expires is None or expires > self.clock():
+                    # Put it back at the most recently used end.
+                    self._values[key] = item
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """Store a value.
+
+        :param ttl: How many seconds the value is good for, if different
+            from the cache's default.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        expires = None
+        if ttl is not None:
+            expires = self.clock() + ttl
+        with self._lock:
+            self._values.pop(key, None)
+            self._values[key] = (value, expires)
+            while len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+
+    def invalidate(self, key):
+        """Forget a value."""
+        with self._lock:
+            self._values.pop(key, None)
+
+    def clear(self):
+        """Forget every value and reset the hit and miss counts."""
+        with self._lock:
+            self._values.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    @property
+    def hit_rate(self):
+        """The fraction of lookups that found a value."""
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return self.hits / float(total)
@@ -0,0 +1,66 @@
+"""Compress and decompress documents using HTTP content-codings."""
+import zlib
+
+try:
+    import brotli
+except ImportError, e:
+    # Brotli is optional. Without it, only gzip is available.
+    brotli = None
+
+GZIP = u'gzip'
+BROTLI = u'br'
+
+# A wbits value of 16+MAX_WBITS makes zlib read and write a gzip
+# header and trailer.
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# The compression level used unless another is asked for. Documents
+# are often compressed while a request waits, so these trade a little
+# size for a lot of speed: brotli's top quality is orders of magnitude
+# slower than its middle ones.
+DEFAULT_LEVELS = {
+    GZIP: 6,
+    BROTLI: 5,
+}
+
+
+def available_encodings():
+    """Which content-codings can this installation produce?"""
+    encodings = [GZIP]
+    if brotli:
+        encodings.append(BROTLI)
+    return encodings
+
+
+def compress(content, encoding=GZIP, level=None):
+    """Compress a document.
+
+    :param content: A bytestring or Unicode string. Unicode strings
+        are encoded as UTF-8 before being compressed.
+    :param encoding: An HTTP content-coding, e.g. "gzip" or "br".
+    :param level: The compression level (for gzip, 1-9) or quality
+        (for brotli, 0-11). By default, DEFAULT_LEVELS[encoding].
+    :return: A bytestring.
+    """
+    if isinstance(content, unicode):
+        content = content.encode("utf8")
+    if level is None:
+        level = DEFAULT_LEVELS.get(encoding)
+    if encoding == GZIP:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+        return compressor.compress(content) + compressor.flush()
+    if encoding == BROTLI and brotli:
+        return brotli.compress(content, quality=level)
+    raise ValueError("Unsupported content-coding: %s" % encoding)
+
+
+def decompress(data, encoding=GZIP):
+    """Reverse compress().
+
+    :return: A bytestring.
+    """
+    if encoding == GZIP:
+        return zlib.decompress(data, GZIP_WBITS)
+    if encoding == BROTLI and brotli:
+        return brotli.decompress(data)
+    raise ValueError("Unsupported content-coding: %s" % encoding)
@@ -0,0 +1,185 @@
+import hashlib
+import mmap
+import os
+import tempfile
+from cStringIO import StringIO
+
+
+class MappedFile(object):
+    """A read-only filehandle backed by a memory map.
+
+    mmap objects are almost filehandles, but their read() requires
+    an explicit size, which trips up code that expects a real file.
+    """
+
+    def __init__(self, mapped):
+        self._mapped = mapped
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self._mapped) - self._mapped.tell()
+        return self._mapped.read(size)
+
+    def __len__(self):
+        return len(self._mapped)
+
+    def __getattr__(self, name):
+        return getattr(self._mapped, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._mapped.close()
+
+
+class ContentStore(object):
+
+    """A content-addressed store for blobs on local disk.
+
+    Each blob is stored under the SHA-256 hash of its contents, so
+    identical blobs obtained from different places are only stored
+    once. Blobs are sharded into subdirectories by the first few
+    characters of the hash, so that no single directory ends up
+    containing millions of files.
+    """
+
+    # Read and write blobs in chunks of this many bytes.
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, root, shard_depth=2, shard_width=2):
+        self.root = root
+        self.shard_depth = shard_depth
+        self.shard_width = shard_width
+
+    @classmethod
+    def hash_for(cls, content):
+        """Calculate the key under which the given bytestring would be
+        stored.
+        """
+        return unicode(hashlib.sha256(content).hexdigest())
+
+    def path_for(self, content_hash):
+        """Find the path on disk where the blob with the given hash is (or
+        would be) stored.
+        """
+        parts = [self.root]
+        for i in range(self.shard_depth):
+            start = i * self.shard_width
+            parts.append(content_hash[start:start+self.shard_width])
+        parts.append(content_hash)
+        return os.path.join(*parts)
+
+    def exists(self, content_hash):
+        return os.path.exists(self.path_for(content_hash))
+
+    def put(self, content):
+        """Store a blob.
+
+        :param content: A bytestring, an open filehandle, or an
+        iterator over bytestrings. Filehandles and iterators are
+        streamed to disk a chunk at a time, so that the entire blob
+        never needs to be held in memory.
+
+        :return: A 2-tuple (content_hash, size).
+        """
+        if isinstance(content, bytes):
+            chunks = [content]
+        elif hasattr(content, 'read'):
+            chunks = iter(lambda: content.read(self.CHUNK_SIZE), b'')
+        else:
+            chunks = content
+
+        # Write the blob to a temporary file next to its eventual
+        # home, hashing it as we go. We can't know the final
+        # filename until we've seen every byte.
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix='.incoming-')
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in chunks:
+                    if isinstance(chunk, unicode):
+                        chunk = chunk.encode("utf8")
+                    digest.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+            content_hash = unicode(digest.hexdigest())
+            path = self.path_for(content_hash)
+            if os.path.exists(path):
+                # We already have this blob. There's no need to store
+                # it a second time.
+                os.remove(temp_path)
+            else:
+                directory = os.path.dirname(path)
+                if not os.path.exists(directory):
+                    try:
+                        os.makedirs(directory)
+                    except OSError, e:
+                        # Another process created the directory
+                        # between our check and our makedirs().
+                        if not os.path.isdir(directory):
+                            raise
+                # rename() is atomic, so a reader will never see a
+                # partially written blob.
+                os.rename(temp_path, path)
+        except Exception, e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return content_hash, size
+
+    def open(self, content_hash):
+        """Open the blob with the given hash.
+
+        :return: A read-only, memory-mapped filehandle, or None if
+        there is no such blob.
+        """
+        path = self.path_for(content_hash)
+        if not os.path.exists(path):
+            return None
+        return self.open_mapped(path)
+
+    def get(self, content_hash):
+        """Load the blob with the given hash into memory.
+
+        Prefer `open` for blobs that might be large.
+        """
+        fh = self.open(content_hash)
+        if fh is None:
+            return None
+        try:
+            return fh.read()
+        finally:
+            fh.close()
+
+    def size(self, content_hash):
+        return os.path.getsize(self.path_for(content_hash))
+
+    def delete(self, content_hash):
+        """Remove a blob from the store.
+
+        Since blobs are shared, it's the caller's responsibility to
+        make sure nothing refers to the blob anymore.
+        """
+        path = self.path_for(content_hash)
+        if os.path.exists(path):
+            os.remove(path)
+
+    @classmethod
+    def open_mapped(cls, path):
+        """Open a file on disk as a read-only memory map.
+
+        The operating system pages the file in as it's read, so even
+        a very large file can be handed around without being loaded
+        into a Python string.
+        """
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # Empty files can't be memory-mapped.
+                return StringIO('')
+            return MappedFile(
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            )
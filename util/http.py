@@ -1,6 +1,12 @@
 from nose.tools import set_trace
+from collections import defaultdict
+import cookielib
+import logging
 import requests
+import threading
+import time
 import urlparse
+from requests.adapters import HTTPAdapter
 from flask_babel import lazy_gettext as _
 from problem_detail import ProblemDetail as pd
 
@@ -62,15 +68,19 @@ class BadResponseException(RemoteIntegrationException):
 
     BAD_STATUS_CODE_MESSAGE = "Got status code %s from external server, cannot continue."
 
-    def __init__(self, url_or_service, message, debug_message=None, status_code=None):
+    def __init__(self, url_or_service, message, debug_message=None, status_code=None,
+                 headers=None):
         """Indicate that a remote integration has failed.
         
         `param url_or_service` The name of the service that failed
            (e.g. "Overdrive"), or the specific URL that had the problem.
+        `param headers` The headers of the bad response, if any, so
+           that e.g. a Retry-After header isn't lost.
         """
         super(BadResponseException, self).__init__(url_or_service, message, debug_message)
         # to be set to 500, etc.
         self.status_code = status_code
+        self.headers = headers or {}
 
     def document_debug_message(self, debug=True):
         if debug:
@@ -91,10 +101,12 @@ class BadResponseException(RemoteIntegrationException):
             status_code, headers, content = response
         else:
             status_code = response.status_code
+            headers = response.headers
             content = response.content
         return BadResponseException(
             url, message, 
             status_code=status_code, 
+            headers=headers,
             debug_message="Status code: %s\nContent: %s" % (
                 status_code,
                 content,
@@ -132,8 +144,167 @@ class RequestTimedOut(RequestNetworkException, requests.exceptions.Timeout):
     internal_message = "Timeout accessing %s: %s"
 
 
+class HostStatistics(object):
+    """Timing information about requests made to a single host."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        # A request that failed before getting a response has no time
+        # to first byte, so those requests are counted separately.
+        self.requests_with_first_byte = 0
+        self.time_to_first_byte = 0.0
+        self.total_time = 0.0
+
+    def record(self, time_to_first_byte, total_time, error=False):
+        self.requests += 1
+        if error:
+            self.errors += 1
+        if time_to_first_byte is not None:
+            self.requests_with_first_byte += 1
+            self.time_to_first_byte += time_to_first_byte
+        self.total_time += total_time
+
+    @property
+    def average_time_to_first_byte(self):
+        if not self.requests_with_first_byte:
+            return None
+        return self.time_to_first_byte / self.requests_with_first_byte
+
+    @property
+    def average_total_time(self):
+        if not self.requests:
+            return None
+        return self.total_time / self.requests
+
+    def __repr__(self):
+        return "<HostStatistics requests=%d errors=%d avg_ttfb=%s avg_total=%s>" % (
+            self.requests, self.errors, self.average_time_to_first_byte,
+            self.average_total_time
+        )
+
+
 class HTTP(object):
-    """A helper for the `requests` module."""
+    """A helper for the `requests` module.
+
+    Requests are sent through a `requests.Session` kept for each host,
+    so that repeated requests to the same vendor reuse open
+    (keep-alive) connections instead of doing a new TCP and TLS
+    handshake every time.
+
+    Since every caller in the process shares a host's session, the
+    session never keeps cookies; one integration's or patron's cookies
+    must not be sent along with someone else's request. A caller that
+    needs cookies passes them with each request.
+    """
+
+    # The number of connections to keep open to a single host.
+    POOL_MAXSIZE = 10
+
+    # If this is True, a request for a host whose connections are all
+    # in use will wait for one to become free rather than opening an
+    # extra connection that won't be kept.
+    POOL_BLOCK = False
+
+    # Send this header with every request unless the caller overrides
+    # it.
+    DEFAULT_HEADERS = {
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive',
+    }
+
+    # Requests made to each host, keyed by (scheme, host).
+    sessions = {}
+    _sessions_lock = threading.Lock()
+
+    # Timing information about requests made to each host.
+    statistics = defaultdict(HostStatistics)
+
+    # Functions to be called after each request, with the arguments
+    # (host, time_to_first_byte, total_time, response). `response`
+    # will be None if the request raised an exception.
+    timing_hooks = []
+
+    @classmethod
+    def configure_pools(cls, pool_maxsize=None, pool_block=None):
+        """Change the size and behavior of the per-host connection pools.
+
+        Sessions that were already created are thrown away so that
+        the new settings take effect.
+        """
+        if pool_maxsize is not None:
+            cls.POOL_MAXSIZE = pool_maxsize
+        if pool_block is not None:
+            cls.POOL_BLOCK = pool_block
+        cls.close_sessions()
+
+    @classmethod
+    def session_for(cls, url):
+        """Find or create the `requests.Session` to use when making
+        a request to the given URL.
+        """
+        parsed = urlparse.urlparse(url)
+        key = (parsed.scheme, parsed.netloc)
+        session = cls.sessions.get(key)
+        if session:
+            return session
+        with cls._sessions_lock:
+            session = cls.sessions.get(key)
+            if not session:
+                session = cls._create_session()
+                cls.sessions[key] = session
+        return session
+
+    @classmethod
+    def _create_session(cls):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=cls.POOL_MAXSIZE,
+            pool_block=cls.POOL_BLOCK
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update(cls.DEFAULT_HEADERS)
+        # Allowing no domains at all means the jar rejects every cookie.
+        session.cookies.set_policy(
+            cookielib.DefaultCookiePolicy(allowed_domains=[])
+        )
+        return session
+
+    @classmethod
+    def close_sessions(cls):
+        """Close every open connection."""
+        with cls._sessions_lock:
+            for session in cls.sessions.values():
+                session.close()
+            cls.sessions = {}
+
+    @classmethod
+    def record_timing(cls, url, start, response):
+        """Note how long a request took, and pass the information on to
+        any timing hooks.
+
+        `requests` doesn't expose DNS lookup or connection time
+        separately; they're included in the time to first byte, which
+        `requests` reports as the time between sending the request and
+        parsing the response headers.
+        """
+        total_time = time.time() - start
+        time_to_first_byte = None
+        elapsed = getattr(response, 'elapsed', None)
+        if elapsed is not None:
+            time_to_first_byte = elapsed.total_seconds()
+        host = urlparse.urlparse(url).netloc or url
+        cls.statistics[host].record(
+            time_to_first_byte, total_time, error=(response is None)
+        )
+        for hook in cls.timing_hooks:
+            try:
+                hook(host, time_to_first_byte, total_time, response)
+            except Exception, e:
+                logging.error(
+                    "Error in HTTP timing hook %r", hook, exc_info=e
+                )
 
     @classmethod
     def get_with_timeout(cls, url, *args, **kwargs):
@@ -148,11 +319,12 @@ class HTTP(object):
 
     @classmethod
     def request_with_timeout(cls, http_method, url, *args, **kwargs):
-        """Call requests.request and turn a timeout into a RequestTimedOut
-        exception.
+        """Make a request over a pooled connection and turn a timeout
+        into a RequestTimedOut exception.
         """
+        session = cls.session_for(url)
         return cls._request_with_timeout(
-            url, requests.request, http_method, url, *args, **kwargs
+            url, session.request, http_method, url, *args, **kwargs
         )
 
     @classmethod
@@ -187,16 +359,20 @@ class HTTP(object):
                 new_headers[k] = v
             kwargs['headers'] = new_headers
 
+        start = time.time()
         try:
             response = m(*args, **kwargs)
         except requests.exceptions.Timeout, e:
             # Wrap the requests-specific Timeout exception 
             # in a generic RequestTimedOut exception.
+            cls.record_timing(url, start, None)
             raise RequestTimedOut(url, e.message)
         except requests.exceptions.RequestException, e:
             # Wrap all other requests-specific exceptions in
             # a generic RequestNetworkException.
+            cls.record_timing(url, start, None)
             raise RequestNetworkException(url, e.message)
+        cls.record_timing(url, start, response)
 
         return cls._process_response(
             url, response, allowed_response_codes, disallowed_response_codes
@@ -253,6 +429,7 @@ class HTTP(object):
                 url,
                 error_message % code, 
                 status_code=code,
+                headers=response.headers,
                 debug_message="Response content: %s" % response.content
             )
         return response
@@ -1,11 +1,23 @@
 from nose.tools import set_trace
 import md5
+import multiprocessing
 import re
 import struct
 import unicodedata
 
+from cache import LRUCache
+
 class WorkIDCalculator(object):
 
+    # Below this many distinct strings to normalize, starting a
+    # process pool costs more than it saves.
+    MIN_STRINGS_FOR_POOL = 1000
+
+    # Normalized titles and authors, kept between batches since the
+    # same authors come up over and over.
+    _normalized_titles = LRUCache(10000)
+    _normalized_authors = LRUCache(10000)
+
     @classmethod
     def permanent_id(self, normalized_title, normalized_author, 
                      grouping_category):
@@ -20,6 +32,60 @@ class WorkIDCalculator(object):
             permanent_id[16:20], permanent_id[20:]])
         return permanent_id
 
+    @classmethod
+    def permanent_ids(cls, items, processes=1):
+        """Calculate the permanent IDs of many books at once.
+
+        Each distinct title and author is normalized only once. If
+        `processes` is greater than 1 and there are enough strings to
+        make it worthwhile, the normalization is spread across a pool
+        of that many processes.
+
+        :param items: (title, author, grouping_category) 3-tuples.
+        :return: A list of permanent IDs in the same order, each the
+            same as permanent_id(normalize_title(title),
+            normalize_author(author), grouping_category).
+        """
+        items = list(items)
+        titles = dict()
+        authors = dict()
+        for title, author, grouping_category in items:
+            titles[title] = cls._normalized_titles.get(title)
+            authors[author] = cls._normalized_authors.get(author)
+        new_titles = [k for k, v in titles.items() if v is None]
+        new_authors = [k for k, v in authors.items() if v is None]
+
+        pool = None
+        if (processes > 1 and len(new_titles) + len(new_authors)
+            >= cls.MIN_STRINGS_FOR_POOL):
+            pool = multiprocessing.Pool(processes)
+        try:
+            for strings, function, normalized, cache in (
+                (new_titles, _normalize_title, titles,
+                 cls._normalized_titles),
+                (new_authors, _normalize_author, authors,
+                 cls._normalized_authors),
+            ):
+                if pool:
+                    chunksize = max(len(strings) / (processes * 4), 1)
+                    results = pool.map(function, strings, chunksize)
+                else:
+                    results = map(function, strings)
+                for string, result in zip(strings, results):
+                    normalized[string] = result
+                    cache.set(string, result)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        return [
+            cls.permanent_id(
+                titles[title], authors[author], grouping_category
+            )
+            for title, author, grouping_category in items
+        ]
+
     # Strings to be removed from author names.
     authorExtract1 = re.compile("^(.+?)\\spresents.*$")
     authorExtract2 = re.compile("^(?:(?:a|an)\\s)?(.+?)\\spresentation.*$")
@@ -295,3 +361,11 @@ class WorkIDCalculator(object):
             sort_title = match.groups()[0]
         sort_title = sort_title.strip()
         return sort_title
+
+
+# multiprocessing can only send module-level functions to a worker.
+def _normalize_title(title):
+    return WorkIDCalculator.normalize_title(title)
+
+def _normalize_author(author):
+    return WorkIDCalculator.normalize_author(author)
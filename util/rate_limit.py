@@ -0,0 +1,306 @@
+import email.utils
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from flask_babel import lazy_gettext as _
+
+from util.http import (
+    BadResponseException,
+    RemoteIntegrationException,
+    RequestNetworkException,
+)
+
+
+class RateLimitWaitTooLong(RemoteIntegrationException):
+    """A request would have had to wait longer than its limiter allows
+    before being sent.
+    """
+    title = _("Third-party service is throttled")
+    detail = _("The server would have had to wait too long before making a request to %(service)s.")
+    internal_message = "Rate limit wait too long for %s: %s"
+
+
+class AdaptiveRateLimiter(object):
+
+    """Pace the requests made to a single third-party integration.
+
+    This is a token bucket whose refill rate is adjusted with AIMD
+    (additive increase, multiplicative decrease): every healthy,
+    fast response nudges the rate up a little, and every sign that
+    the vendor is overloaded (a 429 or 503 response, or a network
+    failure) cuts it in half. A Retry-After header stops all requests
+    until the time it names.
+
+    On top of the rate, no more than `max_concurrency` requests are
+    allowed to be in flight at once.
+
+    A caller is never kept waiting longer than `max_wait` seconds; if
+    a request can't go out by then (say, because a vendor asked for an
+    hour's break), RateLimitWaitTooLong is raised instead.
+    """
+
+    # HTTP status codes that mean "slow down".
+    BACKOFF_STATUS_CODES = set([429, 503])
+
+    # Every integration has its own limiter, shared by every thread
+    # in the process.
+    _limiters = {}
+    _limiters_lock = threading.Lock()
+
+    log = logging.getLogger("Rate limiter")
+
+    def __init__(self, name, rate=5.0, min_rate=0.2, max_rate=50.0,
+                 burst=None, max_concurrency=4, increase=0.1,
+                 decrease_factor=0.5, latency_target=2.0, max_wait=30,
+                 clock=time.time, sleep=time.sleep):
+        """Constructor.
+
+        :param rate: Start out allowing this many requests per second.
+        :param min_rate: Never go slower than this, no matter how many
+            errors we see.
+        :param max_rate: Never go faster than this, no matter how
+            healthy the integration looks.
+        :param burst: The size of the token bucket -- how many requests
+            can be made back-to-back after a quiet period. By default,
+            one second's worth of requests at the starting rate.
+        :param increase: Add this many requests per second to the rate
+            after every healthy response.
+        :param decrease_factor: Multiply the rate by this number after
+            every response that tells us to slow down.
+        :param latency_target: A response that took longer than this
+            many seconds is not healthy enough to justify speeding up.
+        :param max_wait: Raise RateLimitWaitTooLong rather than keep a
+            caller waiting more than this many seconds for its turn.
+            None means wait as long as it takes.
+        """
+        self.name = name
+        self.rate = float(rate)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.burst = float(burst or max(1, rate))
+        self.max_concurrency = max_concurrency
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_target = latency_target
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+
+        self.tokens = self.burst
+        self.last_refill = self.clock()
+        self.blocked_until = None
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.condition = threading.Condition()
+
+    @classmethod
+    def for_integration(cls, name, *key, **kwargs):
+        """Find or create the limiter for a given integration.
+
+        :param name: The name of the integration, e.g. DataSource.OVERDRIVE.
+        :param key: Anything else that distinguishes one set of
+            credentials from another, e.g. a library ID.
+        :param kwargs: Used to configure the limiter if it has to be
+            created.
+        """
+        full_key = (name,) + key
+        limiter = cls._limiters.get(full_key)
+        if limiter:
+            return limiter
+        with cls._limiters_lock:
+            limiter = cls._limiters.get(full_key)
+            if not limiter:
+                label = "/".join(str(x) for x in full_key)
+                limiter = cls(label, **kwargs)
+                cls._limiters[full_key] = limiter
+        return limiter
+
+    @classmethod
+    def reset(cls):
+        """Forget about all limiters. Used in tests."""
+        with cls._limiters_lock:
+            cls._limiters = {}
+
+    def __repr__(self):
+        return "<AdaptiveRateLimiter %s: %.2f req/sec, %d in flight, %d waiting>" % (
+            self.name, self.rate, self.in_flight, self.queue_depth
+        )
+
+    def _refill(self, now):
+        elapsed = max(0, now - self.last_refill)
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.last_refill = now
+
+    def _wait_time(self, now):
+        """How long must a caller wait before it can make a request?
+
+        Must be called while holding self.condition.
+
+        :return: A number of seconds, or 0 if a request can be made
+            right now.
+        """
+        if self.blocked_until and now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def acquire(self, max_wait=None):
+        """Block until a request can be made, then claim the right to
+        make it.
+
+        Every successful call to acquire() must be followed by a call
+        to release().
+
+        :param max_wait: Wait no longer than this many seconds, if
+            different from the limiter's max_wait.
+        :raise RateLimitWaitTooLong: If the request couldn't be made
+            in time.
+        """
+        if max_wait is None:
+            max_wait = self.max_wait
+        deadline = None
+        if max_wait is not None:
+            deadline = self.clock() + max_wait
+        with self.condition:
+            self.queue_depth += 1
+            try:
+                while True:
+                    now = self.clock()
+                    if self.in_flight >= self.max_concurrency:
+                        if deadline is not None and now >= deadline:
+                            self._wait_too_long(max_wait)
+                        # Wait for another request to finish.
+                        self.condition.wait(1)
+                        continue
+                    wait = self._wait_time(now)
+                    if not wait:
+                        break
+                    if deadline is not None and now + wait > deadline:
+                        # Don't sleep at all if it won't be enough.
+                        self._wait_too_long(max_wait)
+                    # Sleep without holding the lock, so other threads
+                    # can report their results in the meantime.
+                    self.condition.release()
+                    try:
+                        self.sleep(wait)
+                    finally:
+                        self.condition.acquire()
+                self.tokens -= 1
+                self.in_flight += 1
+            finally:
+                self.queue_depth -= 1
+
+    def _wait_too_long(self, max_wait):
+        self.log.warn(
+            "%s: a request would wait more than %s seconds", self.name,
+            max_wait
+        )
+        raise RateLimitWaitTooLong(
+            self.name, "Would wait more than %s seconds" % max_wait
+        )
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def record(self, status_code=None, latency=None, retry_after=None,
+               failure=False):
+        """Adjust the rate based on the outcome of a request.
+
+        :param status_code: The HTTP status code of the response.
+        :param latency: How long the request took, in seconds.
+        :param retry_after: The value of the response's Retry-After
+            header, if any.
+        :param failure: True if the request failed without getting a
+            response at all.
+        """
+        with self.condition:
+            try:
+                status_code = int(status_code)
+            except (TypeError, ValueError):
+                status_code = None
+            if failure or status_code in self.BACKOFF_STATUS_CODES:
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                delay = self.parse_retry_after(retry_after)
+                if delay:
+                    self.blocked_until = self.clock() + delay
+                self.log.info(
+                    "%s: backing off to %.2f req/sec", self.name, self.rate
+                )
+            elif (status_code is not None and status_code < 500
+                  and (latency is None or latency <= self.latency_target)):
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+    @classmethod
+    def parse_retry_after(cls, value, now=None):
+        """Turn the value of a Retry-After header into a number of seconds.
+
+        The header can contain either a number of seconds or an HTTP
+        date.
+        """
+        if not value:
+            return None
+        try:
+            return max(0, float(value))
+        except ValueError:
+            pass
+        parsed = email.utils.parsedate_tz(value)
+        if not parsed:
+            return None
+        retry_at = email.utils.mktime_tz(parsed)
+        now = now or time.time()
+        return max(0, retry_at - now)
+
+    @contextmanager
+    def slot(self):
+        """A context manager that acquires and releases the right to make
+        a request.
+        """
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def call(self, f, *args, **kwargs):
+        """Call a function that makes an HTTP request, pacing it and
+        learning from its result.
+
+        The function may return a `requests` Response, or a
+        (status_code, headers, content) 3-tuple.
+        """
+        with self.slot():
+            start = self.clock()
+            try:
+                response = f(*args, **kwargs)
+            except BadResponseException, e:
+                self.record(
+                    e.status_code, self.clock() - start,
+                    self.retry_after_header(e.headers)
+                )
+                raise
+            except RequestNetworkException, e:
+                self.record(latency=self.clock() - start, failure=True)
+                raise
+            latency = self.clock() - start
+            if isinstance(response, tuple):
+                status_code, headers = response[:2]
+            else:
+                status_code = response.status_code
+                headers = response.headers
+            self.record(status_code, latency, self.retry_after_header(headers))
+            return response
+
+    @classmethod
+    def retry_after_header(cls, headers):
+        """Find the Retry-After header, if any, in a set of response
+        headers.
+        """
+        if not headers:
+            return None
+        return headers.get('retry-after') or headers.get('Retry-After')
@@ -1,6 +1,7 @@
 from nose.tools import set_trace
 from lxml import etree
 from StringIO import StringIO
+import threading
 
 class XMLParser(object):
 
@@ -8,12 +9,34 @@ class XMLParser(object):
 
     NAMESPACES = {}
 
+    # Compiled XPath expressions, keyed by the expression and the
+    # namespaces it uses. lxml's XPath objects can't safely be shared
+    # between threads, so each thread gets its own cache.
+    _compiled = threading.local()
+
+    # Forget all compiled expressions if there get to be more than this
+    # many, in case someone is generating expressions on the fly.
+    MAX_COMPILED_EXPRESSIONS = 1000
+
+    @classmethod
+    def _compile(cls, expression, namespaces):
+        """Find or create a compiled version of an XPath expression."""
+        cache = getattr(cls._compiled, 'cache', None)
+        if cache is None or len(cache) > cls.MAX_COMPILED_EXPRESSIONS:
+            cache = cls._compiled.cache = {}
+        key = (expression, tuple(sorted((namespaces or {}).items())))
+        compiled = cache.get(key)
+        if compiled is None:
+            compiled = etree.XPath(expression, namespaces=namespaces)
+            cache[key] = compiled
+        return compiled
+
     @classmethod
     def _xpath(cls, tag, expression, namespaces=None):
+        """Wrapper to do a namespaced XPath expression."""
         if not namespaces:
             namespaces = cls.NAMESPACES
-        """Wrapper to do a namespaced XPath expression."""
-        return tag.xpath(expression, namespaces=namespaces)
+        return cls._compile(expression, namespaces)(tag)
 
     @classmethod
     def _xpath1(cls, tag, expression, namespaces=None):
@@ -35,7 +58,7 @@ class XMLParser(object):
             return unicode(tag.text)
       
     def text_of_subtag(self, tag, name, namespaces=None):
-        return unicode(tag.xpath(name, namespaces=namespaces)[0].text)
+        return unicode(self._xpath(tag, name, namespaces=namespaces)[0].text)
 
     def int_of_subtag(self, tag, name, namespaces=None):
         return int(self.text_of_subtag(tag, name, namespaces=namespaces))
@@ -60,5 +83,40 @@ class XMLParser(object):
             if data:
                 yield data
 
+    def process_all_streaming(self, xml, tag, namespaces=None, handler=None):
+        """Process every element with a given tag name, as the document
+        is being parsed.
+
+        Unlike process_all(), this never builds a tree for the entire
+        document. Each element is handed to the handler as soon as it's
+        been parsed, then thrown away, so memory use stays flat no
+        matter how big the document is.
+
+        :param xml: A string or an open filehandle.
+        :param tag: The name of the tags to process, e.g. "axis:title".
+            A namespace prefix will be resolved using `namespaces`.
+        """
+        if not handler:
+            handler = self.process_one
+        if isinstance(xml, unicode):
+            xml = xml.encode("utf8")
+        if isinstance(xml, basestring):
+            xml = StringIO(xml)
+
+        if ':' in tag:
+            prefix, local_name = tag.split(':', 1)
+            tag = '{%s}%s' % (namespaces[prefix], local_name)
+
+        for event, element in etree.iterparse(xml, events=('end',), tag=tag):
+            data = handler(element, namespaces)
+
+            # Free the memory used by this element and by any
+            # elements we've already processed.
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+            if data:
+                yield data
+
     def process_one(self, tag, namespaces):
         return None